@@ -1,7 +1,33 @@
 import sys
 import os
-from flask import Flask, render_template, request, jsonify, send_from_directory
+import uuid
+import zlib
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import mimetypes
+from urllib.parse import quote
+from flask import Flask, Response, request, jsonify, abort
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.security import safe_join
 from datetime import datetime
+from server import UploadSessionStore, UploadSessionError
+from server.ranges import (plan_file_response, sendfile_socket, FileRangeStream, etag_matches, file_etag,
+                           http_date, if_range_matches, parse_range_header, RangeNotSatisfiable)
+from server.compression import (StaticCompressionCache, StreamCompressor, INCOMPRESSIBLE_CATEGORIES,
+                                MIN_COMPRESS_SIZE, compress, encoded_etag, is_compressible, negotiate)
+from server.catalog import FileCatalog, SORT_KEY_TYPES
+from server.pagination import encode_cursor, parse_page_args
+from server.events import EventBroadcaster
+from server.messages import MessageStore
+from server.blobs import BlobStore, is_digest
+from server.archive import ZipArchive, ArchiveMetaCache
+from server.previews import PreviewCache, PreviewUnavailable, can_preview, snap_width
+from server.storage import StorageManager, StorageError, parse_category_quotas
+from server.shaping import (BandwidthShaper, ShapedStream, ShapedReader, DIRECTIONS, SHAPED_ENVIRON_KEY,
+                            UPLOAD_ENVIRON_KEY)
+from server.metrics import Metrics, MetricsMiddleware, ROUTE_ENVIRON_KEY, LONG_POLLS_GAUGE
+from server.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from server.profiling import TimingMiddleware, SamplingProfiler, MemoryTracer, phase, SAMPLE_INTERVAL, MAX_SAMPLE_SECONDS
+from server.production import DETACH_ENVIRON_KEY
 
 # PyInstaller 打包支持
 if getattr(sys, 'frozen', False):
@@ -37,21 +63,79 @@ FILE_CATEGORIES = {
     'archives': ['zip', 'rar', '7z', 'tar', 'gz', 'bz2'],
     'others': []
 }
+# 扩展名 -> 分类，避免每次按分类逐个查找
+EXTENSION_CATEGORIES = {ext: category for category, extensions in FILE_CATEGORIES.items() for ext in extensions}
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500MB 最大文件
+app.config['USE_SENDFILE'] = True  # Linux 下使用 os.sendfile 零拷贝发送文件
 
-# 消息存储
-messages = []
+# 文件目录缓存
+catalog = FileCatalog(FILE_CATEGORIES)
+
+# SSE 事件广播
+events = EventBroadcaster()
+
+# JSON 接口的 ETag 前缀：进程重启后代数计数从零开始，避免与旧 ETag 误匹配
+ETAG_SALT = uuid.uuid4().hex[:8]
+
+# 静态文件与首页的预压缩缓存
+static_cache = StaticCompressionCache()
+
+# 缩略图磁盘缓存
+preview_cache = PreviewCache()
+
+# 打包下载时各文件的 CRC 与压缩后大小，用于计算归档大小和续传
+archive_cache = ArchiveMetaCache()
+
+# 内容寻址存储：相同内容的文件只保存一份；去重得到的硬链接按记录的上传时间排序
+blobs = BlobStore()
+catalog.set_mtime_source(blobs.link_time)
+
+# 上传下载限速（全局与每个客户端 IP），聊天、列表等普通请求不受影响
+shaper = BandwidthShaper()
+LOOPBACK_ADDRS = ('127.0.0.1', '::1')
+
+# 分块上传会话
+upload_sessions = UploadSessionStore(os.path.join(UPLOAD_FOLDER, '.sessions'))
+
+# 消息存储（作为服务运行时在上传目录下写追加日志，重启后恢复历史；设为 None 则只保存在内存中）
 MAX_MESSAGES = 100
+MAX_MESSAGE_WAIT = 30  # 长轮询最长等待秒数
+MESSAGE_JOURNAL_NAME = '.messages.jsonl'
+messages = MessageStore(MAX_MESSAGES)
+messages.add_listener(lambda message: events.publish('chat', message))
+
+# /metrics 指标：请求计数与耗时在各线程中记录，抓取时合并；目录、消息与传输状态在抓取时读取
+metrics = Metrics()
+metrics.describe('lan_transfer_http_requests_total', 'counter', 'HTTP requests by route, method and status')
+metrics.describe('lan_transfer_http_request_duration_seconds', 'histogram',
+                 'Time until response headers are ready, by route')
+metrics.describe('lan_transfer_transferred_bytes_total', 'counter', 'File bytes uploaded and downloaded by category')
+metrics.describe('lan_transfer_active_transfers', 'gauge', 'Uploads and downloads in progress')
+metrics.describe(LONG_POLLS_GAUGE, 'gauge', 'Message long-polls waiting for new messages')
+metrics.describe('lan_transfer_messages_total', 'counter', 'Chat messages sent since start')
+metrics.describe('lan_transfer_messages_stored', 'gauge', 'Chat messages kept in history')
+metrics.describe('lan_transfer_catalog_files', 'gauge', 'Files per category')
+metrics.describe('lan_transfer_catalog_bytes', 'gauge', 'Bytes stored per category')
+messages.add_listener(lambda message: metrics.inc('lan_transfer_messages_total'))
+
+# 性能分析（默认全部关闭）：慢请求分阶段计时、采样分析与 tracemalloc 快照，通过 /api/admin/profile 开关
+sampler = SamplingProfiler()
+memory_tracer = MemoryTracer()
+
+
+def init_storage(upload_folder):
+    """切换上传目录，需在处理请求之前调用"""
+    app.config['UPLOAD_FOLDER'] = upload_folder
+    upload_sessions.root = os.path.join(upload_folder, '.sessions')
+    if MESSAGE_JOURNAL_NAME:
+        messages.open_journal(os.path.join(upload_folder, MESSAGE_JOURNAL_NAME))
 
 
 def get_category(filename):
     ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
-    for category, extensions in FILE_CATEGORIES.items():
-        if ext in extensions:
-            return category
-    return 'others'
+    return EXTENSION_CATEGORIES.get(ext, 'others')
 
 
 def allowed_file(filename):
@@ -71,41 +155,349 @@ def format_time(timestamp):
 
 
 def get_file_info(filepath, filename):
-    stat = os.stat(filepath)
+    with phase('stat'):
+        stat = os.stat(filepath)
     return {
         'name': filename,
         'size': format_size(stat.st_size),
-        'timestamp': datetime.fromtimestamp(stat.st_mtime).isoformat(),
+        'timestamp': datetime.fromtimestamp(blobs.link_time(get_category(filename), filename, stat)).isoformat(),
         'category': get_category(filename)
     }
 
 
+def entry_info(entry):
+    info = {
+        'name': entry.name,
+        'size': format_size(entry.size),
+        'timestamp': datetime.fromtimestamp(entry.mtime).isoformat(),
+        'category': entry.category
+    }
+    if can_preview(entry.category):
+        info['preview'] = True
+    return info
+
+
+def get_catalog():
+    # 目录缓存的时间来自 blob 索引，须先加载
+    get_blobs()
+    catalog.ensure_started(app.config['UPLOAD_FOLDER'])
+    return catalog
+
+
+def get_blobs():
+    blobs.ensure_started(os.path.join(app.config['UPLOAD_FOLDER'], '.blobs'))
+    return blobs
+
+
+def get_storage():
+    storage.ensure_started(get_catalog().root)
+    return storage
+
+
+def evict_file(category, name):
+    get_blobs().release(os.path.join(app.config['UPLOAD_FOLDER'], category, name))
+    get_catalog().remove(category, name)
+
+
+# 存储配额与淘汰（默认不限额、不淘汰，只保留最低磁盘剩余空间）
+storage = StorageManager(catalog, evict_file)
+
+
+def check_storage(category, size):
+    """上传前检查空间，未完成的分块上传会话按声明的大小预留"""
+    pending = {}
+    unwritten = 0
+    for session in upload_sessions.pending():
+        session_category = get_category(session.filename)
+        pending[session_category] = pending.get(session_category, 0) + session.size
+        unwritten += session.size - session.received_bytes()
+    get_storage().check(category, size, pending, unwritten)
+
+
+def get_previews():
+    preview_cache.ensure_started(os.path.join(app.config['UPLOAD_FOLDER'], '.previews'))
+    return preview_cache
+
+
+def stats_payload():
+    counts, sizes = get_catalog().stats()
+    return {
+        'stats': counts,
+        'total_files': sum(counts.values()),
+        'total_size': format_size(sum(sizes.values())),
+        'storage': get_storage().stats()
+    }
+
+
+def on_catalog_change(action, entry, old=None):
+    # 上传、删除以及目录外的文件变化统一由目录缓存触发推送
+    preview_cache.forget(os.path.join(app.config['UPLOAD_FOLDER'], entry.category, entry.name))
+    if action == 'remove':
+        storage.forget(entry.category, entry.name)
+        events.publish('file', {'action': 'delete', 'category': entry.category, 'name': entry.name})
+        delta = {'category': entry.category, 'files': -1, 'size': -entry.size}
+    else:
+        events.publish('file', {'action': 'upload' if action == 'add' else 'update', 'file': entry_info(entry)})
+        delta = {
+            'category': entry.category,
+            'files': 1 if action == 'add' else 0,
+            'size': entry.size - (old.size if old else 0)
+        }
+    payload = stats_payload()
+    payload['delta'] = delta
+    events.publish('stats', payload)
+
+
+catalog.add_listener(on_catalog_change)
+
+
+def get_category_folder(category):
+    folder = os.path.join(app.config['UPLOAD_FOLDER'], category)
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    return folder
+
+
+def get_unique_filepath(folder, filename):
+    filepath = os.path.join(folder, filename)
+    # 如果文件已存在，添加时间戳
+    if os.path.exists(filepath):
+        name, ext = os.path.splitext(filename)
+        filename = f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}{ext}"
+        filepath = os.path.join(folder, filename)
+    return filepath, filename
+
+
+def finish_upload(category, filepath, filename, original):
+    """登记上传完成的文件；哈希在后台计算，之后纳入内容寻址存储"""
+    get_catalog().add(category, filename)
+    get_blobs().adopt_later(filepath, lambda digest: on_adopted(category, filepath, filename, original, digest))
+    return get_file_info(filepath, filename)
+
+
+def on_adopted(category, filepath, filename, original, digest):
+    if not digest:
+        return
+    # 与同名文件内容相同时删除新文件、保留已有文件；否则文件可能已替换为硬链接，刷新目录缓存
+    existing = os.path.join(os.path.dirname(filepath), original)
+    if filename != original and blobs.same_content(digest, existing):
+        try:
+            blobs.release(filepath)
+        except OSError:
+            pass
+        get_catalog().remove(category, filename)
+    else:
+        get_catalog().add(category, filename)
+
+
+def content_disposition(filename):
+    ascii_name = filename.encode('ascii', 'ignore').decode('ascii').replace('"', '') or 'download'
+    return "attachment; filename=\"{}\"; filename*=UTF-8''{}".format(ascii_name, quote(filename))
+
+
+def api_etag(kind, generation):
+    # 内容由数据代数与查询参数唯一决定
+    return '"{}-{}{:x}-{:x}"'.format(ETAG_SALT, kind, generation, zlib.crc32(request.query_string))
+
+
+def conditional_json(etag, build):
+    """If-None-Match 命中时直接返回 304，不构建响应体"""
+    if_none_match = request.headers.get('If-None-Match')
+    encoding = negotiate(request.headers.get('Accept-Encoding'))
+    if etag_matches(if_none_match, etag) or (encoding and etag_matches(if_none_match, encoded_etag(etag, encoding))):
+        response = Response(status=304)
+    else:
+        response = jsonify(build())
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def send_precompressed(folder, filename):
+    """发送静态文件，客户端支持时返回缓存的压缩版本"""
+    path = safe_join(folder, filename)
+    with phase('stat'):
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        stat = os.stat(path)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding = negotiate(request.headers.get('Accept-Encoding')) if is_compressible(content_type) else None
+    data = static_cache.get(path, encoding, stat) if encoding else None
+    etag = file_etag(stat)
+    if data is not None:
+        etag = encoded_etag(etag, encoding)
+
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        response = Response(status=304)
+    elif data is not None:
+        response = Response(data, mimetype=content_type)
+        response.headers['Content-Encoding'] = encoding
+    else:
+        with phase('read'), open(path, 'rb') as f:
+            response = Response(f.read(), mimetype=content_type)
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(stat.st_mtime)
+    response.headers['Cache-Control'] = 'no-cache'
+    if is_compressible(content_type):
+        response.vary.add('Accept-Encoding')
+    return response
+
+
+def serve_static(filename):
+    return send_precompressed(app.static_folder, filename)
+
+
+app.view_functions['static'] = serve_static
+
+
+def open_transfer(direction, category=None, name='', size=None, offset=0):
+    transfer = shaper.open(request.remote_addr, direction, category, name)
+    transfer.size = size
+    transfer.offset = offset
+    return transfer
+
+
+def shape_upload(category=None, name='', size=None, offset=0):
+    """按限速读取请求体，需在访问 request.stream / request.files 之前调用；返回对应的 Transfer"""
+    # asyncio 后端在接收请求体时已经限速
+    if request.environ.get(SHAPED_ENVIRON_KEY):
+        transfer = request.environ[UPLOAD_ENVIRON_KEY]
+        transfer.category = category
+        transfer.name = name
+        transfer.size = size
+        transfer.offset = offset
+        return transfer
+    transfer = open_transfer('up', category, name, size, offset)
+    request.environ['wsgi.input'] = ShapedReader(request.environ['wsgi.input'], transfer)
+    request.environ[UPLOAD_ENVIRON_KEY] = transfer
+    return transfer
+
+
+@app.teardown_request
+def finish_upload_transfer(exc=None):
+    transfer = request.environ.get(UPLOAD_ENVIRON_KEY)
+    if transfer is not None:
+        transfer.close()
+
+
+@app.before_request
+def record_route():
+    # 指标按路由规则而不是实际路径分组；只解析一次代理对象，每次经过 LocalProxy 都有可观的开销
+    req = request._get_current_object()
+    rule = req.url_rule
+    req.environ[ROUTE_ENVIRON_KEY] = rule.rule if rule is not None else None
+
+
+def collect_metrics():
+    counts, sizes = get_catalog().stats()
+    for category in FILE_CATEGORIES:
+        labels = (('category', category),)
+        yield 'lan_transfer_catalog_files', labels, counts.get(category, 0)
+        yield 'lan_transfer_catalog_bytes', labels, sizes.get(category, 0)
+    yield 'lan_transfer_messages_stored', (), len(messages)
+    active = shaper.stats()['active']
+    for direction in DIRECTIONS:
+        yield 'lan_transfer_active_transfers', (('direction', direction),), active[direction]
+    for (direction, category), total in shaper.category_bytes().items():
+        labels = (('direction', direction), ('category', category or 'unknown'))
+        yield 'lan_transfer_transferred_bytes_total', labels, total
+
+
+metrics.add_collector(collect_metrics)
+app.wsgi_app = request_timing = TimingMiddleware(MetricsMiddleware(app.wsgi_app, metrics))
+
+
+class ProfiledJSONProvider(DefaultJSONProvider):
+    """开启请求计时后替换 app.json，JSON 编解码计入 serialize 阶段"""
+
+    def dumps(self, obj, **kwargs):
+        with phase('serialize'):
+            return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        with phase('serialize'):
+            return super().loads(s, **kwargs)
+
+
+def configure_request_timing(slow_ms):
+    """设置慢请求阈值（毫秒），0 为关闭；首次开启时才替换 JSON 编解码器，从未开启时没有任何额外开销"""
+    request_timing.configure(slow_ms / 1000)
+    if request_timing.slow_seconds and not isinstance(app.json, ProfiledJSONProvider):
+        app.json = ProfiledJSONProvider(app)
+
+
+@app.after_request
+def compress_response(response):
+    # JSON 等动态文本响应按需压缩；流式响应与文件下载自行处理
+    if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+            or 'Content-Encoding' in response.headers or not is_compressible(response.mimetype)):
+        return response
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    encoding = negotiate(request.headers.get('Accept-Encoding'))
+    if encoding is None or len(data) < MIN_COMPRESS_SIZE:
+        return response
+    compressed = compress(data, encoding)
+    if len(compressed) >= len(data):
+        return response
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    if response.headers.get('ETag'):
+        response.headers['ETag'] = encoded_etag(response.headers['ETag'], encoding)
+    return response
+
+
 @app.route('/')
 def index():
-    return render_template('index.html')
+    # 首页模板不含模板变量，按静态文件发送以便复用预压缩结果
+    return send_precompressed(app.template_folder, 'index.html')
 
 
 @app.route('/api/files/<category>')
 def list_files(category):
-    if category not in FILE_CATEGORIES:
+    if category != 'all' and category not in FILE_CATEGORIES:
         return jsonify({'error': 'Invalid category'}), 400
 
-    folder = os.path.join(app.config['UPLOAD_FOLDER'], category)
-    if not os.path.exists(folder):
-        os.makedirs(folder)
+    try:
+        sort, order, limit, after = parse_page_args(request.args, SORT_KEY_TYPES, (str,) if category == 'all' else ())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-    files = []
-    for filename in os.listdir(folder):
-        filepath = os.path.join(folder, filename)
-        if os.path.isfile(filepath):
-            files.append(get_file_info(filepath, filename))
+    with phase('stat'):
+        files_catalog = get_catalog()
+    if category == 'all':
+        # 全部分类：服务端归并各分类的有序列表，可用 categories= 过滤
+        categories = [c for c in request.args.get('categories', '').split(',') if c] or list(FILE_CATEGORIES)
+        if any(c not in FILE_CATEGORIES for c in categories):
+            return jsonify({'error': 'Invalid category'}), 400
+
+    def build():
+        if category == 'all':
+            entries, next_key = files_catalog.merged_page(categories, sort, order == 'desc', limit, after)
+            total = sum(files_catalog.count(c) for c in categories)
+        else:
+            entries, next_key = files_catalog.page(category, sort, order == 'desc', limit, after)
+            total = files_catalog.count(category)
+        return {
+            'files': [entry_info(entry) for entry in entries],
+            'category': category,
+            'total': total,
+            'next_cursor': encode_cursor(sort, order, next_key) if next_key else None
+        }
 
-    files.sort(key=lambda x: x['timestamp'], reverse=True)
-    return jsonify({'files': files, 'category': category})
+    return conditional_json(api_etag('f' + category, files_catalog.generation), build)
 
 
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
+    # 在解析请求体之前按声明的长度检查，避免写到一半磁盘已满
+    try:
+        check_storage(None, request.content_length or 0)
+    except StorageError as e:
+        return jsonify({'error': e.message}), e.status
+    # 表单解析完之前不知道文件名，传输列表中先只显示大小
+    transfer = shape_upload(size=request.content_length)
+
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
 
@@ -115,35 +507,312 @@ def upload_file():
 
     if file and allowed_file(file.filename):
         category = get_category(file.filename)
-        folder = os.path.join(app.config['UPLOAD_FOLDER'], category)
-        if not os.path.exists(folder):
-            os.makedirs(folder)
-
-        filename = file.filename
-        filepath = os.path.join(folder, filename)
+        transfer.category = category
+        transfer.name = os.path.basename(file.filename)
+        try:
+            check_storage(category, request.content_length or 0)
+        except StorageError as e:
+            return jsonify({'error': e.message}), e.status
+        folder = get_category_folder(category)
+        original = os.path.basename(file.filename)
+        filepath, filename = get_unique_filepath(folder, original)
 
-        # 如果文件已存在，添加时间戳
-        if os.path.exists(filepath):
-            name, ext = os.path.splitext(filename)
-            filename = f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}{ext}"
-            filepath = os.path.join(folder, filename)
-
-        file.save(filepath)
+        with phase('write'):
+            file.save(filepath)
         return jsonify({
             'success': True,
-            'file': get_file_info(filepath, filename)
+            'file': finish_upload(category, filepath, filename, original)
         })
 
     return jsonify({'error': 'File type not allowed'}), 400
 
 
+# 分块上传API：创建会话 -> 按序号上传分块 -> 查询已接收分块 -> 提交
+@app.route('/api/uploads', methods=['POST'])
+def create_upload_session():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not data.get('filename'):
+        return jsonify({'error': 'No file selected'}), 400
+
+    filename = os.path.basename(str(data['filename']))
+    if not allowed_file(filename):
+        return jsonify({'error': 'File type not allowed'}), 400
+
+    digest = str(data.get('sha256') or '').lower()
+    if is_digest(digest):
+        # 服务端已有相同内容时直接创建文件，跳过传输
+        stat = get_blobs().stat(digest)
+        if stat is not None and str(stat.st_size) == str(data.get('size')):
+            return jsonify({'success': True, 'deduplicated': True, 'file': link_blob(digest, filename)})
+
+    try:
+        size = int(data.get('size', -1))
+        chunk_size = int(data.get('chunk_size') or 0)
+        fingerprint = str(data.get('fingerprint', ''))[:200]
+        # 续传已有会话时空间已经预留
+        resuming = fingerprint and any(s.fingerprint == fingerprint and s.filename == filename and s.size == size
+                                       for s in upload_sessions.pending())
+        if not resuming:
+            check_storage(get_category(filename), max(size, 0))
+        session = upload_sessions.create(filename, size, chunk_size, fingerprint)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid size'}), 400
+    except (UploadSessionError, StorageError) as e:
+        return jsonify({'error': e.message}), e.status
+
+    return jsonify({'success': True, 'session': session.to_dict()})
+
+
+def link_blob(digest, original):
+    category = get_category(original)
+    folder = get_category_folder(category)
+    existing = os.path.join(folder, original)
+    if blobs.same_content(digest, existing):
+        filepath, filename = existing, original
+    else:
+        filepath, filename = get_unique_filepath(folder, original)
+        blobs.link(digest, filepath)
+        get_catalog().add(category, filename)
+    info = get_file_info(filepath, filename)
+    info['sha256'] = digest
+    return info
+
+
+# 上传前检查：HEAD 或 GET /api/blobs/<sha256>，存在时返回 200 与大小
+@app.route('/api/blobs/<digest>')
+def get_blob(digest):
+    stat = get_blobs().stat(digest.lower())
+    if stat is None:
+        return jsonify({'error': 'Blob not found'}), 404
+    return jsonify({'success': True, 'sha256': digest.lower(), 'size': stat.st_size})
+
+
+@app.route('/api/uploads/<session_id>')
+def get_upload_session(session_id):
+    try:
+        session = upload_sessions.get(session_id)
+    except UploadSessionError as e:
+        return jsonify({'error': e.message}), e.status
+    return jsonify({'success': True, 'session': session.to_dict()})
+
+
+@app.route('/api/uploads/<session_id>/chunks/<int:index>', methods=['PUT'])
+def upload_chunk(session_id, index):
+    if request.content_length is None:
+        return jsonify({'error': 'Content-Length required'}), 411
+    try:
+        # 分块上传的每个分块是一次传输，进度按整个文件显示
+        session = upload_sessions.get(session_id)
+        shape_upload(get_category(session.filename), session.filename, session.size, session.received_bytes())
+        # 从请求体读取的时间计入 read，其余为写入磁盘
+        with phase('write'):
+            session = upload_sessions.write_chunk(session_id, index, request.stream, request.content_length)
+    except UploadSessionError as e:
+        return jsonify({'error': e.message}), e.status
+    return jsonify({'success': True, 'index': index, 'received_bytes': session.received_bytes()})
+
+
+@app.route('/api/uploads/<session_id>/commit', methods=['POST'])
+def commit_upload_session(session_id):
+    try:
+        session = upload_sessions.get(session_id)
+        category = get_category(session.filename)
+        folder = get_category_folder(category)
+        filepath, filename = get_unique_filepath(folder, session.filename)
+        with phase('write'):
+            upload_sessions.commit(session_id, filepath)
+    except UploadSessionError as e:
+        return jsonify({'error': e.message}), e.status
+    return jsonify({
+        'success': True,
+        'file': finish_upload(category, filepath, filename, session.filename)
+    })
+
+
+@app.route('/api/uploads/<session_id>', methods=['DELETE'])
+def abort_upload_session(session_id):
+    try:
+        upload_sessions.abort(session_id)
+    except UploadSessionError as e:
+        return jsonify({'error': e.message}), e.status
+    return jsonify({'success': True})
+
+
 @app.route('/api/download/<category>/<filename>')
 def download_file(category, filename):
     if category not in FILE_CATEGORIES:
         return jsonify({'error': 'Invalid category'}), 400
 
     folder = os.path.join(app.config['UPLOAD_FOLDER'], category)
-    return send_from_directory(folder, filename, as_attachment=True)
+    filepath = safe_join(folder, filename)
+    with phase('stat'):
+        if filepath is None or not os.path.isfile(filepath):
+            return jsonify({'error': 'File not found'}), 404
+        stat = os.stat(filepath)
+
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    get_storage().touch(category, filename)
+
+    # 文本类文件完整下载时流式压缩；图片、视频等本身已压缩的分类跳过
+    compressible = (category not in INCOMPRESSIBLE_CATEGORIES and is_compressible(content_type)
+                    and stat.st_size >= MIN_COMPRESS_SIZE)
+    encoding = negotiate(request.headers.get('Accept-Encoding')) if compressible else None
+    if encoding and not request.headers.get('Range'):
+        return send_compressed_file(filepath, filename, stat, content_type, encoding, category)
+
+    plan = plan_file_response(
+        stat, content_type,
+        range_header=request.headers.get('Range'),
+        if_range=request.headers.get('If-Range'),
+        if_none_match=request.headers.get('If-None-Match'),
+    )
+
+    sock = sendfile_socket(request.environ) if app.config['USE_SENDFILE'] else None
+    body = []
+    if plan.segments:
+        ranges = [segment for segment in plan.segments if not isinstance(segment, bytes)]
+        # 单个区间（续传）按文件位置显示进度，多区间按总字节数
+        offset, size = (ranges[0][0], sum(ranges[0])) if len(ranges) == 1 else (0, sum(c for _, c in ranges))
+        transfer = open_transfer('down', category, filename, size, offset)
+        body = FileRangeStream(filepath, plan.segments, sock, transfer=transfer)
+    response = Response(body, status=plan.status, headers=plan.headers, direct_passthrough=True)
+    if plan.status in (200, 206):
+        response.headers['Content-Disposition'] = content_disposition(filename)
+    if compressible:
+        response.vary.add('Accept-Encoding')
+    return response
+
+
+def send_compressed_file(filepath, filename, stat, content_type, encoding, category=None):
+    etag = encoded_etag(file_etag(stat), encoding)
+    headers = [
+        ('ETag', etag),
+        ('Last-Modified', http_date(stat.st_mtime)),
+        ('Vary', 'Accept-Encoding'),
+    ]
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        return Response(status=304, headers=headers)
+
+    stream = FileRangeStream(filepath, [(0, stat.st_size)])
+    body = ShapedStream(StreamCompressor(encoding).wrap(stream), open_transfer('down', category, filename))
+    response = Response(body, content_type=content_type, headers=headers, direct_passthrough=True)
+    response.headers['Content-Encoding'] = encoding
+    response.headers['Content-Disposition'] = content_disposition(filename)
+    return response
+
+
+# 缩略图：图片与视频封面（需要 Pillow 或 ffmpeg），按内容缓存在磁盘上
+@app.route('/api/preview/<category>/<filename>')
+def preview_file(category, filename):
+    if category not in FILE_CATEGORIES:
+        return jsonify({'error': 'Invalid category'}), 400
+    if not can_preview(category):
+        return jsonify({'error': 'Preview not available'}), 404
+
+    filepath = safe_join(os.path.join(app.config['UPLOAD_FOLDER'], category), filename)
+    with phase('stat'):
+        if filepath is None or not os.path.isfile(filepath):
+            return jsonify({'error': 'File not found'}), 404
+    try:
+        width = snap_width(int(request.args.get('w', 128)))
+    except ValueError:
+        return jsonify({'error': 'Invalid width'}), 400
+
+    with phase('stat'):
+        stat = os.stat(filepath)
+    key = PreviewCache.key_for(stat, get_blobs().digest_of(stat))
+    # 客户端在 URL 中带上文件时间戳，内容变化时 URL 随之变化，可以长期缓存
+    headers = [('ETag', '"p{}-{}"'.format(key[:16], width)), ('Cache-Control', 'private, max-age=86400')]
+    if etag_matches(request.headers.get('If-None-Match'), headers[0][1]):
+        return Response(status=304, headers=headers)
+
+    try:
+        with phase('read'):
+            path = get_previews().get(key, width, filepath, category)
+            with open(path, 'rb') as f:
+                data = f.read()
+    except (PreviewUnavailable, OSError):
+        return jsonify({'error': 'Preview not available'}), 404
+    except FutureTimeoutError:
+        return jsonify({'error': 'Preview not ready'}), 503, {'Retry-After': '1'}
+    return Response(data, mimetype='image/jpeg', headers=headers)
+
+
+# 打包下载：?category=<分类|all> 或重复的 ?file=<分类>/<文件名>，即时生成 ZIP，不写临时文件
+@app.route('/api/archive')
+def download_archive():
+    category = request.args.get('category')
+    files = request.args.getlist('file')
+    if category:
+        if category != 'all' and category not in FILE_CATEGORIES:
+            return jsonify({'error': 'Invalid category'}), 400
+        categories = list(FILE_CATEGORIES) if category == 'all' else [category]
+        items = [(c, e.name) for c in categories for e in get_catalog().list(c, sort='name', reverse=False)]
+        archive_name = category + '.zip'
+    elif files:
+        items = [tuple(f.split('/', 1)) for f in files]
+        if any(len(item) != 2 or item[0] not in FILE_CATEGORIES for item in items):
+            return jsonify({'error': 'Invalid category'}), 400
+        categories = {c for c, _ in items}
+        archive_name = 'files.zip'
+    else:
+        return jsonify({'error': 'No file selected'}), 400
+
+    archive = ZipArchive(archive_cache)
+    for file_category, name in items:
+        filepath = safe_join(os.path.join(app.config['UPLOAD_FOLDER'], file_category), name)
+        try:
+            with phase('stat'):
+                stat = os.stat(filepath) if filepath else None
+        except OSError:
+            stat = None
+        if stat is None:
+            if files:
+                return jsonify({'error': 'File not found'}), 404
+            continue
+        # 与单文件下载相同：图片、视频等本身已压缩的内容只存储不压缩
+        compress = (file_category not in INCOMPRESSIBLE_CATEGORIES
+                    and is_compressible(mimetypes.guess_type(name)[0]))
+        arcname = name if len(categories) == 1 else file_category + '/' + name
+        archive.add(arcname, filepath, stat, compress)
+        get_storage().touch(file_category, name)
+
+    etag = archive.etag
+    headers = [
+        ('Accept-Ranges', 'bytes'),
+        ('ETag', etag),
+        ('Last-Modified', http_date(archive.mtime)),
+        ('Content-Disposition', content_disposition(archive_name)),
+    ]
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        return Response(status=304, headers=headers)
+
+    # 输出是确定的，续传时只需重新生成并跳过前面的字节；未缓存的压缩条目需要先计算一遍大小
+    status, body, offset, size = 200, None, 0, None
+    range_header = request.headers.get('Range')
+    if range_header and if_range_matches(request.headers.get('If-Range'), etag):
+        with phase('read'):
+            archive.resolve()
+        size = archive.size()
+        try:
+            ranges = parse_range_header(range_header, size)
+        except RangeNotSatisfiable:
+            headers.append(('Content-Range', 'bytes */{}'.format(size)))
+            return Response(status=416, headers=headers)
+        if ranges and len(ranges) == 1:
+            start, end = ranges[0]
+            headers.append(('Content-Range', 'bytes {}-{}/{}'.format(start, end, size)))
+            status, body, offset, size = 206, archive.stream(start, end + 1), start, end + 1
+            headers.append(('Content-Length', str(end - start + 1)))
+    if body is None:
+        body = archive.stream()
+        if archive.sized:
+            size = archive.size()
+            headers.append(('Content-Length', str(size)))
+    if not category:
+        category = next(iter(categories)) if len(categories) == 1 else 'all'
+    body = ShapedStream(body, open_transfer('down', category, archive_name, size, offset))
+    return Response(body, status=status, headers=headers, content_type='application/zip', direct_passthrough=True)
 
 
 @app.route('/api/delete/<category>/<filename>', methods=['DELETE'])
@@ -155,16 +824,47 @@ def delete_file(category, filename):
     filepath = os.path.join(folder, filename)
 
     if os.path.exists(filepath):
-        os.remove(filepath)
+        get_blobs().release(filepath)
+        get_catalog().remove(category, filename)
         return jsonify({'success': True})
 
     return jsonify({'error': 'File not found'}), 404
 
 
+def detach_worker():
+    """线程池后端：长时间挂起的请求让出工作线程；长连接已达上限时返回 False"""
+    detach = request.environ.get(DETACH_ENVIRON_KEY)
+    return detach() if detach else True
+
+
 # 消息相关API
 @app.route('/api/messages')
 def get_messages():
-    return jsonify({'messages': messages[-50:]})  # 返回最近50条
+    since = request.args.get('since', type=int)
+    if since is None:
+        with messages.cond:
+            return conditional_json(api_etag('m', messages.last_id),
+                                    lambda: {'messages': messages.recent(50), 'last_id': messages.last_id})  # 返回最近50条
+
+    # 长轮询：没有比 since 更新的消息时，等待新消息或超时
+    wait = max(0.0, min(request.args.get('wait', 0, type=float), MAX_MESSAGE_WAIT))
+    if since > messages.last_id:
+        # 客户端的游标来自重启前的服务端，返回最近消息让客户端重置
+        with messages.cond:
+            return conditional_json(api_etag('m', messages.last_id), lambda: {
+                'messages': messages.recent(50), 'last_id': messages.last_id, 'reset': True})
+    if wait > 0 and since == messages.last_id and not detach_worker():
+        wait = 0
+    if wait > 0:
+        metrics.inc(LONG_POLLS_GAUGE)
+        try:
+            messages.wait_for(since, wait)
+        finally:
+            metrics.inc(LONG_POLLS_GAUGE, value=-1)
+    # 超时仍无新消息时 ETag 与上次相同，客户端收到 304
+    with messages.cond:
+        return conditional_json(api_etag('m', messages.last_id),
+                                lambda: {'messages': messages.after(since, 50), 'last_id': messages.last_id})
 
 
 @app.route('/api/messages', methods=['POST'])
@@ -178,48 +878,173 @@ def send_message():
         return jsonify({'error': 'Empty message'}), 400
 
     sender = data.get('sender', 'Anonymous')
-    message = {
-        'id': len(messages) + 1,
-        'sender': sender[:20],
-        'content': content[:500],
-        'timestamp': datetime.now().isoformat()
-    }
-
-    messages.append(message)
-    if len(messages) > MAX_MESSAGES:
-        messages.pop(0)
+    message = messages.append(sender[:20], content[:500])
 
     return jsonify({'success': True, 'message': message})
 
 
 @app.route('/api/stats')
 def get_stats():
-    stats = {}
-    total_size = 0
-    total_files = 0
+    return conditional_json(api_etag('s', get_catalog().generation), stats_payload)
 
-    for category in FILE_CATEGORIES:
-        folder = os.path.join(app.config['UPLOAD_FOLDER'], category)
-        if os.path.exists(folder):
-            files = [f for f in os.listdir(folder) if os.path.isfile(os.path.join(folder, f))]
-            stats[category] = len(files)
-            total_files += len(files)
-            for f in files:
-                total_size += os.path.getsize(os.path.join(folder, f))
 
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+# 进行中的上传与下载：客户端、文件、进度、瞬时与平均速率、预计剩余时间
+@app.route('/api/transfers')
+def list_transfers():
+    transfers = shaper.transfers()
+    return jsonify({
+        'transfers': transfers,
+        'active': {direction: sum(1 for t in transfers if t['direction'] == direction) for direction in DIRECTIONS},
+        'rate': {direction: sum(t['rate'] for t in transfers if t['direction'] == direction)
+                 for direction in DIRECTIONS},
+    })
+
+
+# 运行时调整限速：PUT {"limits": {"down": 字节/秒, "up": ...}, "client_limits": {...}, "weights": {"IP": 权重}}
+# 本机可直接访问，其他地址需在 X-Admin-Token 头中提供配置的 admin_token
+def is_admin():
+    token = app.config.get('ADMIN_TOKEN')
+    return request.remote_addr in LOOPBACK_ADDRS or bool(token and request.headers.get('X-Admin-Token') == token)
+
+
+@app.route('/api/admin/bandwidth', methods=['GET', 'PUT'])
+def bandwidth_settings():
+    if not is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+    if request.method == 'PUT':
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Invalid settings'}), 400
+        try:
+            shaper.configure(data.get('limits'), data.get('client_limits'), data.get('weights'))
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+    return jsonify({'success': True, 'bandwidth': shaper.stats()})
+
+
+# 性能分析：PUT {"slow_request_ms": 毫秒} 开启慢请求日志（0 关闭），GET 返回最近的慢请求与各分析器状态
+@app.route('/api/admin/profile', methods=['GET', 'PUT'])
+def profile_settings():
+    if not is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+    if request.method == 'PUT':
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Invalid settings'}), 400
+        try:
+            configure_request_timing(float(data.get('slow_request_ms', 0)))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid slow_request_ms'}), 400
     return jsonify({
-        'stats': stats,
-        'total_files': total_files,
-        'total_size': format_size(total_size)
+        'success': True,
+        'slow_request_ms': request_timing.slow_seconds * 1000,
+        'slow_requests_total': request_timing.slow_total,
+        'slow_requests': request_timing.recent(),
+        'sampler': sampler.status(),
+        'memory': memory_tracer.status(),
     })
 
 
+# 采样分析：POST {"interval_ms": 5, "seconds": 60} 开始，DELETE 停止，GET 下载折叠栈（?idle=1 包含空闲线程）
+@app.route('/api/admin/profile/sampler', methods=['GET', 'POST', 'DELETE'])
+def profile_sampler():
+    if not is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+    if request.method == 'GET':
+        return Response(sampler.collapsed(request.args.get('idle') == '1'), mimetype='text/plain', headers={
+            'Content-Disposition': content_disposition('lan_transfer.collapsed')})
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            interval = float(data.get('interval_ms', SAMPLE_INTERVAL * 1000)) / 1000
+            seconds = min(float(data.get('seconds', MAX_SAMPLE_SECONDS)), MAX_SAMPLE_SECONDS)
+        except (TypeError, ValueError, AttributeError):
+            return jsonify({'error': 'Invalid settings'}), 400
+        if interval < 0.001 or seconds <= 0:
+            return jsonify({'error': 'Invalid settings'}), 400
+        if not sampler.start(interval, seconds):
+            return jsonify({'error': 'Sampler already running'}), 409
+    else:
+        sampler.stop()
+    return jsonify({'success': True, 'sampler': sampler.status()})
+
+
+# 内存快照：POST 拍一次快照（首次开始 tracemalloc 跟踪）并返回与上一次的差异，
+# GET ?from=<id>&to=<id> 比较任意两次快照，DELETE 停止跟踪并丢弃快照
+@app.route('/api/admin/profile/memory', methods=['GET', 'POST', 'DELETE'])
+def profile_memory():
+    if not is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+    if request.method == 'DELETE':
+        memory_tracer.stop()
+        return jsonify({'success': True, 'memory': memory_tracer.status()})
+    if request.method == 'POST':
+        snapshot = memory_tracer.snapshot()
+        diff = memory_tracer.diff() if len(memory_tracer.snapshots) > 1 else None
+        return jsonify({'success': True, 'snapshot': snapshot, 'diff': diff})
+    try:
+        first = request.args.get('from', type=int)
+        second = request.args.get('to', type=int)
+        return jsonify({'success': True, 'diff': memory_tracer.diff(first, second,
+                                                                    limit=request.args.get('limit', 30, type=int))})
+    except KeyError:
+        return jsonify({'error': 'Snapshot not found'}), 404
+
+
+# SSE 推送：新消息、文件上传/删除、统计变化
+@app.route('/api/events')
+def event_stream():
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    get_catalog()
+    if not detach_worker():
+        return jsonify({'error': 'Too many connections'}), 503, {'Retry-After': '5'}
+    subscriber = events.subscribe(last_event_id)
+    # 直接透传事件流对象，异步服务端可识别后改为非阻塞推送
+    return Response(events.stream(subscriber), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    }, direct_passthrough=True)
+
+
 if __name__ == '__main__':
     import socket
+    from server.production import load_config, serve
+
+    config = load_config()
+
+    # 未通过参数、环境变量或配置文件指定端口时，在终端中交互输入
+    if config['port'] is None:
+        port_input = input("请输入端口号 (默认 5000): ").strip() if sys.stdin and sys.stdin.isatty() else ''
+        config['port'] = int(port_input) if port_input else 5000
+    port = config['port']
 
-    # 获取端口号
-    port_input = input("请输入端口号 (默认 5000): ").strip()
-    port = int(port_input) if port_input else 5000
+    init_storage(config['upload_folder'])
+    app.config['MAX_CONTENT_LENGTH'] = config['max_upload_mb'] * 1024 * 1024
+    storage.configure(
+        quota=config['quota_mb'] * 1024 * 1024,
+        category_quotas=parse_category_quotas(config['category_quotas']),
+        retention_days=config['retention_days'],
+        policy=config['eviction'],
+        min_free=config['min_free_mb'] * 1024 * 1024,
+    )
+    get_storage()
+    app.config['ADMIN_TOKEN'] = config['admin_token']
+    configure_request_timing(config['slow_request_ms'])
+    shaper.configure(
+        limits={'down': config['download_limit_kb'] * 1024, 'up': config['upload_limit_kb'] * 1024},
+        client_limits={'down': config['client_download_limit_kb'] * 1024,
+                       'up': config['client_upload_limit_kb'] * 1024},
+    )
 
     hostname = socket.gethostname()
     local_ip = socket.gethostbyname(hostname)
@@ -229,4 +1054,12 @@ if __name__ == '__main__':
     print(f"{'='*50}")
     print(f"  Network:  http://{local_ip}:{port}")
     print(f"{'='*50}\n")
-    app.run(host='0.0.0.0', port=port, debug=False, use_reloader=False)
+    static_cache.warm(app.static_folder, app.template_folder)
+    if config['backend'] == 'asyncio':
+        from server.aio import serve_async
+        serve_async(app, config, on_drain=[events.close], message_store=messages, max_message_wait=MAX_MESSAGE_WAIT,
+                    shaper=shaper, metrics=metrics)
+    else:
+        serve(app, config, on_drain=[events.close])
+    storage.stop()
+    messages.close()
@@ -0,0 +1,130 @@
+# 并发连接基准：对比线程池后端与 asyncio 后端能同时维持的长连接数量
+#
+#   python bench/bench_connections.py --max 2000 --workers 64 [--mode longpoll]
+#
+# 每一步新增一批 SSE（或长轮询）连接，要求新连接在超时内收到首个响应，
+# 并且普通接口 /api/stats 仍能在限定延迟内返回，否则认为该后端已无法支撑
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKENDS = ('threaded', 'asyncio')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(port, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('server did not start')
+
+
+async def open_stream(port, mode, timeout):
+    """建立一个长连接，收到响应头后返回 (reader, writer)"""
+    reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+    if mode == 'sse':
+        path = '/api/events'
+    else:
+        path = '/api/messages?since=0&wait=30'
+    writer.write('GET {} HTTP/1.1\r\nHost: bench\r\nAccept: text/event-stream\r\n\r\n'.format(path).encode('ascii'))
+    if mode == 'sse':
+        await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout)
+    return reader, writer
+
+
+async def probe(port, timeout):
+    start = time.perf_counter()
+    reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+    try:
+        writer.write(b'GET /api/stats HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n')
+        await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    return time.perf_counter() - start
+
+
+async def ramp(port, mode, max_connections, step, timeout):
+    streams = []
+    sustained = 0
+    steps = []
+    try:
+        while len(streams) < max_connections:
+            batch = min(step, max_connections - len(streams))
+            results = await asyncio.gather(*[open_stream(port, mode, timeout) for _ in range(batch)],
+                                           return_exceptions=True)
+            opened = [r for r in results if not isinstance(r, BaseException)]
+            streams.extend(opened)
+            try:
+                latency = await probe(port, timeout)
+            except (OSError, asyncio.TimeoutError):
+                latency = None
+            steps.append({'connections': len(streams), 'failed': batch - len(opened),
+                          'stats_latency_ms': round(latency * 1000, 1) if latency is not None else None})
+            if len(opened) < batch or latency is None:
+                break
+            sustained = len(streams)
+    finally:
+        for _, writer in streams:
+            writer.close()
+    return sustained, steps
+
+
+def run_backend(backend, args):
+    port = free_port()
+    upload_folder = tempfile.mkdtemp(prefix='lan_transfer_bench_')
+    proc = subprocess.Popen([
+        sys.executable, os.path.join(ROOT_DIR, 'app.py'),
+        '--backend', backend, '--host', '127.0.0.1', '--port', str(port),
+        '--upload-folder', upload_folder, '--workers', str(args.workers),
+        '--backlog', str(args.max + 128),
+    ], stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(port)
+        sustained, steps = asyncio.run(ramp(port, args.mode, args.max, args.step, args.timeout))
+    finally:
+        proc.kill()
+        proc.wait()
+    return {'backend': backend, 'mode': args.mode, 'workers': args.workers, 'sustained': sustained, 'steps': steps}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='LAN Transfer concurrent connection benchmark')
+    parser.add_argument('--max', type=int, default=2000, help='最多尝试的连接数')
+    parser.add_argument('--step', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=64)
+    parser.add_argument('--mode', choices=('sse', 'longpoll'), default='sse')
+    parser.add_argument('--timeout', type=float, default=5.0, help='建立连接与探测请求的超时（秒）')
+    parser.add_argument('--backend', choices=BACKENDS, action='append', help='只测试指定后端，可重复')
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    results = [run_backend(backend, args) for backend in args.backend or BACKENDS]
+
+    print('{:<10} {:<9} {:>8} {:>12} {:>18}'.format('backend', 'mode', 'workers', 'sustained', 'last stats ms'))
+    for r in results:
+        last = r['steps'][-1]['stats_latency_ms'] if r['steps'] else None
+        print('{:<10} {:<9} {:>8} {:>12} {:>18}'.format(r['backend'], r['mode'], r['workers'], r['sustained'],
+                                                        'timeout' if last is None else last))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+# 下载吞吐基准：对比原 send_from_directory 路径、分块读取路径与 os.sendfile 路径
+#
+#   python bench/bench_download.py --size-mb 1024 --rounds 3
+#
+# 服务端在子进程中运行，CPU 时间通过 /proc/<pid>/stat 统计（仅 Linux）
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+READ_SIZE = 1024 * 1024
+
+
+def serve(port, upload_folder, use_sendfile):
+    sys.path.insert(0, ROOT_DIR)
+    from flask import send_from_directory
+    from werkzeug.serving import make_server
+    import app as server_app
+
+    flask_app = server_app.app
+    flask_app.config['UPLOAD_FOLDER'] = upload_folder
+    flask_app.config['USE_SENDFILE'] = use_sendfile
+
+    # 原实现，作为对照
+    @flask_app.route('/bench/legacy/<category>/<filename>')
+    def legacy_download(category, filename):
+        folder = os.path.join(flask_app.config['UPLOAD_FOLDER'], category)
+        return send_from_directory(folder, filename, as_attachment=True)
+
+    make_server('127.0.0.1', port, flask_app, threaded=True).serve_forever()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def process_cpu_seconds(pid):
+    try:
+        with open('/proc/{}/stat'.format(pid)) as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def wait_ready(port, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('server did not start')
+
+
+def download(url):
+    total = 0
+    with urllib.request.urlopen(url, timeout=600) as response:
+        while True:
+            block = response.read(READ_SIZE)
+            if not block:
+                break
+            total += len(block)
+    return total
+
+
+def run_case(name, path, use_sendfile, upload_folder, size, rounds):
+    port = free_port()
+    proc = subprocess.Popen([
+        sys.executable, os.path.abspath(__file__), '--serve',
+        '--port', str(port), '--upload-folder', upload_folder,
+        '--sendfile', 'on' if use_sendfile else 'off',
+    ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(port)
+        url = 'http://127.0.0.1:{}{}'.format(port, path)
+        download(url)  # 预热页缓存
+        cpu_before = process_cpu_seconds(proc.pid)
+        start = time.perf_counter()
+        for _ in range(rounds):
+            if download(url) != size:
+                raise RuntimeError('short read in ' + name)
+        elapsed = time.perf_counter() - start
+        cpu_after = process_cpu_seconds(proc.pid)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    gigabytes = size * rounds / (1024 ** 3)
+    result = {
+        'case': name,
+        'throughput_mb_s': round(size * rounds / (1024 ** 2) / elapsed, 1),
+        'seconds': round(elapsed, 3),
+    }
+    if cpu_before is not None and cpu_after is not None:
+        result['server_cpu_s_per_gb'] = round((cpu_after - cpu_before) / gigabytes, 3)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='LAN Transfer download benchmark')
+    parser.add_argument('--size-mb', type=int, default=512)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--upload-folder', help=argparse.SUPPRESS)
+    parser.add_argument('--sendfile', default='on', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port, args.upload_folder, args.sendfile == 'on')
+        return
+
+    tmp_dir = tempfile.mkdtemp(prefix='lan_transfer_bench_')
+    try:
+        folder = os.path.join(tmp_dir, 'videos')
+        os.makedirs(folder)
+        size = args.size_mb * 1024 * 1024
+        block = os.urandom(READ_SIZE)
+        with open(os.path.join(folder, 'bench.mp4'), 'wb') as f:
+            for _ in range(args.size_mb):
+                f.write(block)
+
+        cases = [
+            ('legacy send_from_directory', '/bench/legacy/videos/bench.mp4', True),
+            ('range stream (read)', '/api/download/videos/bench.mp4', False),
+            ('range stream (sendfile)', '/api/download/videos/bench.mp4', True),
+        ]
+        results = [run_case(name, path, use_sendfile, tmp_dir, size, args.rounds)
+                   for name, path, use_sendfile in cases]
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    print('{:<30} {:>12} {:>18}'.format('case', 'MB/s', 'server CPU s/GB'))
+    for r in results:
+        print('{:<30} {:>12} {:>18}'.format(r['case'], r['throughput_mb_s'], r.get('server_cpu_s_per_gb', 'n/a')))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
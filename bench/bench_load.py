@@ -0,0 +1,425 @@
+# 端到端负载基准：在本机启动 app.py（临时上传目录），同时运行多种负载，统计各类请求的吞吐与 p50/p95/p99 延迟
+#
+#   python bench/bench_load.py --seconds 20 --pollers 16 --json load.json
+#   python bench/bench_load.py --seconds 20 --pollers 16 --compare load.json
+#
+# 负载（每个客户端一个线程、一条 keep-alive 连接，不加等待地连续请求）：
+#   upload    不同大小的文件轮流上传：小文件走 /api/upload，大文件走分块上传会话；上传后删除，目录大小保持稳定
+#   download  整文件下载与大文件中随机区间的 Range 下载交替进行
+#   poll      文件列表与统计轮询，与浏览器相同携带 If-None-Match（多数返回 304）
+#   chat      发送消息后立即拉取新消息
+# --compare 与保存的结果比较，任一指标变差超过 --tolerance 时列出并以状态码 1 退出
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import http.client
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKENDS = ('threaded', 'asyncio')
+READ_SIZE = 256 * 1024
+UPLOAD_SIZES = (16 * 1024, 256 * 1024, 2 * 1024 * 1024, 12 * 1024 * 1024)
+# 不小于该大小的上传走分块上传会话
+SESSION_UPLOAD_SIZE = 4 * 1024 * 1024
+DOWNLOAD_FILE_SIZE = 4 * 1024 * 1024
+RANGE_FILE_SIZE = 64 * 1024 * 1024
+RANGE_SIZE = 1024 * 1024
+LIST_FILES = 200
+# 只对这些操作统计 MB/s
+TRANSFER_OPS = ('upload', 'download_full', 'download_range')
+# 比较时延迟差小于该毫秒数的不算退化，避免亚毫秒级的抖动被当成回归
+MIN_DELTA_MS = 1.0
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(port, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('server did not start')
+
+
+def process_cpu_seconds(pid):
+    try:
+        with open('/proc/{}/stat'.format(pid)) as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+class Recorder:
+    """按操作名记录 (完成时间, 耗时, 字节数)；预热阶段结束前完成的操作不计入"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+
+    def add(self, op, elapsed, size=0):
+        with self._lock:
+            self.samples.setdefault(op, []).append((time.perf_counter(), elapsed, size))
+
+    def error(self, op, message):
+        with self._lock:
+            self.errors.setdefault(op, []).append(message)
+
+    def summary(self, start, end):
+        results = {}
+        for op in sorted(set(self.samples) | set(self.errors)):
+            samples = [(elapsed, size) for t, elapsed, size in self.samples.get(op, []) if start <= t < end]
+            latencies = [elapsed for elapsed, _ in samples]
+            transferred = sum(size for _, size in samples)
+            result = {
+                'count': len(samples),
+                'errors': len(self.errors.get(op, [])),
+                'ops_s': round(len(samples) / (end - start), 1),
+            }
+            if op in TRANSFER_OPS:
+                result['mb_s'] = round(transferred / (end - start) / 1024 / 1024, 2)
+            if latencies:
+                result.update({
+                    'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+                    'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+                    'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+                    'max_ms': round(max(latencies) * 1000, 2),
+                })
+            results[op] = result
+        return results
+
+
+class Client(threading.Thread):
+    """一个负载客户端：复用一条 keep-alive 连接，出错时重连"""
+
+    def __init__(self, port, recorder, stop, seed):
+        super().__init__(daemon=True)
+        self.port = port
+        self.recorder = recorder
+        self.stop = stop
+        self.random = random.Random(seed)
+        self.conn = None
+
+    def request(self, method, path, body=None, headers=None):
+        """返回 (状态码, 响应头, 响应体长度, 响应体)；下载只统计长度不保留内容"""
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=120)
+        try:
+            self.conn.request(method, path, body=body, headers=headers or {})
+            response = self.conn.getresponse()
+            keep = response.getheader('Content-Type', '').startswith('application/json')
+            blocks, length = [], 0
+            while True:
+                block = response.read(READ_SIZE)
+                if not block:
+                    break
+                length += len(block)
+                if keep:
+                    blocks.append(block)
+            if response.will_close:
+                self.close()
+            return response.status, response, length, b''.join(blocks)
+        except (OSError, http.client.HTTPException):
+            self.close()
+            raise
+
+    def timed(self, op, method, path, body=None, headers=None, expect=(200,), size=None):
+        start = time.perf_counter()
+        try:
+            status, response, length, data = self.request(method, path, body, headers)
+        except (OSError, http.client.HTTPException) as e:
+            self.recorder.error(op, repr(e))
+            return None, None
+        elapsed = time.perf_counter() - start
+        if status not in expect:
+            self.recorder.error(op, '{} {} -> {}'.format(method, path, status))
+            return None, None
+        self.recorder.add(op, elapsed, length if size is None else size)
+        return response, data
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def run(self):
+        try:
+            while not self.stop.is_set():
+                self.step()
+        finally:
+            self.close()
+
+    def step(self):
+        raise NotImplementedError
+
+
+class Uploader(Client):
+    def __init__(self, port, recorder, stop, seed, index):
+        super().__init__(port, recorder, stop, seed)
+        self.index = index
+        self.count = 0
+        self.payloads = {size: os.urandom(size) for size in UPLOAD_SIZES}
+
+    def step(self):
+        size = UPLOAD_SIZES[self.count % len(UPLOAD_SIZES)]
+        self.count += 1
+        name = 'load_{}_{}_{}.txt'.format(self.index, self.count, size)
+        payload = self.payloads[size]
+        if size < SESSION_UPLOAD_SIZE:
+            boundary = 'benchboundary{}'.format(self.count)
+            body = ('--{}\r\nContent-Disposition: form-data; name="file"; filename="{}"\r\n'
+                    'Content-Type: application/octet-stream\r\n\r\n').format(boundary, name).encode() + payload + \
+                   '\r\n--{}--\r\n'.format(boundary).encode()
+            response, data = self.timed('upload', 'POST', '/api/upload', body,
+                                        {'Content-Type': 'multipart/form-data; boundary=' + boundary}, size=size)
+        else:
+            data = self.upload_session(name, payload)
+        if data:
+            stored = json.loads(data)['file']['name']
+            self.timed('delete', 'DELETE', '/api/delete/documents/' + stored)
+
+    def upload_session(self, name, payload):
+        """创建会话、逐块上传并提交，整个过程计为一次 upload"""
+        start = time.perf_counter()
+        try:
+            status, _, _, data = self.request('POST', '/api/uploads', json.dumps({
+                'filename': name, 'size': len(payload)}).encode(), {'Content-Type': 'application/json'})
+            if status != 200:
+                raise RuntimeError('create session -> {}'.format(status))
+            session = json.loads(data)['session']
+            chunk_size = session['chunk_size']
+            for index in range(session['total_chunks']):
+                chunk = payload[index * chunk_size:(index + 1) * chunk_size]
+                status, _, _, _ = self.request('PUT', '/api/uploads/{}/chunks/{}'.format(
+                    session['session_id'], index), chunk, {'Content-Type': 'application/octet-stream'})
+                if status != 200:
+                    raise RuntimeError('chunk -> {}'.format(status))
+            status, _, _, data = self.request('POST', '/api/uploads/{}/commit'.format(session['session_id']))
+            if status != 200:
+                raise RuntimeError('commit -> {}'.format(status))
+        except (OSError, RuntimeError, ValueError, KeyError, http.client.HTTPException) as e:
+            self.recorder.error('upload', repr(e))
+            return None
+        self.recorder.add('upload', time.perf_counter() - start, len(payload))
+        return data
+
+
+class Downloader(Client):
+    def __init__(self, port, recorder, stop, seed):
+        super().__init__(port, recorder, stop, seed)
+        self.count = 0
+
+    def step(self):
+        self.count += 1
+        if self.count % 2:
+            self.timed('download_full', 'GET', '/api/download/documents/medium.bin',
+                       headers={'Accept-Encoding': 'identity'})
+            return
+        start = self.random.randrange(0, RANGE_FILE_SIZE - RANGE_SIZE)
+        self.timed('download_range', 'GET', '/api/download/videos/large.mp4',
+                   headers={'Range': 'bytes={}-{}'.format(start, start + RANGE_SIZE - 1)}, expect=(206,))
+
+
+class Poller(Client):
+    """像浏览器一样带 ETag 重新验证文件列表与统计"""
+
+    def __init__(self, port, recorder, stop, seed):
+        super().__init__(port, recorder, stop, seed)
+        self.etags = {}
+        self.count = 0
+
+    def step(self):
+        self.count += 1
+        op, path = ('list', '/api/files/all?limit=50') if self.count % 2 else ('stats', '/api/stats')
+        headers = {'Accept-Encoding': 'gzip'}
+        if path in self.etags:
+            headers['If-None-Match'] = self.etags[path]
+        response, _ = self.timed(op, 'GET', path, headers=headers, expect=(200, 304))
+        if response is not None and response.getheader('ETag'):
+            self.etags[path] = response.getheader('ETag')
+
+
+class Chatter(Client):
+    def __init__(self, port, recorder, stop, seed, index):
+        super().__init__(port, recorder, stop, seed)
+        self.index = index
+        self.last_id = 0
+        self.count = 0
+
+    def step(self):
+        self.count += 1
+        self.timed('chat_send', 'POST', '/api/messages', json.dumps({
+            'content': 'load {} {}'.format(self.index, self.count), 'sender': 'bench{}'.format(self.index),
+        }).encode(), {'Content-Type': 'application/json'})
+        _, data = self.timed('chat_poll', 'GET', '/api/messages?since={}&wait=0'.format(self.last_id))
+        if data:
+            self.last_id = json.loads(data).get('last_id', self.last_id)
+
+
+def prepare(upload_folder, list_files):
+    """测试文件：一个整文件下载用的中等文件、一个 Range 下载用的大文件，以及撑起列表的若干小文件"""
+    block = os.urandom(1024 * 1024)
+    os.makedirs(os.path.join(upload_folder, 'documents'))
+    os.makedirs(os.path.join(upload_folder, 'videos'))
+    with open(os.path.join(upload_folder, 'documents', 'medium.bin'), 'wb') as f:
+        f.write(os.urandom(DOWNLOAD_FILE_SIZE))
+    with open(os.path.join(upload_folder, 'videos', 'large.mp4'), 'wb') as f:
+        for _ in range(RANGE_FILE_SIZE // len(block)):
+            f.write(block)
+    os.makedirs(os.path.join(upload_folder, 'images'))
+    for i in range(list_files):
+        with open(os.path.join(upload_folder, 'images', 'list_{:05d}.png'.format(i)), 'wb') as f:
+            f.write(block[:1024 + i])
+
+
+def run(args):
+    tmp_dir = tempfile.mkdtemp(prefix='lan_transfer_load_')
+    port = free_port()
+    proc = None
+    try:
+        upload_folder = os.path.join(tmp_dir, 'uploads')
+        prepare(upload_folder, args.list_files)
+        proc = subprocess.Popen([
+            sys.executable, os.path.join(ROOT_DIR, 'app.py'), '--port', str(port), '--host', '127.0.0.1',
+            '--upload-folder', upload_folder, '--backend', args.backend, '--workers', str(args.workers),
+            '--min-free-mb', '0',
+        ], cwd=tmp_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        wait_ready(port)
+
+        recorder = Recorder()
+        stop = threading.Event()
+        clients = ([Uploader(port, recorder, stop, args.seed + i, i) for i in range(args.uploaders)]
+                   + [Downloader(port, recorder, stop, args.seed + 100 + i) for i in range(args.downloaders)]
+                   + [Poller(port, recorder, stop, args.seed + 200 + i) for i in range(args.pollers)]
+                   + [Chatter(port, recorder, stop, args.seed + 300 + i, i) for i in range(args.chatters)])
+        for client in clients:
+            client.start()
+        time.sleep(args.warmup)
+        cpu_before = process_cpu_seconds(proc.pid)
+        start = time.perf_counter()
+        time.sleep(args.seconds)
+        end = time.perf_counter()
+        cpu_after = process_cpu_seconds(proc.pid)
+        stop.set()
+        for client in clients:
+            client.join(timeout=30)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    operations = recorder.summary(start, end)
+    total = sum(op['count'] for op in operations.values())
+    results = {
+        'config': {name: getattr(args, name) for name in (
+            'backend', 'workers', 'seconds', 'warmup', 'uploaders', 'downloaders', 'pollers', 'chatters',
+            'list_files', 'seed')},
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpus': os.cpu_count()},
+        'requests_s': round(total / (end - start), 1),
+        'operations': operations,
+    }
+    if cpu_before is not None and cpu_after is not None:
+        results['server_cpu_utilization'] = round((cpu_after - cpu_before) / (end - start), 3)
+    return results
+
+
+def compare(results, baseline, tolerance, min_delta_ms=MIN_DELTA_MS):
+    """返回 [(操作, 指标, 基准值, 当前值, 变化比例)]：延迟升高或吞吐下降超过 tolerance 的项"""
+    regressions = []
+    for op, base in baseline.get('operations', {}).items():
+        current = results['operations'].get(op)
+        if current is None or not current['count']:
+            regressions.append((op, 'count', base.get('count'), 0, -1.0))
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+            if base.get(metric) and current.get(metric) is not None:
+                change = current[metric] / base[metric] - 1
+                if change > tolerance and current[metric] - base[metric] >= min_delta_ms:
+                    regressions.append((op, metric, base[metric], current[metric], change))
+        for metric in ('ops_s', 'mb_s'):
+            if base.get(metric) and current.get(metric) is not None:
+                change = current[metric] / base[metric] - 1
+                if change < -tolerance:
+                    regressions.append((op, metric, base[metric], current[metric], change))
+        if current['errors'] > base.get('errors', 0):
+            regressions.append((op, 'errors', base.get('errors', 0), current['errors'], None))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='LAN Transfer end-to-end load benchmark')
+    parser.add_argument('--backend', choices=BACKENDS, default='threaded')
+    parser.add_argument('--workers', type=int, default=64, help='服务端工作线程数')
+    parser.add_argument('--seconds', type=float, default=20, help='统计时长')
+    parser.add_argument('--warmup', type=float, default=3, help='开始统计前的预热时长')
+    parser.add_argument('--uploaders', type=int, default=2)
+    parser.add_argument('--downloaders', type=int, default=4)
+    parser.add_argument('--pollers', type=int, default=16, help='列表与统计轮询客户端数')
+    parser.add_argument('--chatters', type=int, default=4)
+    parser.add_argument('--list-files', type=int, default=LIST_FILES, help='预置的文件数，决定列表大小')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--compare', help='与该文件中保存的结果比较')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='允许的变差比例')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+    results = run(args)
+
+    print('backend {backend}, {requests_s} req/s, server CPU {cpu}'.format(
+        backend=args.backend, requests_s=results['requests_s'], cpu=results.get('server_cpu_utilization', 'n/a')))
+    print('{:<16} {:>8} {:>7} {:>9} {:>8} {:>9} {:>9} {:>9} {:>9}'.format(
+        'operation', 'count', 'errors', 'ops/s', 'MB/s', 'p50 ms', 'p95 ms', 'p99 ms', 'max ms'))
+    for op, r in results['operations'].items():
+        print('{:<16} {:>8} {:>7} {:>9} {:>8} {:>9} {:>9} {:>9} {:>9}'.format(
+            op, r['count'], r['errors'], r['ops_s'], r.get('mb_s', '-'), r.get('p50_ms', '-'),
+            r.get('p95_ms', '-'), r.get('p99_ms', '-'), r.get('max_ms', '-')))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if baseline is None:
+        return
+    if baseline.get('config') != results['config']:
+        print('warning: baseline was recorded with a different configuration: {}'.format(baseline.get('config')))
+    regressions = compare(results, baseline, args.tolerance)
+    if not regressions:
+        print('no regressions against {} (tolerance {:.0%})'.format(args.compare, args.tolerance))
+        return
+    print('regressions against {} (tolerance {:.0%}):'.format(args.compare, args.tolerance))
+    for op, metric, before, after, change in regressions:
+        print('  {:<16} {:<8} {:>10} -> {:<10} {}'.format(
+            op, metric, before, after, '' if change is None else '{:+.0%}'.format(change)))
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
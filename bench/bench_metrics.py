@@ -0,0 +1,189 @@
+# 指标采集开销基准：
+#   1. 单次记录的耗时，以及多线程并发记录时按线程分片与全局加锁计数器的对比
+#   2. 在进程内直接调用 WSGI 应用，对比下载、文件列表、上传分块请求在开启与关闭指标时的耗时
+#
+#   python bench/bench_metrics.py --rounds 21 --threads 8
+import os
+import gc
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 追加到末尾：仓库中的 cmd 包不能遮蔽标准库的 cmd 模块（werkzeug.test 间接依赖）
+sys.path.append(ROOT_DIR)
+
+
+class LockedCounter:
+    """对照组：所有线程共用一把锁"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+
+    def inc(self, name, labels=(), value=1):
+        with self._lock:
+            key = (name, labels)
+            self.counters[key] = self.counters.get(key, 0) + value
+
+
+def per_call_ns(func, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - start) / calls * 1e9
+
+
+def concurrent_ns(func, threads, calls):
+    """多个线程同时调用 func，返回每次调用的平均墙钟耗时"""
+    barrier = threading.Barrier(threads + 1)
+
+    def worker():
+        barrier.wait()
+        for _ in range(calls):
+            func()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for w in workers:
+        w.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for w in workers:
+        w.join()
+    return (time.perf_counter() - start) / (threads * calls) * 1e9
+
+
+def bench_primitives(calls, threads):
+    from server.metrics import Metrics, MetricsMiddleware, ROUTE_ENVIRON_KEY
+
+    metrics = Metrics()
+
+    def plain_app(environ, start_response):
+        start_response('200 OK', [])
+        return [b'']
+
+    instrumented_app = MetricsMiddleware(plain_app, metrics)
+    environ = {'REQUEST_METHOD': 'GET', ROUTE_ENVIRON_KEY: '/api/download/<category>/<filename>'}
+    start_response = lambda status, headers, exc_info=None: None
+    locked = LockedCounter()
+    labels = (('route', '/api/download/<category>/<filename>'), ('method', 'GET'), ('status', '200'))
+    route = (('route', '/api/download/<category>/<filename>'),)
+    return {
+        'inc_ns': round(per_call_ns(lambda: metrics.inc('requests', labels), calls), 1),
+        'observe_ns': round(per_call_ns(lambda: metrics.observe('latency', route, 0.003), calls), 1),
+        'locked_inc_ns': round(per_call_ns(lambda: locked.inc('requests', labels), calls), 1),
+        'sharded_inc_{}_threads_ns'.format(threads): round(
+            concurrent_ns(lambda: metrics.inc('requests', labels), threads, calls // threads), 1),
+        'locked_inc_{}_threads_ns'.format(threads): round(
+            concurrent_ns(lambda: locked.inc('requests', labels), threads, calls // threads), 1),
+        # 中间件本身增加的耗时（计数、直方图、计时与状态码捕获）
+        'middleware_ns': round(per_call_ns(lambda: instrumented_app(environ, start_response), calls)
+                               - per_call_ns(lambda: plain_app(environ, start_response), calls), 1),
+        'render_ms': round(per_call_ns(metrics.render, 100) / 1e6, 3),
+    }
+
+
+def bench_requests(requests, rounds):
+    from werkzeug.test import EnvironBuilder
+    import app as server_app
+
+    tmp_dir = tempfile.mkdtemp(prefix='lan_transfer_metrics_')
+    try:
+        server_app.init_storage(tmp_dir)
+        server_app.app.config['USE_SENDFILE'] = False
+        os.makedirs(os.path.join(tmp_dir, 'documents'))
+        for i in range(50):
+            with open(os.path.join(tmp_dir, 'documents', 'file{}.txt'.format(i)), 'wb') as f:
+                f.write(os.urandom(64 * 1024))
+        session = server_app.upload_sessions.create('bench.txt', 64 * 1024 * 1024, 64 * 1024, 'bench')
+        chunk = os.urandom(64 * 1024)
+
+        cases = {
+            'download_64k': lambda: EnvironBuilder('/api/download/documents/file1.txt',
+                                                   headers={'Accept-Encoding': 'identity'}).get_environ(),
+            'list_files': lambda: EnvironBuilder('/api/files/documents').get_environ(),
+            'upload_chunk_64k': lambda: EnvironBuilder('/api/uploads/{}/chunks/0'.format(session.id), method='PUT',
+                                                       data=chunk).get_environ(),
+        }
+        instrumented = server_app.app.wsgi_app
+        plain = instrumented.app
+        hooks = server_app.app.before_request_funcs.setdefault(None, [])
+
+        def run(wsgi_app, make_environ):
+            environs = [make_environ() for _ in range(requests)]
+            gc.collect()
+            gc.disable()
+            try:
+                start = time.perf_counter()
+                for environ in environs:
+                    body = wsgi_app(environ, lambda status, headers, exc_info=None: None)
+                    for _ in body:
+                        pass
+                    close = getattr(body, 'close', None)
+                    if close is not None:
+                        close()
+                return (time.perf_counter() - start) / requests * 1e6
+            finally:
+                gc.enable()
+
+        results = {}
+        for name, make_environ in cases.items():
+            run(instrumented, make_environ)  # 预热
+            on, off = [], []
+            # 交替先后顺序测量并取最好成绩，减少顺序、CPU 频率与其他进程的影响
+            for i in range(rounds):
+                for enabled in ((True, False) if i % 2 else (False, True)):
+                    if enabled:
+                        on.append(run(instrumented, make_environ))
+                        continue
+                    hooks.remove(server_app.record_route)
+                    try:
+                        off.append(run(plain, make_environ))
+                    finally:
+                        hooks.append(server_app.record_route)
+            # 相邻两次测量之差的中位数，比分别取最小值更不受偶发抖动影响
+            diffs = sorted(a - b for a, b in zip(on, off))
+            overhead_us = diffs[len(diffs) // 2]
+            off_us = sorted(off)[len(off) // 2]
+            results[name] = {
+                'metrics_on_us': round(sorted(on)[len(on) // 2], 1),
+                'metrics_off_us': round(off_us, 1),
+                'overhead_us': round(overhead_us, 2),
+                'overhead_pct': round(overhead_us / off_us * 100, 2),
+            }
+        return results
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='LAN Transfer metrics overhead benchmark')
+    parser.add_argument('--calls', type=int, default=400000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--rounds', type=int, default=15)
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    results = {'primitives': bench_primitives(args.calls, args.threads),
+               'requests': bench_requests(args.requests, args.rounds)}
+
+    for name, value in results['primitives'].items():
+        print('{:<30} {:>10}'.format(name, value))
+    print()
+    print('{:<20} {:>14} {:>14} {:>12} {:>10}'.format('request (median)', 'metrics on us', 'metrics off us',
+                                                    'overhead us', 'overhead'))
+    for name, r in results['requests'].items():
+        print('{:<20} {:>14} {:>14} {:>12} {:>9}%'.format(name, r['metrics_on_us'], r['metrics_off_us'],
+                                                          r['overhead_us'], r['overhead_pct']))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
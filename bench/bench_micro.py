@@ -0,0 +1,329 @@
+# 热点纯函数的微基准：每个请求或每帧界面都会调用的小函数
+#   服务端 app.py：get_category、allowed_file、format_size、format_time、get_file_info、entry_info
+#   CLI cmd/：format_time、MessageNotifier.show_pending 与 CLIInterface 的 _render_* 界面绘制
+# 在 1 万到 100 万个合成文件名、大小、时间戳与消息上测量每次调用的耗时与内存分配，
+# 可与已提交的基准 bench/baselines/micro.json 比较
+#
+#   python bench/bench_micro.py --sizes 10000,100000 --json bench/baselines/micro.json
+#   python bench/bench_micro.py --sizes 10000,100000,1000000 --compare bench/baselines/micro.json
+#
+# 界面绘制输出到 os.devnull；clear_screen 每帧启动一个 clear 进程，测量时换成等价的 ANSI 清屏序列
+import os
+import gc
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import contextlib
+import tracemalloc
+from datetime import datetime
+from itertools import starmap
+from collections import deque
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 追加到末尾：仓库中的 cmd 包不能遮蔽标准库的 cmd 模块；CLI 模块之间以 from core import 互相引用
+sys.path.append(ROOT_DIR)
+sys.path.append(os.path.join(ROOT_DIR, 'cmd'))
+
+DEFAULT_SIZES = '10000,100000'
+BASELINE = os.path.join(ROOT_DIR, 'bench', 'baselines', 'micro.json')
+# 未知扩展名、大小写混用、无扩展名与多重扩展名的文件名所占比例
+UNKNOWN_EXTENSIONS = ('bin', 'exe', 'iso', 'json', 'py', 'log', 'dat', 'apk')
+ODD_NAME_RATIO = 0.2
+SENDERS = 20
+# stat 的耗时与文件总数无关，磁盘上最多创建这么多文件
+DISK_FILES = 20000
+TRANSFERS = 50
+# 界面每帧绘制的调用次数
+FRAMES = 10
+# 比较时每次调用的耗时变化小于该纳秒数、分配变化小于该字节数的不算退化
+MIN_DELTA_NS = 20
+MIN_DELTA_BYTES = 64
+
+
+def file_names(n, rng, extensions):
+    names = []
+    for i in range(n):
+        roll = rng.random()
+        if roll < ODD_NAME_RATIO / 4:
+            names.append('README_{}'.format(i))
+        elif roll < ODD_NAME_RATIO / 2:
+            names.append('backup_{}.tar.gz'.format(i))
+        elif roll < ODD_NAME_RATIO * 3 / 4:
+            names.append('data_{}.{}'.format(i, rng.choice(UNKNOWN_EXTENSIONS)))
+        elif roll < ODD_NAME_RATIO:
+            names.append('IMG_{}.{}'.format(i, rng.choice(extensions).upper()))
+        else:
+            names.append('file_{}.{}'.format(i, rng.choice(extensions)))
+    return names
+
+
+def file_sizes(n, rng):
+    # 从几字节到几 TB 按对数均匀分布，覆盖 format_size 的每个单位
+    return [int(2 ** rng.uniform(0, 42)) for _ in range(n)]
+
+
+def timestamps(n, rng):
+    base = time.time() - 30 * 86400
+    return [datetime.fromtimestamp(base + rng.uniform(0, 30 * 86400)).isoformat() for _ in range(n)]
+
+
+def chat_messages(n, rng, me):
+    senders = [me] + ['用户{}'.format(i) for i in range(SENDERS - 1)]
+    stamps = timestamps(n, rng)
+    return [{
+        'id': i + 1,
+        'sender': rng.choice(senders),
+        'content': '消息内容 {} '.format(i) * rng.randint(1, 6),
+        'timestamp': stamps[i],
+    } for i in range(n)]
+
+
+def transfers(rng):
+    items = []
+    for i in range(TRANSFERS):
+        size = int(2 ** rng.uniform(20, 34))
+        items.append({
+            'id': i + 1, 'client': '192.168.1.{}'.format(i + 2), 'direction': rng.choice(('up', 'down')),
+            'name': 'transfer_{}.mp4'.format(i), 'bytes': rng.randint(0, size), 'size': size,
+            'elapsed': rng.uniform(0, 60), 'rate': rng.uniform(0, 1e8), 'average_rate': rng.uniform(0, 1e8),
+            'eta': rng.uniform(0, 600),
+        })
+    return {'transfers': items, 'active': {'up': TRANSFERS // 2, 'down': TRANSFERS // 2},
+            'rate': {'up': 5e7, 'down': 5e7}}
+
+
+def measure(func, inputs, rounds):
+    """每轮以 func(*item) 依次调用所有输入，返回每次调用耗时的中位数与最好成绩（纳秒）"""
+    timings = []
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(rounds):
+            start = time.perf_counter()
+            deque(starmap(func, inputs), 0)
+            timings.append((time.perf_counter() - start) / len(inputs) * 1e9)
+    finally:
+        gc.enable()
+    timings.sort()
+    return timings[len(timings) // 2], timings[0]
+
+
+def allocations(func, inputs):
+    """在 tracemalloc 下调用一轮：返回值平均占用的字节数，以及调用过程中的内存峰值"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        results = list(starmap(func, inputs))
+        current, peak = tracemalloc.get_traced_memory()
+        retained = current - before - sys.getsizeof(results)
+    finally:
+        tracemalloc.stop()
+    # 没有返回值的函数（界面绘制）留下的只是缓存等与调用无关的内存
+    if all(result is None for result in results):
+        retained = 0
+    del results
+    return max(retained, 0) / len(inputs), peak - before
+
+
+def server_cases(n, rng, tmp_dir):
+    import app as server_app
+    from server.catalog import CatalogEntry
+
+    extensions = sorted(server_app.ALLOWED_EXTENSIONS)
+    names = file_names(n, rng, extensions)
+    sizes = file_sizes(n, rng)
+    stamps = timestamps(n, rng)
+
+    folder = os.path.join(tmp_dir, 'files')
+    os.makedirs(folder, exist_ok=True)
+    on_disk = []
+    for name in names[:DISK_FILES]:
+        path = os.path.join(folder, name)
+        if not os.path.exists(path):
+            with open(path, 'wb'):
+                pass
+        on_disk.append((path, name))
+    entries = [(CatalogEntry(name, server_app.get_category(name), size, time.time()),)
+               for name, size in zip(names, sizes)]
+
+    return {
+        'app.get_category': (server_app.get_category, [(name,) for name in names]),
+        'app.allowed_file': (server_app.allowed_file, [(name,) for name in names]),
+        'app.format_size': (server_app.format_size, [(size,) for size in sizes]),
+        'app.format_time': (server_app.format_time, [(stamp,) for stamp in stamps]),
+        'app.get_file_info': (server_app.get_file_info, on_disk),
+        'app.entry_info': (server_app.entry_info, entries),
+    }
+
+
+def ansi_clear():
+    sys.stdout.write('\033[2J\033[H')
+
+
+def cli_cases(n, rng, colors):
+    import core
+    import ui
+
+    ui.clear_screen = ansi_clear
+    ui.USE_COLORS = colors
+    client = core.LanTransferClient('192.168.1.100', 5000)
+    interface = ui.CLIInterface(client)
+    messages = chat_messages(n, rng, client.sender_name)
+    # 客户端只保留最近 MESSAGE_HISTORY 条消息，尚未显示的新消息则不限数量
+    ui.latest_messages[:] = messages[-core.MESSAGE_HISTORY:]
+    names = file_names(n, rng, ('pdf', 'docx', 'txt', 'md', 'csv'))
+    sizes = file_sizes(n, rng)
+    file_items = [(name, '{} ({})'.format(name, interface._format_size(size))) for name, size in zip(names, sizes)]
+    file_items.append(('back', '🔙 返回'))
+    categories = [(c, '{} {}'.format(interface.category_icons[c], interface.category_names[c]))
+                  for c in interface.categories] + [('back', '🔙 返回')]
+    frames = [(i * 7919 % len(file_items),) for i in range(FRAMES)]
+
+    def select(items, index):
+        selector = core.SelectableList(items)
+        selector.selected_index = index
+        return selector
+
+    menu = select([(action, name) for action, name, _ in interface.menu_items], 0)
+    category_selector = select(categories, 1)
+    file_selector = select(file_items, 0)
+    confirm = select([('yes', '✓ 确定下载'), ('no', '✗ 取消')], 0)
+    transfer_data = transfers(rng)
+    # 每帧 show_pending 显示一批新消息，共 n 条
+    batches = [(messages[i:i + max(n // FRAMES, 1)],) for i in range(0, n, max(n // FRAMES, 1))]
+
+    def show_pending(batch):
+        core.pending_messages.extend(batch)
+        core.new_message_event.set()
+        core.MessageNotifier.show_pending()
+
+    def with_index(selector, render, *args):
+        def frame(index):
+            selector.selected_index = index % len(selector.items)
+            render(selector, *args)
+        return frame
+
+    return {
+        'core.format_time': (core.format_time, [(m['timestamp'],) for m in messages]),
+        'MessageNotifier.show_pending': (show_pending, batches),
+        '_render_main_menu': (with_index(menu, interface._render_main_menu), frames),
+        '_render_chat_mode': (interface._render_chat_mode, [(i % 40,) for i in range(FRAMES)]),
+        '_render_category_select': (with_index(category_selector, interface._render_category_select), frames),
+        '_render_file_list': (with_index(file_selector, interface._render_file_list, 'documents'), frames),
+        '_render_download_select': (with_index(category_selector, interface._render_download_select), frames),
+        '_render_download_file_select': (
+            with_index(file_selector, interface._render_download_file_select, 'documents'), frames),
+        '_render_delete_select': (with_index(category_selector, interface._render_delete_select), frames),
+        '_render_delete_file_select': (
+            with_index(file_selector, interface._render_delete_file_select, 'documents'), frames),
+        '_render_confirm': (with_index(confirm, interface._render_confirm), frames),
+        '_render_delete_confirm': (with_index(confirm, interface._render_delete_confirm, names[0]), frames),
+        '_render_transfers': (interface._render_transfers, [(transfer_data,)] * FRAMES),
+    }
+
+
+def run(args):
+    results = {}
+    tmp_dir = tempfile.mkdtemp(prefix='lan_transfer_micro_')
+    try:
+        with open(os.devnull, 'w', encoding='utf-8') as devnull:
+            for n in args.sizes:
+                rng = random.Random(args.seed)
+                cases = dict(server_cases(n, rng, tmp_dir))
+                cases.update(cli_cases(n, rng, args.colors))
+                size_results = {}
+                for name, (func, inputs) in cases.items():
+                    if args.filter and args.filter not in name:
+                        continue
+                    with contextlib.redirect_stdout(devnull):
+                        func(*inputs[0])  # 预热
+                        median_ns, best_ns = measure(func, inputs, args.rounds)
+                        result_bytes, peak = allocations(func, inputs)
+                    size_results[name] = {
+                        'calls': len(inputs),
+                        'ns_per_call': round(median_ns, 1),
+                        'best_ns': round(best_ns, 1),
+                        'result_bytes': round(result_bytes, 1),
+                        'peak_kb': round(peak / 1024, 1),
+                    }
+                results[str(n)] = size_results
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return {
+        'config': {'rounds': args.rounds, 'seed': args.seed, 'colors': args.colors},
+        'environment': {'python': platform.python_version(), 'platform': platform.platform()},
+        'results': results,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """返回 [(规模, 函数, 指标, 基准值, 当前值, 变化比例)]：变慢或分配增加超过 tolerance 的项"""
+    regressions = []
+    for n, cases in baseline.get('results', {}).items():
+        for name, base in cases.items():
+            current = results['results'].get(n, {}).get(name)
+            if current is None:
+                continue
+            for metric, min_delta in (('ns_per_call', MIN_DELTA_NS), ('result_bytes', MIN_DELTA_BYTES)):
+                before, after = base[metric], current[metric]
+                if after - before < min_delta:
+                    continue
+                change = after / before - 1 if before else None
+                if change is None or change > tolerance:
+                    regressions.append((n, name, metric, before, after, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='LAN Transfer hot-path micro-benchmarks')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='以逗号分隔的合成文件与消息数量')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--filter', help='只测量名称包含该字符串的函数')
+    parser.add_argument('--colors', action='store_true', help='以彩色模式绘制 CLI 界面')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--compare', nargs='?', const=BASELINE, help='与保存的结果比较，默认 ' + BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.25, help='允许的变差比例')
+    args = parser.parse_args()
+    args.sizes = [int(size) for size in args.sizes.split(',')]
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+    results = run(args)
+
+    print('{:<10} {:<32} {:>9} {:>13} {:>13} {:>13} {:>10}'.format(
+        'size', 'function', 'calls', 'ns/call', 'best ns', 'result B', 'peak KB'))
+    for n, cases in results['results'].items():
+        for name, r in cases.items():
+            base = (baseline or {}).get('results', {}).get(n, {}).get(name)
+            change = ' {:+.0%}'.format(r['ns_per_call'] / base['ns_per_call'] - 1) if base else ''
+            print('{:<10} {:<32} {:>9} {:>13} {:>13} {:>13} {:>10}{}'.format(
+                n, name, r['calls'], r['ns_per_call'], r['best_ns'], r['result_bytes'], r['peak_kb'], change))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+
+    if baseline is None:
+        return
+    regressions = compare(results, baseline, args.tolerance)
+    if not regressions:
+        print('no regressions against {} (tolerance {:.0%})'.format(args.compare, args.tolerance))
+        return
+    print('regressions against {} (tolerance {:.0%}):'.format(args.compare, args.tolerance))
+    for n, name, metric, before, after, change in regressions:
+        print('  {:<10} {:<32} {:<13} {:>12} -> {:<12} {}'.format(
+            n, name, metric, before, after, '' if change is None else '{:+.0%}'.format(change)))
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+# 带宽整形压力测试：若干客户端持续下载大文件占满限速带宽，同时测量聊天、列表与小文件下载的延迟
+#
+#   python bench/bench_shaping.py --limit-mb 40 --bulk 4 --seconds 10
+#
+# 各批量下载客户端从不同的本机地址（127.0.0.2、127.0.0.3 ...）连接，第一个客户端的权重设为 --weight，
+# 用于观察按权重分配；中途通过 /api/admin/bandwidth 把限速减半，验证运行时调整立即生效（仅 Linux）
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+READ_SIZE = 256 * 1024
+SMALL_FILE_SIZE = 16 * 1024
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(port, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('server did not start')
+
+
+def request(port, method, path, body=None, headers=None, source='127.0.0.1'):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60, source_address=(source, 0))
+    try:
+        conn.request(method, path, body=body, headers=headers or {})
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def latency_summary(samples):
+    return {
+        'count': len(samples),
+        'p50_ms': round(percentile(samples, 50) * 1000, 1),
+        'p95_ms': round(percentile(samples, 95) * 1000, 1),
+        'p99_ms': round(percentile(samples, 99) * 1000, 1),
+    }
+
+
+class BulkClient(threading.Thread):
+    """循环下载大文件，按时间片记录收到的字节数"""
+
+    def __init__(self, port, path, source, stop):
+        super().__init__(daemon=True)
+        self.port = port
+        self.path = path
+        self.source = source
+        self.stop = stop
+        self.samples = []
+
+    def run(self):
+        while not self.stop.is_set():
+            conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60, source_address=(self.source, 0))
+            try:
+                conn.request('GET', self.path)
+                response = conn.getresponse()
+                while not self.stop.is_set():
+                    block = response.read1(READ_SIZE)
+                    if not block:
+                        break
+                    self.samples.append((time.perf_counter(), len(block)))
+            except OSError:
+                time.sleep(0.1)
+            finally:
+                conn.close()
+
+    def rate(self, start, end):
+        received = sum(size for t, size in self.samples if start <= t < end)
+        return received / (end - start)
+
+
+def probe_latency(port, seconds):
+    """依次请求聊天、文件列表与小文件下载，返回各自的耗时列表"""
+    results = {'chat': [], 'list': [], 'small_download': []}
+    deadline = time.perf_counter() + seconds
+    n = 0
+    while time.perf_counter() < deadline:
+        cases = [
+            ('chat', 'POST', '/api/messages', json.dumps({'content': 'ping {}'.format(n), 'sender': 'bench'}).encode(),
+             {'Content-Type': 'application/json'}),
+            ('list', 'GET', '/api/files/documents', None, None),
+            ('small_download', 'GET', '/api/download/documents/small.txt', None, None),
+        ]
+        for name, method, path, body, headers in cases:
+            start = time.perf_counter()
+            status, _ = request(port, method, path, body, headers)
+            if status != 200:
+                raise RuntimeError('{} {} -> {}'.format(method, path, status))
+            results[name].append(time.perf_counter() - start)
+        n += 1
+        time.sleep(0.02)
+    return results
+
+
+def set_bandwidth(port, settings):
+    status, body = request(port, 'PUT', '/api/admin/bandwidth', json.dumps(settings).encode(),
+                           {'Content-Type': 'application/json'})
+    if status != 200:
+        raise RuntimeError('admin endpoint -> {} {}'.format(status, body[:200]))
+    return json.loads(body)['bandwidth']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='LAN Transfer bandwidth shaping stress test')
+    parser.add_argument('--limit-mb', type=float, default=40, help='全局下载限速 (MB/s)')
+    parser.add_argument('--bulk', type=int, default=4, help='批量下载客户端数')
+    parser.add_argument('--weight', type=int, default=2, help='第一个批量客户端的权重')
+    parser.add_argument('--seconds', type=float, default=10, help='每个阶段的时长')
+    parser.add_argument('--backend', default='threaded', choices=('threaded', 'asyncio'))
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    limit = int(args.limit_mb * 1024 * 1024)
+    tmp_dir = tempfile.mkdtemp(prefix='lan_transfer_shaping_')
+    port = free_port()
+    proc = None
+    try:
+        folder = os.path.join(tmp_dir, 'videos')
+        os.makedirs(folder)
+        block = os.urandom(1024 * 1024)
+        with open(os.path.join(folder, 'bulk.mp4'), 'wb') as f:
+            for _ in range(256):
+                f.write(block)
+        os.makedirs(os.path.join(tmp_dir, 'documents'))
+        with open(os.path.join(tmp_dir, 'documents', 'small.txt'), 'wb') as f:
+            f.write(os.urandom(SMALL_FILE_SIZE))
+
+        proc = subprocess.Popen([
+            sys.executable, os.path.join(ROOT_DIR, 'app.py'), '--port', str(port), '--host', '0.0.0.0',
+            '--upload-folder', tmp_dir, '--backend', args.backend, '--min-free-mb', '0',
+        ], cwd=tmp_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        wait_ready(port)
+
+        results = {'backend': args.backend, 'limit_mb_s': args.limit_mb, 'bulk_clients': args.bulk}
+        results['idle_latency'] = {name: latency_summary(samples)
+                                   for name, samples in probe_latency(port, min(args.seconds, 3)).items()}
+
+        sources = ['127.0.0.{}'.format(i + 2) for i in range(args.bulk)]
+        set_bandwidth(port, {'limits': {'down': limit}, 'weights': {sources[0]: args.weight}})
+        stop = threading.Event()
+        clients = [BulkClient(port, '/api/download/videos/bulk.mp4', source, stop) for source in sources]
+        for client in clients:
+            client.start()
+        time.sleep(1)  # 等待各客户端进入稳定状态
+
+        start = time.perf_counter()
+        loaded = probe_latency(port, args.seconds)
+        end = time.perf_counter()
+        results['loaded_latency'] = {name: latency_summary(samples) for name, samples in loaded.items()}
+        rates = [client.rate(start, end) for client in clients]
+        weights = [args.weight] + [1] * (len(clients) - 1)
+        results['bulk'] = {
+            'total_mb_s': round(sum(rates) / 1024 / 1024, 2),
+            'utilization': round(sum(rates) / limit, 3),
+            'per_client_mb_s': [round(r / 1024 / 1024, 2) for r in rates],
+            'expected_share': [round(w / sum(weights), 3) for w in weights],
+            'actual_share': [round(r / sum(rates), 3) for r in rates],
+        }
+
+        # 运行时把限速减半
+        set_bandwidth(port, {'limits': {'down': limit // 2}})
+        time.sleep(1)
+        start = time.perf_counter()
+        time.sleep(args.seconds / 2)
+        end = time.perf_counter()
+        halved = sum(client.rate(start, end) for client in clients)
+        results['halved'] = {'total_mb_s': round(halved / 1024 / 1024, 2), 'utilization': round(halved / (limit // 2), 3)}
+        stop.set()
+        _, body = request(port, 'GET', '/api/admin/bandwidth')
+        results['server'] = json.loads(body)['bandwidth']
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    print('bulk: {total_mb_s} MB/s of {limit} MB/s limit (utilization {utilization})'.format(
+        limit=args.limit_mb, **results['bulk']))
+    print('  share expected {expected_share}  actual {actual_share}'.format(**results['bulk']))
+    print('after halving at runtime: {total_mb_s} MB/s (utilization {utilization})'.format(**results['halved']))
+    print('{:<16} {:>24} {:>24}'.format('request', 'idle p50/p95/p99 ms', 'loaded p50/p95/p99 ms'))
+    for name in results['idle_latency']:
+        idle, loaded = results['idle_latency'][name], results['loaded_latency'][name]
+        print('{:<16} {:>24} {:>24}'.format(
+            name, '{p50_ms}/{p95_ms}/{p99_ms}'.format(**idle), '{p50_ms}/{p95_ms}/{p99_ms}'.format(**loaded)))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
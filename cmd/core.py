@@ -1,7 +1,11 @@
 import sys
 import os
 import json
+import time
+import hashlib
 import threading
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from threading import Thread
 try:
@@ -23,6 +27,48 @@ pending_messages = []
 USE_COLORS = None
 USE_KEYBOARD = None
 
+# 分块上传配置
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+UPLOAD_RETRIES = 5
+PROGRESS_STEP = 256 * 1024
+# 上传前流式计算 SHA-256 的读取块大小
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# 消息长轮询等待秒数
+MESSAGE_WAIT = 25
+MESSAGE_HISTORY = 50
+
+# SSE 事件流读取超时（需大于服务端心跳间隔）与重连间隔
+EVENT_STREAM_TIMEOUT = 40
+EVENT_RECONNECT_DELAY = 3
+
+# 文件列表分页
+FILE_PAGE_SIZE = 50
+FILE_PAGE_SIZE_MAX = 500
+
+# 带 ETag 的 GET 响应缓存条数
+RESPONSE_CACHE_SIZE = 64
+
+# 传输列表刷新间隔（秒）
+TRANSFERS_REFRESH = 2
+
+# 性能分析（默认关闭）：设置 LAN_TRANSFER_PROFILE=<目录> 后记录慢请求、采样调用栈并比较内存快照，退出时写入该目录
+PROFILE_ENV = 'LAN_TRANSFER_PROFILE'
+SLOW_REQUEST_ENV = 'LAN_TRANSFER_SLOW_MS'
+SLOW_REQUEST_MS = 500
+PROFILE_SAMPLE_INTERVAL = 0.005
+PROFILE_MEMORY_FRAMES = 16
+PROFILE_MEMORY_TOP = 30
+
+# 分段下载配置
+DOWNLOAD_CONNECTIONS = 4
+DOWNLOAD_SEGMENT_SIZE = 8 * 1024 * 1024
+DOWNLOAD_BLOCK_SIZE = 64 * 1024
+DOWNLOAD_TIMEOUT = 30
+# 续传未缓存的打包下载时，服务端要先压缩剩余文件才能确定总大小，响应头可能很晚才到达
+ARCHIVE_RESUME_TIMEOUT = 600
+DOWNLOAD_RETRIES = 3
+
 
 # 键盘输入处理
 class KeyBoard:
@@ -160,6 +206,340 @@ class KeyBoard:
         finally:
             termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
 
+
+def file_sha256(file_path: str) -> str:
+    # 分块读取，内存占用与文件大小无关
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while True:
+            block = f.read(HASH_BLOCK_SIZE)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+#  流式请求体：按固定大小分块读取文件，内存占用与文件大小无关
+class StreamingBody:
+    def __init__(self, parts, progress_callback=None):
+        # parts 中每一项为 bytes 或 (文件路径, 偏移, 长度)
+        self.parts = parts
+        self.progress_callback = progress_callback
+        self.length = sum(len(p) if isinstance(p, bytes) else p[2] for p in parts)
+        self._part_index = 0
+        self._part_pos = 0
+        self._file = None
+        self._pending = 0
+        self._reported = 0
+        self.sent = 0
+
+    @classmethod
+    def multipart(cls, boundary: str, filename: str, file_path: str, fields: dict = None, progress_callback=None):
+        head = b''
+        if fields:
+            for key, value in fields.items():
+                head += ('--' + boundary + '\r\n').encode()
+                head += ('Content-Disposition: form-data; name="' + key + '"\r\n\r\n').encode()
+                head += (str(value) + '\r\n').encode()
+        head += ('--' + boundary + '\r\n').encode()
+        head += ('Content-Disposition: form-data; name="file"; filename="' + filename + '"\r\n').encode()
+        head += b'Content-Type: application/octet-stream\r\n\r\n'
+        tail = ('\r\n--' + boundary + '--\r\n').encode()
+        return cls([head, (file_path, 0, os.path.getsize(file_path)), tail], progress_callback)
+
+    def __len__(self):
+        return self.length
+
+    def _report_sent(self):
+        # http.client 在发送完上一块后才会再次调用 read，此时上一块已写入 socket
+        if self._pending:
+            self.sent += self._pending
+            self._pending = 0
+            if not self.progress_callback or self.length <= 0:
+                return
+            if self.sent - self._reported >= PROGRESS_STEP or self.sent == self.length:
+                self._reported = self.sent
+                self.progress_callback(self.sent, self.length)
+
+    def read(self, size: int = -1) -> bytes:
+        self._report_sent()
+        if size is None or size < 0:
+            size = self.length
+        while self._part_index < len(self.parts):
+            part = self.parts[self._part_index]
+            if isinstance(part, bytes):
+                block = part[self._part_pos:self._part_pos + size]
+            else:
+                file_path, offset, length = part
+                if self._file is None:
+                    self._file = open(file_path, 'rb')
+                    self._file.seek(offset)
+                block = self._file.read(min(size, length - self._part_pos))
+            if block:
+                self._part_pos += len(block)
+                self._pending = len(block)
+                return block
+            self._next_part()
+        return b''
+
+    def _next_part(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._part_index += 1
+        self._part_pos = 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class RemoteFileChanged(Exception):
+    pass
+
+
+#  分段下载：多连接并发拉取字节区间，写入预分配的 .part 文件，进度记录在旁路 JSON 中
+class SegmentedDownload:
+    def __init__(self, url: str, save_path: str, size: int, etag: str = '',
+                 connections: int = DOWNLOAD_CONNECTIONS, segment_size: int = DOWNLOAD_SEGMENT_SIZE,
+                 progress_callback=None, headers: dict = None, profiler=None):
+        self.url = url
+        self.save_path = save_path
+        self.part_path = save_path + '.part'
+        self.state_path = save_path + '.part.json'
+        self.size = size
+        self.etag = etag
+        self.connections = max(1, connections)
+        self.segment_size = max(DOWNLOAD_BLOCK_SIZE, segment_size)
+        self.progress_callback = progress_callback
+        self.headers = headers or {}
+        self.profiler = profiler
+        self.done = set()
+        self.downloaded = 0
+        self._reported = 0
+        self._lock = threading.Lock()
+
+    @property
+    def total_segments(self) -> int:
+        return (self.size + self.segment_size - 1) // self.segment_size
+
+    def _segment_range(self, index: int) -> tuple:
+        start = index * self.segment_size
+        return start, min(self.size, start + self.segment_size) - 1
+
+    def _load_state(self) -> bool:
+        # 仅当文件大小、ETag 与分段大小均一致时才续传
+        if not (os.path.exists(self.state_path) and os.path.exists(self.part_path)):
+            return False
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if (state.get('size') != self.size or state.get('etag') != self.etag
+                or state.get('segment_size') != self.segment_size):
+            return False
+        self.done = set(state.get('done', []))
+        return True
+
+    def _save_state(self):
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'url': self.url,
+                'size': self.size,
+                'etag': self.etag,
+                'segment_size': self.segment_size,
+                'done': sorted(self.done),
+            }, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _add_progress(self, count: int):
+        with self._lock:
+            self.downloaded += count
+            if not self.progress_callback or self.size <= 0:
+                return
+            if abs(self.downloaded - self._reported) >= PROGRESS_STEP or self.downloaded == self.size:
+                self._reported = self.downloaded
+                self.progress_callback(self.downloaded, self.size)
+
+    def _fetch_segment(self, index: int):
+        start, end = self._segment_range(index)
+        last_error = None
+        for attempt in range(DOWNLOAD_RETRIES):
+            received = 0
+            timer = self.profiler.begin('GET', self.url) if self.profiler is not None else None
+            status = 0
+            try:
+                headers = dict(self.headers)
+                headers['Range'] = 'bytes={}-{}'.format(start, end)
+                if self.etag:
+                    headers['If-Range'] = self.etag
+                req = urllib.request.Request(self.url, headers=headers, method='GET')
+                with urllib.request.urlopen(req, timeout=DOWNLOAD_TIMEOUT) as response:
+                    status = response.status
+                    if response.status != 206:
+                        raise RemoteFileChanged()
+                    with open(self.part_path, 'r+b') as f:
+                        f.seek(start)
+                        while True:
+                            if timer is not None:
+                                timer.switch('read')
+                            block = response.read(DOWNLOAD_BLOCK_SIZE)
+                            if not block:
+                                break
+                            if timer is not None:
+                                timer.switch('write')
+                            f.write(block)
+                            received += len(block)
+                            self._add_progress(len(block))
+                if timer is not None:
+                    self.profiler.end(timer, status)
+                    timer = None
+                if received != end - start + 1:
+                    raise IOError('分段数据不完整')
+                with self._lock:
+                    self.done.add(index)
+                    self._save_state()
+                return
+            except RemoteFileChanged:
+                raise
+            except Exception as e:
+                if timer is not None:
+                    self.profiler.end(timer, status)
+                # 失败的分段从头重下，先撤回已计入的进度
+                self._add_progress(-received)
+                last_error = e
+                time.sleep(min(2 ** attempt, 10))
+        raise last_error
+
+    def run(self):
+        if not self._load_state():
+            self.done = set()
+            with open(self.part_path, 'wb') as f:
+                f.truncate(self.size)
+            self._save_state()
+
+        self.downloaded = sum(self._segment_range(i)[1] - self._segment_range(i)[0] + 1 for i in self.done)
+        if self.progress_callback and self.size > 0:
+            self.progress_callback(self.downloaded, self.size)
+
+        pending = [i for i in range(self.total_segments) if i not in self.done]
+        try:
+            with ThreadPoolExecutor(max_workers=self.connections) as executor:
+                for future in [executor.submit(self._fetch_segment, i) for i in pending]:
+                    future.result()
+        except RemoteFileChanged:
+            # 已下载的分段不再可用，下次重新开始
+            for path in (self.part_path, self.state_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
+
+        os.replace(self.part_path, self.save_path)
+        os.remove(self.state_path)
+
+
+#  客户端性能分析
+class RequestTimer:
+    """单次请求的分阶段计时：wait 为发送请求到收到响应头，read 为读取响应体，
+    write 为写入本地文件，serialize 为 JSON 解析"""
+    __slots__ = ('method', 'url', 'phases', 'current', 'mark', 'start')
+
+    def __init__(self, method: str, url: str):
+        self.method = method
+        self.url = url
+        self.phases = {}
+        self.current = 'wait'
+        self.start = self.mark = time.perf_counter()
+
+    def switch(self, name: str):
+        now = time.perf_counter()
+        self.phases[self.current] = self.phases.get(self.current, 0.0) + now - self.mark
+        self.current = name
+        self.mark = now
+
+
+class ClientProfiler:
+    """慢请求记录到 slow_requests.jsonl；运行期间采样所有线程的调用栈，退出时写出折叠栈 client.collapsed
+    （flamegraph.pl / speedscope 可读取）与开始、结束两次 tracemalloc 快照的差异 memory_diff.txt"""
+
+    def __init__(self, out_dir: str, slow_ms: float = SLOW_REQUEST_MS):
+        self.out_dir = os.path.abspath(out_dir)
+        self.slow_seconds = slow_ms / 1000
+        self.stacks = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._baseline = None
+
+    @classmethod
+    def from_environ(cls, environ=None):
+        """未设置 LAN_TRANSFER_PROFILE 时返回 None"""
+        environ = os.environ if environ is None else environ
+        out_dir = environ.get(PROFILE_ENV)
+        if not out_dir:
+            return None
+        return cls(out_dir, float(environ.get(SLOW_REQUEST_ENV) or SLOW_REQUEST_MS))
+
+    def begin(self, method: str, url: str) -> RequestTimer:
+        return RequestTimer(method, url)
+
+    def end(self, timer: RequestTimer, status: int):
+        timer.switch(None)
+        elapsed = timer.mark - timer.start
+        if elapsed < self.slow_seconds:
+            return
+        entry = {
+            'time': time.time(),
+            'method': timer.method,
+            'url': timer.url,
+            'status': status,
+            'duration_ms': round(elapsed * 1000, 2),
+            'phases_ms': {name: round(value * 1000, 2) for name, value in timer.phases.items()},
+        }
+        with self._lock:
+            with open(os.path.join(self.out_dir, 'slow_requests.jsonl'), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+    def start(self):
+        os.makedirs(self.out_dir, exist_ok=True)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(PROFILE_MEMORY_FRAMES)
+        self._baseline = tracemalloc.take_snapshot()
+        self._thread = Thread(target=self._sample, name='lan-transfer-profiler', daemon=True)
+        self._thread.start()
+
+    def _sample(self):
+        me = threading.get_ident()
+        while not self._stop.wait(PROFILE_SAMPLE_INTERVAL):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                names = []
+                while frame is not None:
+                    names.append('{}:{}'.format(os.path.basename(frame.f_code.co_filename), frame.f_code.co_name))
+                    frame = frame.f_back
+                key = ';'.join(reversed(names))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        with open(os.path.join(self.out_dir, 'client.collapsed'), 'w', encoding='utf-8') as f:
+            for stack, count in sorted(self.stacks.items(), key=lambda item: -item[1]):
+                f.write('{} {}\n'.format(stack, count))
+        snapshot = tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+        tracemalloc.stop()
+        with open(os.path.join(self.out_dir, 'memory_diff.txt'), 'w', encoding='utf-8') as f:
+            for stat in snapshot.compare_to(self._baseline, 'lineno')[:PROFILE_MEMORY_TOP]:
+                f.write(str(stat) + '\n')
+
+
 #  API客户端
 class LanTransferClient:
     def __init__(self, server_ip: str, port: int = 5000):
@@ -167,51 +547,75 @@ class LanTransferClient:
         self.port = port
         self.base_url = "http://{}:{}".format(server_ip, port)
         self.sender_name = "CLI用户"
+        self.download_connections = DOWNLOAD_CONNECTIONS
+        self.download_segment_size = DOWNLOAD_SEGMENT_SIZE
+        # url -> (etag, 响应内容)，用于条件请求
+        self._response_cache = {}
+        self._cache_lock = threading.Lock()
+        # ClientProfiler，默认不开启
+        self.profiler = None
 
     def set_sender_name(self, name: str):
         self.sender_name = name
 
-    def _request(self, method: str, path: str, data: dict = None, files: tuple = None) -> dict:
+    def _request(self, method: str, path: str, data: dict = None, files: tuple = None, body=None,
+                 progress_callback=None) -> dict:
         url = self.base_url + path
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
+        timer = self.profiler.begin(method, url) if self.profiler is not None else None
+        status = 0
 
         try:
             if files:
                 boundary = '----WebKitFormBoundary' + str(datetime.now().timestamp())
-                body = b''
-                if data:
-                    for key, value in data.items():
-                        body += ('--' + boundary + '\r\n').encode()
-                        body += ('Content-Disposition: form-data; name="' + key + '"\r\n\r\n').encode()
-                        body += (value + '\r\n').encode()
-
-                filename, file_content = files
-                body += ('--' + boundary + '\r\n').encode()
-                body += ('Content-Disposition: form-data; name="file"; filename="' + filename + '"\r\n').encode()
-                body += b'Content-Type: application/octet-stream\r\n\r\n'
-                body += file_content + b'\r\n'
-                body += ('--' + boundary + '--\r\n').encode()
-
+                filename, file_path = files
+                body = StreamingBody.multipart(boundary, filename, file_path, fields=data,
+                                               progress_callback=progress_callback)
                 headers['Content-Type'] = 'multipart/form-data; boundary=' + boundary
+                headers['Content-Length'] = str(len(body))
                 req = urllib.request.Request(url, data=body, headers=headers, method='POST')
+            elif body is not None:
+                headers['Content-Type'] = 'application/octet-stream'
+                headers['Content-Length'] = str(len(body))
+                req = urllib.request.Request(url, data=body, headers=headers, method=method)
             else:
                 if data:
                     body = json.dumps(data).encode('utf-8')
                     headers['Content-Type'] = 'application/json'
                     req = urllib.request.Request(url, data=body, headers=headers, method=method)
                 else:
+                    if method == 'GET':
+                        with self._cache_lock:
+                            cached = self._response_cache.get(url)
+                        if cached:
+                            headers['If-None-Match'] = cached[0]
                     req = urllib.request.Request(url, headers=headers, method=method)
 
             with urllib.request.urlopen(req, timeout=300) as response:
+                status = response.status
+                if timer is not None:
+                    timer.switch('read')
                 content = response.read().decode('utf-8')
+                etag = response.headers.get('ETag')
+                if method == 'GET' and etag:
+                    self._cache_response(url, etag, content)
+                if timer is not None:
+                    timer.switch('serialize')
                 try:
                     return json.loads(content)
                 except json.JSONDecodeError:
                     return {'raw': content}
 
         except urllib.error.HTTPError as e:
+            status = e.code
+            if e.code == 304:
+                # 未变化：复用本地缓存的响应内容
+                with self._cache_lock:
+                    cached = self._response_cache.get(url)
+                if cached:
+                    return json.loads(cached[1])
             try:
                 error_content = e.read().decode('utf-8')
                 return json.loads(error_content)
@@ -219,8 +623,23 @@ class LanTransferClient:
                 return {'error': 'HTTP Error: ' + str(e.code)}
         except urllib.error.URLError as e:
             return {'error': '连接失败: ' + str(e.reason)}
+        except (TimeoutError, ConnectionError) as e:
+            return {'error': '连接失败: ' + str(e)}
         except Exception as e:
             return {'error': str(e)}
+        finally:
+            if isinstance(body, StreamingBody):
+                body.close()
+            if timer is not None:
+                self.profiler.end(timer, status)
+
+    def _cache_response(self, url, etag, content):
+        with self._cache_lock:
+            self._response_cache.pop(url, None)
+            self._response_cache[url] = (etag, content)
+            while len(self._response_cache) > RESPONSE_CACHE_SIZE:
+                # 按插入顺序淘汰最早的条目
+                del self._response_cache[next(iter(self._response_cache))]
 
     def _get(self, path: str) -> dict:
         return self._request('GET', path)
@@ -228,12 +647,29 @@ class LanTransferClient:
     def _post(self, path: str, data: dict = None, files: tuple = None) -> dict:
         return self._request('POST', path, data=data, files=files)
 
+    def _put(self, path: str, body) -> dict:
+        return self._request('PUT', path, body=body)
+
     def _delete(self, path: str) -> dict:
         return self._request('DELETE', path)
 
     def get_files(self, category: str) -> list:
-        result = self._get('/api/files/' + category)
-        return result.get('files', []) if isinstance(result, dict) else []
+        files = []
+        cursor = None
+        while True:
+            result = self.get_files_page(category, cursor=cursor, limit=FILE_PAGE_SIZE_MAX)
+            files.extend(result.get('files', []))
+            cursor = result.get('next_cursor')
+            if not cursor:
+                return files
+
+    def get_files_page(self, category: str, cursor: str = None, limit: int = FILE_PAGE_SIZE,
+                       sort: str = 'mtime', order: str = 'desc') -> dict:
+        query = {'limit': limit, 'sort': sort, 'order': order}
+        if cursor:
+            query['cursor'] = cursor
+        result = self._get('/api/files/' + category + '?' + urllib.parse.urlencode(query))
+        return result if isinstance(result, dict) else {}
 
     def upload_file(self, file_path: str, progress_callback=None) -> dict:
         if not os.path.exists(file_path):
@@ -241,47 +677,186 @@ class LanTransferClient:
         try:
             filename = os.path.basename(file_path)
             file_size = os.path.getsize(file_path)
+            # 同一文件再次上传时服务端会复用未完成的会话
+            fingerprint = '{}:{}:{}'.format(filename, file_size, int(os.path.getmtime(file_path)))
+
+            # 附带内容哈希，服务端已有相同内容时直接返回文件信息，不再传输
+            result = self._post('/api/uploads', data={
+                'filename': filename,
+                'size': file_size,
+                'chunk_size': UPLOAD_CHUNK_SIZE,
+                'fingerprint': fingerprint,
+                'sha256': file_sha256(file_path),
+            })
+            if result.get('error', '').startswith('HTTP Error: 404'):
+                return self._upload_file_legacy(file_path, progress_callback)
+            if result.get('deduplicated'):
+                if progress_callback and file_size > 0:
+                    progress_callback(file_size, file_size)
+                return result
+            session = result.get('session')
+            if not session:
+                return result
+
+            session_path = '/api/uploads/' + session['session_id']
+            chunk_size = session['chunk_size']
+            received = set(session['received'])
+            uploaded = session['received_bytes']
+            if progress_callback and file_size > 0:
+                progress_callback(uploaded, file_size)
+
+            for index in range(session['total_chunks']):
+                if index in received:
+                    continue
+                offset = index * chunk_size
+                length = min(chunk_size, file_size - offset)
 
-            chunks = []
-            read_bytes = 0
-            with open(file_path, 'rb') as f:
-                while True:
-                    chunk = f.read(65536)
-                    if not chunk:
-                        break
-                    chunks.append(chunk)
-                    read_bytes += len(chunk)
+                def on_sent(sent, total, base=uploaded):
                     if progress_callback and file_size > 0:
-                        progress_callback(read_bytes, file_size)
+                        progress_callback(base + sent, file_size)
 
-            file_content = b''.join(chunks)
-            result = self._post('/api/upload', files=(filename, file_content))
+                result = self._upload_chunk(session_path, index, file_path, offset, length, on_sent)
+                if not result.get('success'):
+                    return result
+                uploaded += length
+
+            result = self._post(session_path + '/commit')
             return result if isinstance(result, dict) else {'success': True}
         except Exception as e:
             return {'error': str(e)}
 
-    def download_file(self, category: str, filename: str, save_path: str = None, progress_callback=None) -> bool:
+    def _upload_chunk(self, session_path: str, index: int, file_path: str, offset: int, length: int,
+                      progress_callback=None) -> dict:
+        result = {}
+        for attempt in range(UPLOAD_RETRIES):
+            body = StreamingBody([(file_path, offset, length)], progress_callback)
+            result = self._put(session_path + '/chunks/' + str(index), body)
+            if result.get('success'):
+                return result
+            # 仅网络错误重试，服务端明确拒绝时直接返回
+            if not result.get('error', '').startswith('连接失败'):
+                return result
+            time.sleep(min(2 ** attempt, 10))
+        return result
+
+    def _upload_file_legacy(self, file_path: str, progress_callback=None) -> dict:
+        filename = os.path.basename(file_path)
+        result = self._request('POST', '/api/upload', files=(filename, file_path),
+                               progress_callback=progress_callback)
+        return result if isinstance(result, dict) else {'success': True}
+
+    def download_file(self, category: str, filename: str, save_path: str = None, progress_callback=None,
+                      connections: int = None, segment_size: int = None) -> bool:
         url = self.base_url + '/api/download/' + category + '/' + urllib.parse.quote(filename)
         try:
             save_path = save_path or filename
-            req = urllib.request.Request(url, method='GET')
-            with urllib.request.urlopen(req, timeout=60) as response:
+            req = urllib.request.Request(url, method='HEAD')
+            with urllib.request.urlopen(req, timeout=DOWNLOAD_TIMEOUT) as response:
                 total_size = int(response.headers.get('Content-Length', 0))
-                downloaded = 0
-                block_size = 8192
-                with open(save_path, 'wb') as f:
-                    while True:
-                        buffer = response.read(block_size)
-                        if not buffer:
-                            break
-                        f.write(buffer)
-                        downloaded += len(buffer)
-                        if progress_callback and total_size > 0:
-                            progress_callback(downloaded, total_size)
+                accept_ranges = response.headers.get('Accept-Ranges', '')
+                etag = response.headers.get('ETag', '')
+
+            segment_size = segment_size or self.download_segment_size
+            # 服务端不支持 Range 或文件较小时退回单连接下载
+            if 'bytes' not in accept_ranges or total_size <= segment_size:
+                return self._download_single(url, save_path, progress_callback)
+
+            SegmentedDownload(
+                url, save_path, total_size, etag,
+                connections=connections or self.download_connections,
+                segment_size=segment_size,
+                progress_callback=progress_callback,
+                profiler=self.profiler,
+            ).run()
             return True
         except Exception:
             return False
 
+    def _download_single(self, url: str, save_path: str, progress_callback=None) -> bool:
+        part_path = save_path + '.part'
+        req = urllib.request.Request(url, method='GET')
+        timer = self.profiler.begin('GET', url) if self.profiler is not None else None
+        with urllib.request.urlopen(req, timeout=DOWNLOAD_TIMEOUT) as response:
+            total_size = int(response.headers.get('Content-Length', 0))
+            with open(part_path, 'wb') as f:
+                self._copy_response(response, f, timer, 0, total_size, progress_callback)
+            if timer is not None:
+                self.profiler.end(timer, response.status)
+        os.replace(part_path, save_path)
+        return True
+
+    @staticmethod
+    def _copy_response(response, f, timer, downloaded, total_size, progress_callback=None):
+        while True:
+            if timer is not None:
+                timer.switch('read')
+            buffer = response.read(DOWNLOAD_BLOCK_SIZE)
+            if not buffer:
+                break
+            if timer is not None:
+                timer.switch('write')
+            f.write(buffer)
+            downloaded += len(buffer)
+            if progress_callback and total_size > 0:
+                progress_callback(downloaded, total_size)
+
+    def download_archive(self, category: str, save_path: str = None, progress_callback=None) -> bool:
+        """将整个分类打包为 ZIP 下载，category 为 'all' 时包含全部分类"""
+        url = self.base_url + '/api/archive?' + urllib.parse.urlencode({'category': category})
+        try:
+            save_path = save_path or category + '.zip'
+            req = urllib.request.Request(url, method='HEAD')
+            with urllib.request.urlopen(req, timeout=DOWNLOAD_TIMEOUT) as response:
+                total_size = int(response.headers.get('Content-Length', 0))
+                etag = response.headers.get('ETag', '')
+
+            # 归档大小已知（已缓存或只含不压缩的分类）时分段并发下载，否则单连接下载并可从断点继续
+            if total_size > self.download_segment_size:
+                SegmentedDownload(
+                    url, save_path, total_size, etag,
+                    connections=self.download_connections,
+                    segment_size=self.download_segment_size,
+                    progress_callback=progress_callback,
+                    profiler=self.profiler,
+                ).run()
+                return True
+            return self._download_continue(url, save_path, etag, progress_callback)
+        except Exception:
+            return False
+
+    def _download_continue(self, url: str, save_path: str, etag: str, progress_callback=None) -> bool:
+        # 中断后保留 .part，下次凭 ETag 用 Range 从末尾继续；服务端内容变化时返回 200 重新下载
+        part_path = save_path + '.part'
+        state_path = save_path + '.part.json'
+        offset = 0
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                if etag and json.load(f).get('etag') == etag:
+                    offset = os.path.getsize(part_path)
+        except (OSError, ValueError):
+            pass
+        with open(state_path, 'w', encoding='utf-8') as f:
+            json.dump({'etag': etag}, f)
+
+        req = urllib.request.Request(url, method='GET')
+        if offset:
+            req.add_header('Range', 'bytes={}-'.format(offset))
+            req.add_header('If-Range', etag)
+        timer = self.profiler.begin('GET', url) if self.profiler is not None else None
+        with urllib.request.urlopen(req, timeout=ARCHIVE_RESUME_TIMEOUT if offset else DOWNLOAD_TIMEOUT) as response:
+            if response.status == 206:
+                total_size = int(response.headers.get('Content-Range', '').rpartition('/')[2] or 0)
+            else:
+                offset = 0
+                total_size = int(response.headers.get('Content-Length', 0))
+            with open(part_path, 'ab' if offset else 'wb') as f:
+                self._copy_response(response, f, timer, offset, total_size, progress_callback)
+            if timer is not None:
+                self.profiler.end(timer, response.status)
+        os.replace(part_path, save_path)
+        os.remove(state_path)
+        return True
+
     def delete_file(self, category: str, filename: str) -> dict:
         return self._delete('/api/delete/' + category + '/' + urllib.parse.quote(filename))
 
@@ -289,10 +864,28 @@ class LanTransferClient:
         result = self._get('/api/messages')
         return result.get('messages', []) if isinstance(result, dict) else []
 
+    def poll_messages(self, since: int, wait: float = MESSAGE_WAIT) -> dict:
+        # 长轮询：服务端在有新消息或超时后才返回
+        query = urllib.parse.urlencode({'since': since, 'wait': wait})
+        result = self._get('/api/messages?' + query)
+        return result if isinstance(result, dict) else {}
+
+    def open_event_stream(self, last_event_id=None):
+        """订阅 /api/events，服务端不支持时抛出 urllib.error.HTTPError"""
+        headers = {'Accept': 'text/event-stream'}
+        if last_event_id is not None:
+            headers['Last-Event-ID'] = str(last_event_id)
+        req = urllib.request.Request(self.base_url + '/api/events', headers=headers)
+        return urllib.request.urlopen(req, timeout=EVENT_STREAM_TIMEOUT)
+
     def send_message(self, content: str) -> dict:
         data = {'content': content, 'sender': self.sender_name}
         return self._post('/api/messages', data=data)
 
+    def get_transfers(self) -> dict:
+        result = self._get('/api/transfers')
+        return result if isinstance(result, dict) else {}
+
 #  颜色定义
 class Colors:
     BLACK = '\033[30m'
@@ -388,28 +981,119 @@ def draw_line(char: str = '─', length: int = 50, color: str = ''):
         print(line)
 
 #  消息轮询
+def iter_events(response):
+    """逐个解析 SSE 事件，返回 (id, event, data)；心跳注释与 retry 行被忽略"""
+    event_id, event_type, data = None, 'message', []
+    for raw in response:
+        line = raw.decode('utf-8').rstrip('\r\n')
+        if not line:
+            if data:
+                yield event_id, event_type, '\n'.join(data)
+            event_type, data = 'message', []
+            continue
+        if line.startswith(':'):
+            continue
+        field, _, value = line.partition(':')
+        value = value[1:] if value.startswith(' ') else value
+        if field == 'id':
+            event_id = value
+        elif field == 'event':
+            event_type = value
+        elif field == 'data':
+            data.append(value)
+
+
+def _push_messages(messages):
+    global latest_messages
+    with message_lock:
+        latest_messages = (latest_messages + messages)[-MESSAGE_HISTORY:]
+        pending_messages.extend(messages)
+    new_message_event.set()
+
+
+def _reset_messages(client):
+    global latest_messages
+    result = client._get('/api/messages')
+    if 'messages' not in result:
+        return None
+    with message_lock:
+        latest_messages = result['messages']
+    return result.get('last_id', result['messages'][-1].get('id', 0) if result['messages'] else 0)
+
+
+def event_stream_worker(client: LanTransferClient) -> bool:
+    """通过 SSE 接收新消息；服务端没有 /api/events 时返回 False"""
+    last_event_id = None
+    last_id = None
+
+    while not stop_event.is_set():
+        try:
+            with client.open_event_stream(last_event_id) as response:
+                # 先建立订阅再取基线，两者之间到达的消息由 id 去重
+                if last_id is None:
+                    last_id = _reset_messages(client)
+                    if last_id is None:
+                        raise ConnectionError()
+                for event_id, event_type, data in iter_events(response):
+                    if event_id is not None:
+                        last_event_id = event_id
+                    if event_type == 'chat':
+                        message = json.loads(data)
+                        if message.get('id', 0) > last_id:
+                            last_id = message.get('id', 0)
+                            _push_messages([message])
+                    elif event_type == 'reset':
+                        # 断线期间的事件已无法补发，重新取一次完整列表
+                        last_id = _reset_messages(client)
+                        if last_id is None:
+                            raise ConnectionError()
+                    if stop_event.is_set():
+                        return True
+        except urllib.error.HTTPError as e:
+            if e.code in (404, 405):
+                return False
+            stop_event.wait(EVENT_RECONNECT_DELAY)
+        except Exception:
+            stop_event.wait(EVENT_RECONNECT_DELAY)
+    return True
+
+
 def message_polling_worker(client: LanTransferClient, interval: float = 0.3):
-    global latest_messages, pending_messages
-    last_id = 0
+    # 优先使用 SSE 推送，旧版服务端退回长轮询
+    if event_stream_worker(client):
+        return
+    long_poll_worker(client, interval)
+
+
+def long_poll_worker(client: LanTransferClient, interval: float = 0.3):
+    global latest_messages
+    last_id = None
 
     while not stop_event.is_set():
         try:
-            messages = client.get_messages()
-            if messages:
-                new_last_id = messages[-1].get('id', 0)
-                if new_last_id != last_id and last_id != 0:
-                    new_msgs = [m for m in messages if m.get('id', 0) > last_id]
-                    with message_lock:
-                        latest_messages = messages
-                        pending_messages.extend(new_msgs)
-                    new_message_event.set()
-                else:
-                    with message_lock:
-                        latest_messages = messages
-                last_id = new_last_id
+            if last_id is None:
+                result = client._get('/api/messages')
+            else:
+                result = client.poll_messages(last_id)
+            if 'messages' not in result:
+                # 连接失败时稍后重试
+                stop_event.wait(max(interval, 3))
+                continue
+
+            messages = result['messages']
+            if last_id is not None and not result.get('reset'):
+                messages = [m for m in messages if m.get('id', 0) > last_id]
+            if last_id is None or result.get('reset'):
+                with message_lock:
+                    latest_messages = messages
+            elif messages:
+                _push_messages(messages)
+            last_id = result.get('last_id', messages[-1].get('id', 0) if messages else last_id or 0)
+            if 'last_id' not in result:
+                # 旧版服务端不支持长轮询，退回定时轮询
+                stop_event.wait(interval)
         except Exception:
-            pass
-        stop_event.wait(interval)
+            stop_event.wait(interval)
 
 class MessageNotifier:
     @staticmethod
@@ -450,3 +1134,30 @@ class SelectableList:
         self.multi_select = multi_select
         self.selected_index = 0
         self.selections = set() if multi_select else None
+
+
+# 分页加载文件列表，选择项接近末尾时再拉取下一页
+class FilePager:
+    def __init__(self, client: LanTransferClient, category: str, page_size: int = FILE_PAGE_SIZE):
+        self.client = client
+        self.category = category
+        self.page_size = page_size
+        self.files = []
+        self.total = 0
+        self.cursor = None
+        self.has_more = True
+
+    def load_more(self) -> bool:
+        if not self.has_more:
+            return False
+        result = self.client.get_files_page(self.category, cursor=self.cursor, limit=self.page_size)
+        if 'files' not in result:
+            return False
+        self.files.extend(result['files'])
+        self.total = result.get('total', len(self.files))
+        self.cursor = result.get('next_cursor')
+        self.has_more = bool(self.cursor)
+        return True
+
+    def should_load(self, selected_index: int, margin: int = 3) -> bool:
+        return self.has_more and selected_index >= len(self.files) - margin
@@ -12,7 +12,7 @@ else:
 if base_path not in sys.path:
     sys.path.insert(0, base_path)
 
-from core import LanTransferClient, init_colors
+from core import LanTransferClient, ClientProfiler, init_colors
 from ui import CLIInterface
 
 
@@ -20,6 +20,8 @@ def main():
     # 初始化颜色支持
     from core import USE_COLORS, Colors
     init_colors()
+    # 性能分析：在切换到下载目录之前解析输出目录
+    profiler = ClientProfiler.from_environ()
 
     # 创建downloads文件夹
     download_dir = os.path.join(os.path.dirname(__file__), 'downloads')
@@ -74,7 +76,15 @@ def main():
         input('按回车退出...')
         return
 
-    interface.main_menu()
+    if profiler is not None:
+        client.profiler = profiler
+        profiler.start()
+    try:
+        interface.main_menu()
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            print(Colors.info('性能分析结果已写入 ' + profiler.out_dir))
 
 if __name__ == '__main__':
     main()
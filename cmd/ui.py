@@ -1,10 +1,11 @@
 import sys
 import os
+import time
 from core import (
     LanTransferClient, KeyBoard, format_time, clear_screen, draw_line,
-    message_polling_worker, MessageNotifier, SelectableList,
+    message_polling_worker, MessageNotifier, SelectableList, FilePager,
     Colors, USE_COLORS, USE_KEYBOARD, latest_messages, message_lock,
-    new_message_event, stop_event, Thread
+    new_message_event, stop_event, Thread, TRANSFERS_REFRESH
 )
 
 # 界面类
@@ -32,6 +33,7 @@ class CLIInterface:
             ('upload', '⬆️ 上传文件', '上传文件'),
             ('download', '⬇️ 下载文件', '下载文件'),
             ('delete', '🗑️ 删除文件', '删除文件'),
+            ('transfers', '📡 查看传输', '查看传输'),
             ('chat', '💬 消息频道', '进入聊天'),
             ('username', '👤 设置用户名', '设置用户名'),
             ('exit', '❌ 退出', '退出'),
@@ -344,6 +346,8 @@ class CLIInterface:
             self._download_file()
         elif action == 'delete':
             self._delete_file()
+        elif action == 'transfers':
+            self._show_transfers()
         elif action == 'username':
             self._set_username()
 
@@ -402,7 +406,9 @@ class CLIInterface:
         print(Colors.info(' ↑↓ 选择  |  ↵ 确定  |  Esc 返回 '))
 
     def _show_category_files(self, category):
-        files = self.client.get_files(category)
+        pager = FilePager(self.client, category)
+        pager.load_more()
+        files = pager.files
         cat_name = self.category_names.get(category, category)
         cat_icon = self.category_icons.get(category, '📁')
         if not files:
@@ -418,8 +424,7 @@ class CLIInterface:
             print(Colors.info(' 按任意键返回... '))
             KeyBoard.get_key()
             return
-        file_list = [(f['name'], f'{f["name"]} ({f["size"]})') for f in files]
-        file_list.append(('back', '🔙 返回'))
+        file_list = self._file_items(pager)
         selector = SelectableList(file_list, title=f'{cat_icon} {cat_name}')
         self._render_file_list(selector, category)
         last_index = selector.selected_index
@@ -434,10 +439,19 @@ class CLIInterface:
                 selector.selected_index = max(0, selector.selected_index - 1)
             elif key == 'DOWN':
                 selector.selected_index = min(len(selector.items) - 1, selector.selected_index + 1)
+                if pager.should_load(selector.selected_index) and pager.load_more():
+                    selector.items = self._file_items(pager)
+                    last_index = -1
             elif key == 'ENTER':
                 value = selector.items[selector.selected_index][0]
                 if value == 'back':
                     return
+                if value == 'more':
+                    if pager.load_more():
+                        selector.items = self._file_items(pager)
+                    self._render_file_list(selector, category)
+                    last_index = selector.selected_index
+                    continue
                 self._show_file_detail(category, value)
                 selector.selected_index = 0
                 self._render_file_list(selector, category)
@@ -448,6 +462,16 @@ class CLIInterface:
                 self._render_file_list(selector, category)
                 last_index = selector.selected_index
 
+    def _file_items(self, pager, show_size=True):
+        if show_size:
+            items = [(f['name'], f'{f["name"]} ({f["size"]})') for f in pager.files]
+        else:
+            items = [(f['name'], f'{f["name"]}') for f in pager.files]
+        if pager.has_more:
+            items.append(('more', f'⏬ 已加载 {len(pager.files)} / 共 {pager.total} 个，继续向下加载'))
+        items.append(('back', '🔙 返回'))
+        return items
+
     def _render_file_list(self, selector, category):
         self.print_banner()
         print()
@@ -594,8 +618,14 @@ class CLIInterface:
         print()
         print(Colors.info(' ↑↓ 选择  |  ↵ 确定  |  Esc 返回 '))
 
+    def _download_items(self, pager):
+        # 第一项为整个分类打包下载
+        return [('archive', '📦 打包下载整个分类 (ZIP)')] + self._file_items(pager)
+
     def _download_from_category(self, category):
-        files = self.client.get_files(category)
+        pager = FilePager(self.client, category)
+        pager.load_more()
+        files = pager.files
         cat_name = self.category_names.get(category, category)
         cat_icon = self.category_icons.get(category, '📁')
         if not files:
@@ -611,8 +641,7 @@ class CLIInterface:
             print(Colors.info(' 按任意键返回... '))
             KeyBoard.get_key()
             return
-        file_list = [(f['name'], f'{f["name"]} ({f["size"]})') for f in files]
-        file_list.append(('back', '🔙 返回'))
+        file_list = self._download_items(pager)
         selector = SelectableList(file_list, title="📥 选择文件")
         self._render_download_file_select(selector, category)
         last_index = selector.selected_index
@@ -627,11 +656,23 @@ class CLIInterface:
                 selector.selected_index = max(0, selector.selected_index - 1)
             elif key == 'DOWN':
                 selector.selected_index = min(len(selector.items) - 1, selector.selected_index + 1)
+                if pager.should_load(selector.selected_index) and pager.load_more():
+                    selector.items = self._download_items(pager)
+                    last_index = -1
             elif key == 'ENTER':
                 value = selector.items[selector.selected_index][0]
                 if value == 'back':
                     return
-                self._confirm_download(category, value)
+                if value == 'more':
+                    if pager.load_more():
+                        selector.items = self._download_items(pager)
+                    self._render_download_file_select(selector, category)
+                    last_index = selector.selected_index
+                    continue
+                if value == 'archive':
+                    self._confirm_download(category, cat_name + '.zip', archive=True)
+                else:
+                    self._confirm_download(category, value)
                 selector.selected_index = 0
                 self._render_download_file_select(selector, category)
                 last_index = 0
@@ -664,7 +705,7 @@ class CLIInterface:
         print()
         print(Colors.info(' ↑↓ 选择  |  ↵ 确定  |  Esc 返回 '))
 
-    def _confirm_download(self, category, filename):
+    def _confirm_download(self, category, filename, archive=False):
         self.print_banner()
         print()
         print(Colors.header(' 📥 确认下载 '))
@@ -701,7 +742,11 @@ class CLIInterface:
                             progress = f'  [{bar}] {percent:3d}% {self._format_size(downloaded)} / {self._format_size(total)}'
                         sys.stdout.write(f'\r{progress}')
                         sys.stdout.flush()
-                    if self.client.download_file(category, filename, progress_callback=show_progress):
+                    if archive:
+                        ok = self.client.download_archive(category, filename, progress_callback=show_progress)
+                    else:
+                        ok = self.client.download_file(category, filename, progress_callback=show_progress)
+                    if ok:
                         sys.stdout.write('\r' + ' ' * 60 + '\r')
                         sys.stdout.flush()
                         print()
@@ -718,6 +763,51 @@ class CLIInterface:
                 self._render_confirm(selector)
                 last_index = selector.selected_index
 
+    # 服务端进行中的传输，定时刷新，按任意键返回
+    def _show_transfers(self):
+        data = self.client.get_transfers()
+        self._render_transfers(data)
+        next_refresh = time.time() + TRANSFERS_REFRESH
+        while True:
+            if KeyBoard.get_key():
+                return
+            if time.time() >= next_refresh:
+                data = self.client.get_transfers()
+                self._render_transfers(data)
+                next_refresh = time.time() + TRANSFERS_REFRESH
+
+    def _render_transfers(self, data):
+        self.print_banner()
+        print()
+        print(Colors.header(' 📡 进行中的传输 '))
+        draw_line('─', 50, Colors.BRIGHT_BLUE)
+        transfers = data.get('transfers', [])
+        if 'error' in data:
+            print(Colors.error(f'   {data["error"]}'))
+        elif not transfers:
+            print(Colors.warning('   当前没有进行中的传输'))
+        else:
+            active, rate = data.get('active', {}), data.get('rate', {})
+            print(Colors.info(f'   上传 {active.get("up", 0)} 个 {self._format_size(rate.get("up", 0))}/s  |  '
+                              f'下载 {active.get("down", 0)} 个 {self._format_size(rate.get("down", 0))}/s'))
+            draw_line('─', 50, Colors.BRIGHT_BLUE)
+            for t in transfers:
+                arrow = '↑' if t.get('direction') == 'up' else '↓'
+                name = t.get('name') or '(解析中)'
+                print(f' {arrow} {Colors.highlight(name[:36])}  {t.get("client", "")}')
+                done = self._format_size(t.get('bytes', 0))
+                if t.get('size'):
+                    done += f' / {self._format_size(t["size"])} ({t["bytes"] * 100 // t["size"]}%)'
+                eta = f'  剩余 {t["eta"]:.0f}s' if t.get('eta') is not None else ''
+                line = f'   {done}  {self._format_size(t.get("rate", 0))}/s' \
+                       f' (平均 {self._format_size(t.get("average_rate", 0))}/s){eta}'
+                # 已开始一段时间但没有进展的传输标红
+                print(Colors.error(line) if t.get('rate') == 0 and t.get('elapsed', 0) > 5 else line)
+        draw_line('─', 50, Colors.BRIGHT_BLUE)
+        print()
+        print(Colors.info(f' 每 {TRANSFERS_REFRESH} 秒刷新  |  按任意键返回 '))
+        sys.stdout.flush()
+
     # 格式化文件大小
     def _format_size(self, size: int) -> str:
         for unit in ['B', 'KB', 'MB', 'GB']:
@@ -807,7 +897,9 @@ class CLIInterface:
         print(Colors.info(' ↑↓ 选择  |  ↵ 确定  |  Esc 返回 '))
 
     def _delete_from_category(self, category):
-        files = self.client.get_files(category)
+        pager = FilePager(self.client, category)
+        pager.load_more()
+        files = pager.files
         cat_name = self.category_names.get(category, category)
         cat_icon = self.category_icons.get(category, '📁')
         if not files:
@@ -823,8 +915,7 @@ class CLIInterface:
             print(Colors.info(' 按任意键返回... '))
             KeyBoard.get_key()
             return
-        file_list = [(f['name'], f'{f["name"]}') for f in files]
-        file_list.append(('back', '🔙 返回'))
+        file_list = self._file_items(pager, show_size=False)
         selector = SelectableList(file_list, title="🗑️ 选择文件")
         self._render_delete_file_select(selector, category)
         last_index = selector.selected_index
@@ -839,10 +930,19 @@ class CLIInterface:
                 selector.selected_index = max(0, selector.selected_index - 1)
             elif key == 'DOWN':
                 selector.selected_index = min(len(selector.items) - 1, selector.selected_index + 1)
+                if pager.should_load(selector.selected_index) and pager.load_more():
+                    selector.items = self._file_items(pager, show_size=False)
+                    last_index = -1
             elif key == 'ENTER':
                 value = selector.items[selector.selected_index][0]
                 if value == 'back':
                     return
+                if value == 'more':
+                    if pager.load_more():
+                        selector.items = self._file_items(pager, show_size=False)
+                    self._render_delete_file_select(selector, category)
+                    last_index = selector.selected_index
+                    continue
                 self._confirm_delete(category, value)
                 selector.selected_index = 0
                 self._render_delete_file_select(selector, category)
@@ -0,0 +1,5 @@
+"""LAN Transfer 服务端组件"""
+
+from .upload_sessions import UploadSessionStore, UploadSessionError
+
+__all__ = ['UploadSessionStore', 'UploadSessionError']
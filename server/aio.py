@@ -0,0 +1,493 @@
+import io
+import sys
+import signal
+import asyncio
+import tempfile
+import traceback
+import urllib.parse
+from http import HTTPStatus
+from email.utils import formatdate
+from concurrent.futures import ThreadPoolExecutor
+
+from .events import EventStream, HEARTBEAT
+from .ranges import FileRangeStream
+from .shaping import ShapedStream, SHAPED_ENVIRON_KEY, UPLOAD_ENVIRON_KEY
+from .metrics import LONG_POLLS_GAUGE
+
+# asyncio 服务端配置
+MAX_HEADER_SIZE = 64 * 1024
+BODY_MEMORY_LIMIT = 1024 * 1024  # 请求体超过该大小时写入临时文件
+BODY_READ_SIZE = 256 * 1024
+LONG_POLL_PATH = '/api/messages'
+
+_END = object()
+
+
+class BadRequest(Exception):
+    def __init__(self, status):
+        super().__init__(status)
+        self.status = status
+
+
+def _status_line(status):
+    try:
+        return '{} {}'.format(status, HTTPStatus(status).phrase)
+    except ValueError:
+        return str(status)
+
+
+def parse_request_head(head):
+    """解析请求行与请求头，返回 (method, target, version, headers)"""
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, version = lines[0].split(' ', 2)
+    except ValueError:
+        raise BadRequest(400)
+    if not version.startswith('HTTP/1.'):
+        raise BadRequest(505)
+    headers = []
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, sep, value = line.partition(':')
+        if not sep or not name or name != name.strip():
+            raise BadRequest(400)
+        headers.append((name.strip(), value.strip()))
+    return method, target, version, headers
+
+
+# asyncio 服务端：路由仍由 Flask 应用处理（在有界线程池中执行），
+# 连接读写、请求体接收、SSE 推送、长轮询等待与文件发送均在事件循环中非阻塞完成
+class AsyncWSGIServer:
+    def __init__(self, app, host, port, workers=64, backlog=1024, keepalive_timeout=5.0, request_timeout=60.0,
+                 max_body=None, message_store=None, max_message_wait=30, shaper=None, metrics=None):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.backlog = backlog
+        self.keepalive_timeout = keepalive_timeout
+        self.request_timeout = request_timeout
+        self.max_body = max_body
+        self.message_store = message_store
+        self.max_message_wait = max_message_wait
+        self.shaper = shaper
+        self.metrics = metrics
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='aio-worker')
+        self.draining = False
+        self.active = 0
+        self._idle = {}
+        self._server = None
+        self._loop = None
+        self._messages_changed = None
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        if self.message_store is not None:
+            self._messages_changed = asyncio.Event()
+            self.message_store.add_listener(self._on_message)
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port,
+                                                  backlog=self.backlog, limit=MAX_HEADER_SIZE)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    def _on_message(self, message):
+        # 在发送消息的线程中调用，转交事件循环唤醒等待中的长轮询
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wake_long_polls)
+
+    def _wake_long_polls(self):
+        self._messages_changed.set()
+        self._messages_changed = asyncio.Event()
+
+    async def _handle_connection(self, reader, writer):
+        first = True
+        try:
+            while not self.draining:
+                self._idle[writer] = True
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'),
+                                                  self.request_timeout if first else self.keepalive_timeout)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError,
+                        ConnectionError, ValueError):
+                    break
+                finally:
+                    self._idle.pop(writer, None)
+                first = False
+                self.active += 1
+                try:
+                    keep_alive = await self._handle_request(head, reader, writer)
+                finally:
+                    self.active -= 1
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            pass
+        except Exception:
+            traceback.print_exc()
+        finally:
+            self._idle.pop(writer, None)
+            writer.close()
+
+    async def _send_simple(self, writer, status, keep_alive=False):
+        body = _status_line(status).encode('latin-1')
+        head = 'HTTP/1.1 {}\r\nContent-Type: text/plain\r\nContent-Length: {}\r\n{}\r\n'.format(
+            _status_line(status), len(body), '' if keep_alive else 'Connection: close\r\n')
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+        return keep_alive
+
+    async def _handle_request(self, head, reader, writer):
+        try:
+            method, target, version, headers = parse_request_head(head)
+        except BadRequest as e:
+            return await self._send_simple(writer, e.status)
+
+        header_map = {}
+        for name, value in headers:
+            key = name.lower()
+            header_map[key] = header_map[key] + ',' + value if key in header_map else value
+        connection = header_map.get('connection', '').lower()
+        keep_alive = version == 'HTTP/1.1' and 'close' not in connection
+
+        if 'chunked' in header_map.get('transfer-encoding', '').lower():
+            # 浏览器与 CLI 上传均带 Content-Length
+            return await self._send_simple(writer, 411)
+        try:
+            length = int(header_map.get('content-length') or 0)
+        except ValueError:
+            return await self._send_simple(writer, 400)
+        if length < 0:
+            return await self._send_simple(writer, 400)
+        if self.max_body is not None and length > self.max_body:
+            return await self._send_simple(writer, 413)
+        if length and header_map.get('expect', '').lower() == '100-continue':
+            writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+
+        # 大请求体在接收时限速，传输对象交给应用标记分类，响应结束后关闭
+        transfer = None
+        if self.shaper is not None and length > BODY_MEMORY_LIMIT:
+            peer = writer.get_extra_info('peername') or ('',)
+            transfer = self.shaper.open(peer[0], 'up', name=target.partition('?')[0])
+            transfer.size = length
+        try:
+            body = await self._read_body(reader, length, transfer)
+        except BaseException:
+            if transfer is not None:
+                transfer.close()
+            raise
+        try:
+            path, _, query = target.partition('?')
+            if method == 'GET' and path == LONG_POLL_PATH and self.message_store is not None:
+                query = await self._long_poll(query)
+            environ = self._environ(method, target, path, query, version, headers, header_map, body, length, writer)
+            if transfer is not None:
+                environ[SHAPED_ENVIRON_KEY] = True
+                environ[UPLOAD_ENVIRON_KEY] = transfer
+            status, response_headers, app_iter = await self._loop.run_in_executor(
+                self.executor, self._call_app, environ)
+            return await self._send_response(writer, method, version, keep_alive, status, response_headers, app_iter)
+        finally:
+            body.close()
+            if transfer is not None:
+                transfer.close()
+
+    async def _read_body(self, reader, length, transfer=None):
+        if length <= BODY_MEMORY_LIMIT:
+            data = await asyncio.wait_for(reader.readexactly(length), self.request_timeout) if length else b''
+            return io.BytesIO(data)
+        # 大请求体边收边写入临时文件，慢速上传不会占用工作线程；上传限速也在这里进行
+        spool = tempfile.TemporaryFile()
+        try:
+            remaining = length
+            while remaining > 0:
+                size = min(BODY_READ_SIZE, remaining)
+                if transfer is not None:
+                    size, delay = transfer.grant(size)
+                    if delay:
+                        await asyncio.sleep(delay)
+                block = await asyncio.wait_for(reader.read(size), self.request_timeout)
+                if not block:
+                    raise ConnectionError('client disconnected')
+                if transfer is not None:
+                    # 已到达的数据可能少于预约数
+                    transfer.bytes -= size - len(block)
+                remaining -= len(block)
+                await self._loop.run_in_executor(self.executor, spool.write, block)
+            spool.seek(0)
+        except BaseException:
+            spool.close()
+            raise
+        return spool
+
+    async def _long_poll(self, query):
+        """在事件循环中等待新消息，再以 wait=0 交给 Flask 路由生成响应"""
+        params = urllib.parse.parse_qsl(query, keep_blank_values=True)
+        args = dict(params)
+        try:
+            since = int(args['since'])
+            wait = min(float(args.get('wait', 0)), self.max_message_wait)
+        except (KeyError, ValueError):
+            return query
+        if wait <= 0:
+            return query
+        if self.metrics is not None:
+            self.metrics.inc(LONG_POLLS_GAUGE)
+        try:
+            deadline = self._loop.time() + wait
+            while self.message_store.last_id <= since and not self.draining:
+                remaining = deadline - self._loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(self._messages_changed.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+        finally:
+            if self.metrics is not None:
+                self.metrics.inc(LONG_POLLS_GAUGE, value=-1)
+        return urllib.parse.urlencode([(k, '0' if k == 'wait' else v) for k, v in params])
+
+    def _environ(self, method, target, path, query, version, headers, header_map, body, length, writer):
+        peer = writer.get_extra_info('peername') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': urllib.parse.unquote_to_bytes(path).decode('latin-1'),
+            'QUERY_STRING': query,
+            'REQUEST_URI': target,
+            'RAW_URI': target,
+            'SERVER_NAME': self.host,
+            'SERVER_PORT': str(self.port),
+            'SERVER_PROTOCOL': version,
+            'REMOTE_ADDR': peer[0],
+            'REMOTE_PORT': str(peer[1]) if len(peer) > 1 else '',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': body,
+            'wsgi.input_terminated': True,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        if 'content-type' in header_map:
+            environ['CONTENT_TYPE'] = header_map['content-type']
+        if length:
+            environ['CONTENT_LENGTH'] = str(length)
+        for name, value in header_map.items():
+            if name in ('content-type', 'content-length'):
+                continue
+            environ['HTTP_' + name.upper().replace('-', '_')] = value
+        return environ
+
+    def _call_app(self, environ):
+        state = {}
+
+        def start_response(status, response_headers, exc_info=None):
+            state['status'] = status
+            state['headers'] = response_headers
+
+        app_iter = self.app(environ, start_response)
+        if 'status' not in state:
+            # 少数应用在首次迭代时才调用 start_response
+            iterator = iter(app_iter)
+            first = next(iterator, b'')
+            app_iter = _Prepended(first, iterator, app_iter)
+        return state['status'], state['headers'], app_iter
+
+    async def _send_response(self, writer, method, version, keep_alive, status, headers, app_iter):
+        try:
+            code = int(status.split(' ', 1)[0])
+            has_body = method != 'HEAD' and code not in (204, 304) and not 100 <= code < 200
+            names = {name.lower() for name, _ in headers}
+            chunked = has_body and 'content-length' not in names and version == 'HTTP/1.1'
+            if has_body and 'content-length' not in names and not chunked:
+                keep_alive = False
+            if self.draining:
+                keep_alive = False
+
+            lines = ['HTTP/1.1 ' + status]
+            lines.extend('{}: {}'.format(name, value) for name, value in headers)
+            if 'date' not in names:
+                lines.append('Date: ' + formatdate(usegmt=True))
+            if chunked:
+                lines.append('Transfer-Encoding: chunked')
+            if not keep_alive:
+                lines.append('Connection: close')
+            writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+
+            if has_body:
+                if isinstance(app_iter, FileRangeStream):
+                    await self._send_file(writer, app_iter)
+                elif isinstance(app_iter, EventStream):
+                    await self._send_events(writer, app_iter, chunked)
+                elif isinstance(app_iter, ShapedStream):
+                    await self._send_iter(writer, app_iter.iterable, chunked, app_iter.transfer)
+                else:
+                    await self._send_iter(writer, app_iter, chunked)
+                if chunked:
+                    writer.write(b'0\r\n\r\n')
+            await writer.drain()
+            return keep_alive
+        finally:
+            close = getattr(app_iter, 'close', None)
+            if close is not None:
+                await self._loop.run_in_executor(self.executor, close)
+
+    @staticmethod
+    def _write(writer, data, chunked):
+        if not data:
+            return
+        if chunked:
+            writer.write(b'%x\r\n' % len(data) + data + b'\r\n')
+        else:
+            writer.write(data)
+
+    async def _send_iter(self, writer, app_iter, chunked, transfer=None):
+        # 普通响应体的迭代可能涉及磁盘读取或压缩，放到线程池中执行；限速等待在事件循环中进行
+        iterator = iter(app_iter)
+        while True:
+            data = await self._loop.run_in_executor(self.executor, next, iterator, _END)
+            if data is _END:
+                return
+            if transfer is None:
+                self._write(writer, data, chunked)
+                await writer.drain()
+                continue
+            view = memoryview(data)
+            while view:
+                size, delay = transfer.grant(len(view))
+                if delay:
+                    await asyncio.sleep(delay)
+                self._write(writer, view[:size].tobytes(), chunked)
+                await writer.drain()
+                view = view[size:]
+
+    async def _send_file(self, writer, stream):
+        # 文件片段通过 loop.sendfile 发送：可用时为非阻塞 os.sendfile，否则在线程池中分块读取
+        f = await self._loop.run_in_executor(self.executor, open, stream.path, 'rb')
+        try:
+            await writer.drain()
+            for segment in stream.segments:
+                if isinstance(segment, bytes):
+                    writer.write(segment)
+                    await writer.drain()
+                else:
+                    offset, count = segment
+                    if stream.transfer is None:
+                        await self._loop.sendfile(writer.transport, f, offset, count)
+                        continue
+                    while count > 0:
+                        size, delay = stream.transfer.grant(count)
+                        if delay:
+                            await asyncio.sleep(delay)
+                        await self._loop.sendfile(writer.transport, f, offset, size)
+                        offset += size
+                        count -= size
+        finally:
+            f.close()
+
+    async def _send_events(self, writer, stream, chunked):
+        subscriber = stream.subscriber
+        ready = asyncio.Event()
+        loop = self._loop
+        subscriber.waker = lambda: loop.call_soon_threadsafe(ready.set)
+        try:
+            self._write(writer, stream.preamble, chunked)
+            await writer.drain()
+            while not subscriber.evicted and not self.draining:
+                ready.clear()
+                event = subscriber.get(0)
+                if event is not None:
+                    self._write(writer, event, chunked)
+                    await writer.drain()
+                    continue
+                if subscriber.evicted:
+                    break
+                try:
+                    await asyncio.wait_for(ready.wait(), stream.broadcaster.heartbeat)
+                except asyncio.TimeoutError:
+                    self._write(writer, HEARTBEAT, chunked)
+                    await writer.drain()
+        finally:
+            subscriber.waker = None
+
+    async def shutdown(self, drain_timeout, on_drain=()):
+        """停止接受新连接，关闭空闲连接，等待进行中的请求完成"""
+        self.draining = True
+        self._server.close()
+        for writer in list(self._idle):
+            writer.close()
+        for callback in on_drain:
+            callback()
+        if self._messages_changed is not None:
+            self._messages_changed.set()
+        deadline = self._loop.time() + drain_timeout
+        while self.active and self._loop.time() < deadline:
+            await asyncio.sleep(0.1)
+        if self.active:
+            print('Drain timeout, {} request(s) still running'.format(self.active), file=sys.stderr)
+        self.executor.shutdown(wait=False)
+
+
+class _Prepended:
+    def __init__(self, first, iterator, original):
+        self._first = first
+        self._iterator = iterator
+        self._original = original
+
+    def __iter__(self):
+        if self._first:
+            yield self._first
+        yield from self._iterator
+
+    def close(self):
+        close = getattr(self._original, 'close', None)
+        if close is not None:
+            close()
+
+
+def serve_async(app, config, on_drain=(), message_store=None, max_message_wait=30, shaper=None, metrics=None):
+    """以 asyncio 后端运行，收到 SIGTERM / SIGINT 后优雅停止"""
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        server = AsyncWSGIServer(
+            app, config['host'], config['port'],
+            workers=config['workers'],
+            backlog=config['backlog'],
+            keepalive_timeout=config['keepalive'],
+            request_timeout=config['timeout'],
+            max_body=app.config.get('MAX_CONTENT_LENGTH'),
+            message_store=message_store,
+            max_message_wait=max_message_wait,
+            shaper=shaper,
+            metrics=metrics,
+        )
+        await server.start()
+        stop = asyncio.Event()
+
+        def handle_signal(*args):
+            if stop.is_set():
+                # 再次收到信号时立即退出
+                loop.stop()
+                return
+            stop.set()
+
+        for signum in (signal.SIGINT, getattr(signal, 'SIGTERM', None)):
+            if signum is None:
+                continue
+            try:
+                loop.add_signal_handler(signum, handle_signal)
+            except NotImplementedError:
+                # Windows 事件循环不支持 add_signal_handler
+                signal.signal(signum, lambda *args: loop.call_soon_threadsafe(handle_signal))
+
+        await stop.wait()
+        await server.shutdown(config['drain_timeout'], on_drain)
+
+    try:
+        asyncio.run(main())
+    except RuntimeError:
+        # 第二次信号直接停止事件循环
+        pass
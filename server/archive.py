@@ -0,0 +1,295 @@
+import time
+import zlib
+import bisect
+import struct
+import threading
+from collections import OrderedDict
+
+# 流式 ZIP 打包配置
+ARCHIVE_BLOCK_SIZE = 256 * 1024
+DEFLATE_LEVEL = 6
+# deflate 条目每压缩这么多输入做一次完全刷新（同步点），Range 请求从最近的同步点开始重新压缩
+DEFLATE_CHECKPOINT = 4 * 1024 * 1024
+# 缓存已打包文件的 CRC、压缩后大小与同步点，续传时无需重新读取
+META_CACHE_SIZE = 4096
+# 未压缩大小超过该值的条目使用 ZIP64（为 deflate 膨胀留出余量，只由文件大小决定，保证输出确定）
+ZIP64_ENTRY_LIMIT = 0xF0000000
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+_U16 = 0xFFFF
+_U32 = 0xFFFFFFFF
+# 标志位：bit 3 大小与 CRC 写在数据描述符中，bit 11 文件名为 UTF-8
+_FLAGS = 0x0808
+
+
+def _dos_datetime(mtime):
+    t = time.localtime(mtime)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1
+    return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday)
+
+
+class ArchiveMetaCache:
+    """按文件 (设备, inode, 大小, mtime, 压缩方式) 缓存 (crc, 压缩后大小, 同步点)"""
+
+    def __init__(self, capacity=META_CACHE_SIZE):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+
+
+class ArchiveEntry:
+    __slots__ = ('name', 'path', 'size', 'mtime', 'method', 'key', 'crc', 'compressed_size', 'checkpoints', 'offset')
+
+    def __init__(self, name, path, stat, method):
+        self.name = name.encode('utf-8')
+        self.path = path
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.method = method
+        self.key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns, method)
+        self.crc = None
+        self.compressed_size = stat.st_size if method == ZIP_STORED else None
+        # deflate 同步点 (输出偏移, 输入偏移)，按偏移升序
+        self.checkpoints = ()
+        self.offset = 0
+
+    @property
+    def zip64(self):
+        return self.size >= ZIP64_ENTRY_LIMIT
+
+    def local_header(self):
+        dos_time, dos_date = _dos_datetime(self.mtime)
+        if self.zip64:
+            extra = struct.pack('<HHQQ', 1, 16, 0, 0)
+            sizes = (_U32, _U32)
+        else:
+            extra = b''
+            sizes = (0, 0)
+        return struct.pack('<IHHHHHIIIHH', 0x04034b50, 45 if self.zip64 else 20, _FLAGS, self.method,
+                           dos_time, dos_date, 0, sizes[0], sizes[1], len(self.name), len(extra)) + self.name + extra
+
+    def descriptor(self):
+        if self.zip64:
+            return struct.pack('<IIQQ', 0x08074b50, self.crc, self.compressed_size, self.size)
+        return struct.pack('<IIII', 0x08074b50, self.crc, self.compressed_size, self.size)
+
+    def descriptor_size(self):
+        return 24 if self.zip64 else 16
+
+    def central_header(self):
+        dos_time, dos_date = _dos_datetime(self.mtime)
+        extra = b''
+        size, compressed_size, offset = self.size, self.compressed_size, self.offset
+        if self.zip64:
+            extra += struct.pack('<QQ', self.size, self.compressed_size)
+            size = compressed_size = _U32
+        if self.offset >= _U32:
+            extra += struct.pack('<Q', self.offset)
+            offset = _U32
+        if extra:
+            extra = struct.pack('<HH', 1, len(extra)) + extra
+        version = 45 if extra else 20
+        return struct.pack('<IHHHHHHIIIHHHHHII', 0x02014b50, version, version, _FLAGS, self.method,
+                           dos_time, dos_date, self.crc, compressed_size, size, len(self.name), len(extra),
+                           0, 0, 0, 0, offset) + self.name + extra
+
+    def central_size(self):
+        extra = (16 if self.zip64 else 0) + (8 if self.offset >= _U32 else 0)
+        return 46 + len(self.name) + (4 + extra if extra else 0)
+
+
+def _end_records(count, cd_offset, cd_size):
+    records = b''
+    if count >= _U16 or cd_offset >= _U32 or cd_size >= _U32:
+        zip64_offset = cd_offset + cd_size
+        records += struct.pack('<IQHHIIQQQQ', 0x06064b50, 44, 45, 45, 0, 0, count, count, cd_size, cd_offset)
+        records += struct.pack('<IIQI', 0x07064b50, 0, zip64_offset, 1)
+    records += struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, min(count, _U16), min(count, _U16),
+                           min(cd_size, _U32), min(cd_offset, _U32), 0)
+    return records
+
+
+class ArchiveChangedError(IOError):
+    pass
+
+
+# 即时生成的 ZIP 归档：不写临时文件，内存占用与文件数量、大小无关。
+# 所有条目使用数据描述符，输出只取决于文件列表与文件内容，同一归档多次生成的字节完全一致，
+# 因此可以按 Range 续传（deflate 条目需要已知压缩后大小，见 resolve）
+class ZipArchive:
+    def __init__(self, cache=None, block_size=ARCHIVE_BLOCK_SIZE):
+        self.entries = []
+        self.cache = cache
+        self.block_size = block_size
+
+    def add(self, name, path, stat, compress=True):
+        entry = ArchiveEntry(name, path, stat, ZIP_DEFLATED if compress else ZIP_STORED)
+        cached = self.cache.get(entry.key) if self.cache else None
+        if cached:
+            entry.crc, entry.compressed_size, entry.checkpoints = cached
+        self.entries.append(entry)
+        return entry
+
+    @property
+    def etag(self):
+        manifest = '\n'.join('{}:{}:{}'.format(e.name.decode('utf-8'), e.key[2:], e.key[4])
+                             for e in self.entries)
+        manifest += zlib.ZLIB_RUNTIME_VERSION + str(DEFLATE_LEVEL) + ':' + str(DEFLATE_CHECKPOINT)
+        return '"z{:x}-{:x}"'.format(zlib.crc32(manifest.encode('utf-8')), len(self.entries))
+
+    @property
+    def mtime(self):
+        return max((e.mtime for e in self.entries), default=0)
+
+    @property
+    def sized(self):
+        return all(e.compressed_size is not None for e in self.entries)
+
+    def resolve(self):
+        """读取尚未缓存的文件，计算 CRC 与压缩后大小，使总大小可知"""
+        for entry in self.entries:
+            if entry.crc is None or entry.compressed_size is None:
+                for _ in self._entry_data(entry, 0, None):
+                    pass
+
+    def size(self):
+        offset = 0
+        for entry in self.entries:
+            entry.offset = offset
+            offset += len(entry.local_header()) + entry.compressed_size + entry.descriptor_size()
+        cd_size = sum(e.central_size() for e in self.entries)
+        return offset + cd_size + len(_end_records(len(self.entries), offset, cd_size))
+
+    def _read_entry(self, entry, offset=0, produced=0):
+        """从输入的 offset（对应存储数据的 produced）处按块生成条目的存储数据；
+        从头读完时记录 CRC、压缩后大小与同步点"""
+        deflate = entry.method == ZIP_DEFLATED
+        compressor = zlib.compressobj(DEFLATE_LEVEL, zlib.DEFLATED, -15) if deflate else None
+        crc = 0
+        checkpoints = []
+        pos = offset
+        with open(entry.path, 'rb') as f:
+            f.seek(offset)
+            while pos < entry.size:
+                size = min(self.block_size, entry.size - pos)
+                if deflate:
+                    size = min(size, DEFLATE_CHECKPOINT - pos % DEFLATE_CHECKPOINT)
+                block = f.read(size)
+                if not block:
+                    raise ArchiveChangedError(entry.path)
+                pos += len(block)
+                crc = zlib.crc32(block, crc)
+                data = compressor.compress(block) if deflate else block
+                if deflate and pos % DEFLATE_CHECKPOINT == 0 and pos < entry.size:
+                    # 完全刷新后输出按字节对齐且不再引用之前的数据，新的压缩器从这里开始生成的字节完全相同
+                    data += compressor.flush(zlib.Z_FULL_FLUSH)
+                    checkpoints.append((produced + len(data), pos))
+                produced += len(data)
+                if data:
+                    yield data
+            if deflate:
+                data = compressor.flush()
+                produced += len(data)
+                yield data
+        if offset:
+            return
+        checkpoints = tuple(checkpoints)
+        if entry.crc is not None and (entry.crc, entry.compressed_size) != (crc, produced):
+            # 文件在两次生成之间被修改，已发送的内容无法与描述符一致
+            raise ArchiveChangedError(entry.path)
+        entry.crc, entry.compressed_size, entry.checkpoints = crc, produced, checkpoints
+        if self.cache:
+            self.cache.put(entry.key, (crc, produced, checkpoints))
+
+    def _entry_data(self, entry, skip, limit):
+        """生成条目存储数据中 [skip, skip + limit) 的部分"""
+        # CRC 已知时不压缩的条目直接定位，deflate 条目从不超过 skip 的最近同步点开始压缩
+        offset = produced = 0
+        if entry.crc is not None and skip:
+            if entry.method == ZIP_STORED:
+                offset = produced = skip
+            else:
+                index = bisect.bisect_right(entry.checkpoints, (skip, entry.size))
+                if index:
+                    produced, offset = entry.checkpoints[index - 1]
+        pos = produced
+        for data in self._read_entry(entry, offset, produced):
+            start = pos
+            pos += len(data)
+            if pos <= skip:
+                continue
+            data = data[max(0, skip - start):]
+            if limit is not None:
+                data = data[:limit]
+                limit -= len(data)
+            if data:
+                yield data
+            if limit == 0:
+                return
+
+    def stream(self, start=0, stop=None):
+        """生成归档中 [start, stop) 的字节；start 大于 0 时需要先 resolve"""
+        pos = 0
+
+        def clip(data):
+            begin = max(start - pos, 0)
+            end = len(data) if stop is None else min(stop - pos, len(data))
+            return data[begin:end] if begin < end else b''
+
+        for entry in self.entries:
+            entry.offset = pos
+            header = entry.local_header()
+            data = clip(header)
+            if data:
+                yield data
+            pos += len(header)
+
+            if entry.compressed_size is not None and pos + entry.compressed_size <= start:
+                pos += entry.compressed_size
+            else:
+                skip = max(start - pos, 0)
+                limit = None if stop is None else stop - pos - skip
+                if limit is not None and limit <= 0:
+                    return
+                for data in self._entry_data(entry, skip, limit):
+                    yield data
+                if stop is not None and pos + entry.compressed_size >= stop:
+                    return
+                pos += entry.compressed_size
+
+            descriptor = entry.descriptor()
+            data = clip(descriptor)
+            if data:
+                yield data
+            pos += len(descriptor)
+            if stop is not None and pos >= stop:
+                return
+
+        cd_offset = pos
+        for entry in self.entries:
+            header = entry.central_header()
+            data = clip(header)
+            if data:
+                yield data
+            pos += len(header)
+        data = clip(_end_records(len(self.entries), cd_offset, pos - cd_offset))
+        if data:
+            yield data
@@ -0,0 +1,234 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 内容寻址存储配置
+HASH_BLOCK_SIZE = 1024 * 1024
+HASH_WORKERS = 1
+LINKS_FILE_NAME = 'links.json'
+
+_DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def is_digest(value):
+    return bool(value) and _DIGEST_RE.match(value) is not None
+
+
+def hash_file(path):
+    """流式计算文件的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(HASH_BLOCK_SIZE)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# 按 SHA-256 保存文件内容：.blobs/ab/abcdef...
+# 分类目录中的文件是 blob 的硬链接，相同内容只占用一份磁盘空间，
+# 目录缓存、下载与 sendfile 仍然按普通文件处理。文件系统不支持硬链接时退化为普通文件
+class BlobStore:
+    def __init__(self, root=None):
+        self.root = root
+        self._lock = threading.Lock()
+        # (st_dev, st_ino) -> digest，删除分类文件时据此找到对应的 blob
+        self._inodes = {}
+        # '分类/文件名' -> [st_ino, 上传时间]：硬链接共享 mtime，去重得到的文件在这里记录各自的上传时间，
+        # 不修改 blob 的 mtime（否则同一内容的其他文件也会跟着变化）
+        self._links = {}
+        self._loaded = False
+        # 上传完成后在后台计算哈希，不占用请求线程
+        self._executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix='blob-hash')
+
+    def ensure_started(self, root):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            self.root = root
+            self._load()
+            self._loaded = True
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def _tmp_path(self):
+        folder = os.path.join(self.root, 'tmp')
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        return os.path.join(folder, uuid.uuid4().hex)
+
+    def _links_path(self):
+        return os.path.join(self.root, LINKS_FILE_NAME)
+
+    def _link_key(self, filepath):
+        return os.path.relpath(filepath, os.path.dirname(self.root)).replace(os.sep, '/')
+
+    def _load_links(self):
+        try:
+            with open(self._links_path(), 'r', encoding='utf-8') as f:
+                links = json.load(f)
+        except (OSError, ValueError):
+            return
+        # 只保留仍指向同一 inode 的记录
+        base = os.path.dirname(self.root)
+        for key, link in links.items():
+            try:
+                if os.stat(os.path.join(base, key)).st_ino == link[0]:
+                    self._links[key] = link
+            except (OSError, TypeError, IndexError):
+                continue
+
+    def _save_links(self):
+        tmp_path = self._links_path() + '.tmp'
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._links, f)
+            os.replace(tmp_path, self._links_path())
+        except OSError:
+            pass
+
+    def _record_link(self, filepath, uploaded):
+        try:
+            self._links[self._link_key(filepath)] = [os.stat(filepath).st_ino, uploaded]
+        except OSError:
+            return
+        self._save_links()
+
+    def link_time(self, category, name, stat):
+        """分类文件的上传时间：去重得到的硬链接返回记录的时间，其余返回 mtime"""
+        link = self._links.get(category + '/' + name)
+        if link is not None and link[0] == stat.st_ino:
+            return link[1]
+        return stat.st_mtime
+
+    def _load(self):
+        # 建立 inode 索引，同时清理已没有任何分类文件引用的 blob（例如在目录外被删除）
+        self._inodes.clear()
+        self._links.clear()
+        if not os.path.isdir(self.root):
+            return
+        self._load_links()
+        for prefix in os.listdir(self.root):
+            folder = os.path.join(self.root, prefix)
+            if prefix == 'tmp':
+                shutil.rmtree(folder, ignore_errors=True)
+                continue
+            if not os.path.isdir(folder):
+                continue
+            for digest in os.listdir(folder):
+                blob = os.path.join(folder, digest)
+                try:
+                    stat = os.stat(blob)
+                    if stat.st_nlink <= 1:
+                        os.remove(blob)
+                        continue
+                except OSError:
+                    continue
+                self._inodes[(stat.st_dev, stat.st_ino)] = digest
+
+    def stat(self, digest):
+        """blob 存在时返回 os.stat 结果，否则返回 None"""
+        if not is_digest(digest):
+            return None
+        try:
+            return os.stat(self.path(digest))
+        except OSError:
+            return None
+
+    def digest_of(self, stat):
+        """根据分类文件的 stat 返回其内容哈希，不在存储中时返回 None"""
+        return self._inodes.get((stat.st_dev, stat.st_ino))
+
+    def adopt(self, filepath):
+        """将刚写入的文件纳入存储：内容已存在时替换为指向已有 blob 的硬链接，返回 digest；
+        计算哈希期间文件被删除或修改时返回 None"""
+        try:
+            before = os.stat(filepath)
+            digest = hash_file(filepath)
+        except OSError:
+            return None
+        with self._lock:
+            blob = self.path(digest)
+            try:
+                current = os.stat(filepath)
+                if (current.st_ino, current.st_size, current.st_mtime_ns) != \
+                        (before.st_ino, before.st_size, before.st_mtime_ns):
+                    return None
+                if os.path.exists(blob):
+                    if os.path.samefile(blob, filepath):
+                        return digest
+                    tmp = self._tmp_path()
+                    os.link(blob, tmp)
+                    os.replace(tmp, filepath)
+                    # 替换后 mtime 变为已有 blob 的时间，上传时间另行记录
+                    self._record_link(filepath, before.st_mtime)
+                else:
+                    os.makedirs(os.path.dirname(blob), exist_ok=True)
+                    os.link(filepath, blob)
+                stat = os.stat(blob)
+            except OSError:
+                return None
+            self._inodes[(stat.st_dev, stat.st_ino)] = digest
+        return digest
+
+    def adopt_later(self, filepath, callback):
+        """在后台线程中执行 adopt，完成后以 digest（失败时为 None）调用 callback"""
+        def run():
+            digest = self.adopt(filepath)
+            try:
+                callback(digest)
+            except Exception as e:
+                print('blob adopt callback failed for {}: {}'.format(filepath, e), file=sys.stderr)
+        return self._executor.submit(run)
+
+    def link(self, digest, filepath):
+        """为已有 blob 创建分类文件，无需传输内容；blob 不存在时返回 False"""
+        with self._lock:
+            blob = self.path(digest)
+            if not os.path.exists(blob):
+                return False
+            try:
+                os.link(blob, filepath)
+            except OSError:
+                # 超出硬链接数上限等情况下复制一份
+                shutil.copyfile(blob, filepath)
+                return True
+            # 硬链接共享 mtime，本次上传时间记录在索引中，使新文件排在列表前面
+            self._record_link(filepath, time.time())
+        return True
+
+    def same_content(self, digest, filepath):
+        try:
+            return os.path.samefile(self.path(digest), filepath)
+        except OSError:
+            return False
+
+    def release(self, filepath):
+        """删除分类文件，最后一个引用被删除时同时删除 blob"""
+        with self._lock:
+            stat = os.stat(filepath)
+            os.remove(filepath)
+            if self._links.pop(self._link_key(filepath), None) is not None:
+                self._save_links()
+            digest = self._inodes.get((stat.st_dev, stat.st_ino))
+            if digest is None or stat.st_nlink > 2:
+                return
+            blob = self.path(digest)
+            try:
+                if os.stat(blob).st_nlink <= 1:
+                    os.remove(blob)
+                    self._inodes.pop((stat.st_dev, stat.st_ino), None)
+            except OSError:
+                pass
@@ -0,0 +1,430 @@
+import os
+import sys
+import time
+import bisect
+import heapq
+import itertools
+import select
+import struct
+import threading
+import ctypes
+import ctypes.util
+
+SORT_KEYS = ('mtime', 'name', 'size')
+# 各排序键的元素类型，与 CatalogEntry.sort_key 对应，用于校验客户端传回的游标
+SORT_KEY_TYPES = {
+    'mtime': ((int, float), str),
+    'name': (str, str),
+    'size': (int, str),
+}
+
+# 目录监听配置
+POLL_INTERVAL = 2
+FULL_RESCAN_INTERVAL = 60
+
+# inotify 事件掩码
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+# 不监听 IN_CREATE：新文件写完关闭时会触发 IN_CLOSE_WRITE，避免收录写了一半的文件
+WATCH_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE | IN_DELETE_SELF
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class CatalogEntry:
+    __slots__ = ('name', 'category', 'size', 'mtime', 'inode')
+
+    def __init__(self, name, category, size, mtime, inode=None):
+        self.name = name
+        self.category = category
+        self.size = size
+        self.mtime = mtime
+        # (st_dev, st_ino)；去重得到的硬链接共享同一 inode
+        self.inode = inode
+
+    @property
+    def inode_key(self):
+        # 未知 inode 的条目各自独立计算
+        return self.inode if self.inode is not None else (self.category, self.name)
+
+    def sort_key(self, sort):
+        # 排序键均以文件名结尾，保证同一分类内唯一
+        if sort == 'name':
+            return (self.name.lower(), self.name)
+        if sort == 'size':
+            return (self.size, self.name)
+        return (self.mtime, self.name)
+
+
+# 文件目录缓存：各分类的条目按时间预排序，并维护文件数与总大小
+class FileCatalog:
+    def __init__(self, categories):
+        self.categories = list(categories)
+        self.root = None
+        self.generation = 0
+        self._lock = threading.RLock()
+        self._entries = {c: {} for c in self.categories}
+        # 每种排序方式维护一组升序的键与条目，下标一一对应
+        self._keys = {c: {k: [] for k in SORT_KEYS} for c in self.categories}
+        self._items = {c: {k: [] for k in SORT_KEYS} for c in self.categories}
+        self._sizes = {c: 0 for c in self.categories}
+        # 实际磁盘占用：硬链接在每个分类内、以及全部分类合计时只计一次
+        self._links = {}
+        self._disk_sizes = {c: 0 for c in self.categories}
+        self._disk_total = 0
+        self._dir_mtimes = {}
+        self._watcher = None
+        self._stop_event = threading.Event()
+        self._listeners = []
+        self._mtime_source = None
+        self._started = False
+
+    def folder(self, category):
+        return os.path.join(self.root, category)
+
+    def ensure_started(self, root):
+        if self.root is not None:
+            return
+        with self._lock:
+            if self.root is not None:
+                return
+            self.root = root
+            for category in self.categories:
+                if not os.path.exists(self.folder(category)):
+                    os.makedirs(self.folder(category))
+                self.rescan(category)
+            self._started = True
+            self._watcher = start_watcher(self)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def add_listener(self, callback):
+        # callback(action, entry, old)，action 为 'add'、'update' 或 'remove'；首次扫描不触发
+        self._listeners.append(callback)
+
+    def set_mtime_source(self, callback):
+        # callback(category, name, stat) 返回用于排序与显示的时间，默认为 st_mtime；须在 ensure_started 之前设置
+        self._mtime_source = callback
+
+    def _make_entry(self, category, name, stat):
+        mtime = self._mtime_source(category, name, stat) if self._mtime_source else stat.st_mtime
+        return CatalogEntry(name, category, stat.st_size, mtime, (stat.st_dev, stat.st_ino))
+
+    def _notify(self, action, entry, old=None):
+        if not self._started:
+            return
+        for callback in self._listeners:
+            try:
+                callback(action, entry, old)
+            except Exception:
+                pass
+
+    def _notify_insert(self, entry, replaced):
+        if replaced is None:
+            self._notify('add', entry)
+        else:
+            self._notify('update', entry, replaced)
+
+    def _insert(self, entry):
+        """插入或更新条目；未变化时返回 False，否则返回被替换的旧条目（新增时为 None）"""
+        entries = self._entries[entry.category]
+        old = entries.get(entry.name)
+        if old is not None:
+            if old.size == entry.size and old.mtime == entry.mtime and old.inode == entry.inode:
+                return False
+            self._delete(old)
+        entries[entry.name] = entry
+        for sort in SORT_KEYS:
+            key = entry.sort_key(sort)
+            keys = self._keys[entry.category][sort]
+            index = bisect.bisect_left(keys, key)
+            keys.insert(index, key)
+            self._items[entry.category][sort].insert(index, entry)
+        self._sizes[entry.category] += entry.size
+        # 同一 inode 按首次加入时的大小计算，删除时减去相同的值，合计不会漂移
+        link = self._links.get(entry.inode_key)
+        if link is None:
+            link = self._links[entry.inode_key] = [entry.size, {}]
+            self._disk_total += entry.size
+        refs = link[1]
+        if not refs.get(entry.category):
+            self._disk_sizes[entry.category] += link[0]
+        refs[entry.category] = refs.get(entry.category, 0) + 1
+        return old
+
+    def _delete(self, entry):
+        for sort in SORT_KEYS:
+            keys = self._keys[entry.category][sort]
+            index = bisect.bisect_left(keys, entry.sort_key(sort))
+            if index < len(keys) and self._items[entry.category][sort][index] is entry:
+                del keys[index]
+                del self._items[entry.category][sort][index]
+        del self._entries[entry.category][entry.name]
+        self._sizes[entry.category] -= entry.size
+        size, refs = self._links[entry.inode_key]
+        refs[entry.category] -= 1
+        if not refs[entry.category]:
+            del refs[entry.category]
+            self._disk_sizes[entry.category] -= size
+        if not refs:
+            del self._links[entry.inode_key]
+            self._disk_total -= size
+
+    def _stat_entry(self, category, name):
+        try:
+            stat = os.stat(os.path.join(self.folder(category), name))
+        except OSError:
+            return None
+        if not os.path.isfile(os.path.join(self.folder(category), name)):
+            return None
+        return self._make_entry(category, name, stat)
+
+    def refresh_entry(self, category, name):
+        """重新读取单个文件的状态，文件已不存在时从目录中移除"""
+        if category not in self._entries:
+            return
+        entry = self._stat_entry(category, name)
+        with self._lock:
+            if entry is not None:
+                replaced = self._insert(entry)
+                if replaced is not False:
+                    self.generation += 1
+                    self._notify_insert(entry, replaced)
+            else:
+                old = self._entries[category].get(name)
+                if old is not None:
+                    self._delete(old)
+                    self.generation += 1
+                    self._notify('remove', old)
+
+    def add(self, category, name):
+        self.refresh_entry(category, name)
+
+    def remove(self, category, name):
+        with self._lock:
+            old = self._entries[category].get(name)
+            if old is not None:
+                self._delete(old)
+                self.generation += 1
+                self._notify('remove', old)
+
+    def rescan(self, category):
+        folder = self.folder(category)
+        found = {}
+        try:
+            self._dir_mtimes[category] = os.stat(folder).st_mtime_ns
+            with os.scandir(folder) as it:
+                for item in it:
+                    try:
+                        if not item.is_file():
+                            continue
+                        stat = item.stat()
+                    except OSError:
+                        continue
+                    found[item.name] = self._make_entry(category, item.name, stat)
+        except OSError:
+            pass
+
+        with self._lock:
+            changed = False
+            for name in list(self._entries[category]):
+                if name not in found:
+                    old = self._entries[category][name]
+                    self._delete(old)
+                    self._notify('remove', old)
+                    changed = True
+            for entry in found.values():
+                replaced = self._insert(entry)
+                if replaced is not False:
+                    self._notify_insert(entry, replaced)
+                    changed = True
+            if changed:
+                self.generation += 1
+
+    def rescan_all(self):
+        for category in self.categories:
+            self.rescan(category)
+
+    def poll_changes(self):
+        # 目录的 mtime 在文件增删、重命名时会变化
+        for category in self.categories:
+            try:
+                mtime = os.stat(self.folder(category)).st_mtime_ns
+            except OSError:
+                continue
+            if mtime != self._dir_mtimes.get(category):
+                self.rescan(category)
+
+    def list(self, category, sort='mtime', reverse=True):
+        with self._lock:
+            items = self._items[category][sort]
+            return items[::-1] if reverse else list(items)
+
+    def count(self, category):
+        with self._lock:
+            return len(self._entries[category])
+
+    def page(self, category, sort='mtime', reverse=True, limit=100, after=None):
+        """按排序键分页，after 为上一页最后一条的排序键；返回 (条目, 下一页起点键)"""
+        with self._lock:
+            keys = self._keys[category][sort]
+            items = self._items[category][sort]
+            if reverse:
+                end = len(keys) if after is None else bisect.bisect_left(keys, after)
+                start = max(0, end - limit)
+                page = items[start:end][::-1]
+                has_more = start > 0
+            else:
+                start = 0 if after is None else bisect.bisect_right(keys, after)
+                end = min(len(keys), start + limit)
+                page = items[start:end]
+                has_more = end < len(keys)
+        next_key = page[-1].sort_key(sort) if page and has_more else None
+        return page, next_key
+
+    def merged_page(self, categories, sort='mtime', reverse=True, limit=100, after=None):
+        """多个分类合并分页：对各分类已排好序的片段做 k 路归并，after 为 (排序键..., 分类)"""
+        if after is not None:
+            after_key, after_category = tuple(after[:-1]), after[-1]
+        runs = []
+        with self._lock:
+            for category in categories:
+                keys = self._keys[category][sort]
+                items = self._items[category][sort]
+                # 排序键相同时以分类名决定先后，保证全局顺序唯一
+                if reverse:
+                    if after is None:
+                        end = len(keys)
+                    elif category < after_category:
+                        end = bisect.bisect_right(keys, after_key)
+                    else:
+                        end = bisect.bisect_left(keys, after_key)
+                    start = max(0, end - limit - 1)
+                    run = [(keys[i] + (category,), items[i]) for i in range(end - 1, start - 1, -1)]
+                else:
+                    if after is None:
+                        start = 0
+                    elif category > after_category:
+                        start = bisect.bisect_left(keys, after_key)
+                    else:
+                        start = bisect.bisect_right(keys, after_key)
+                    end = min(len(keys), start + limit + 1)
+                    run = [(keys[i] + (category,), items[i]) for i in range(start, end)]
+                runs.append(run)
+
+        merged = list(itertools.islice(heapq.merge(*runs, key=lambda item: item[0], reverse=reverse), limit + 1))
+        page = [entry for _, entry in merged[:limit]]
+        next_key = merged[limit - 1][0] if len(merged) > limit else None
+        return page, next_key
+
+    def stats(self):
+        with self._lock:
+            counts = {c: len(self._entries[c]) for c in self.categories}
+            sizes = dict(self._sizes)
+        return counts, sizes
+
+    def disk_usage(self):
+        """返回 (合计, {分类: 字节数})，指向同一 inode 的多个文件只计一次"""
+        with self._lock:
+            return self._disk_total, dict(self._disk_sizes)
+
+    def links(self, entry, category=None):
+        """与 entry 指向同一 inode 的目录条目数，可限定分类"""
+        with self._lock:
+            refs = self._links.get(entry.inode_key, (0, {}))[1]
+            return refs.get(category, 0) if category else sum(refs.values())
+
+
+# inotify 监听（Linux），不可用时退回轮询
+class InotifyWatcher:
+    def __init__(self, catalog):
+        self.catalog = catalog
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._libc = libc
+        self.fd = libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._watches = {}
+        for category in catalog.categories:
+            wd = libc.inotify_add_watch(self.fd, catalog.folder(category).encode(sys.getfilesystemencoding()),
+                                        WATCH_MASK)
+            if wd < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), 'inotify_add_watch failed')
+            self._watches[wd] = category
+
+    def run(self):
+        last_rescan = time.time()
+        try:
+            while not self.catalog._stop_event.is_set():
+                readable, _, _ = select.select([self.fd], [], [], 1.0)
+                if readable:
+                    self._handle(os.read(self.fd, 64 * 1024))
+                # 监听目录被删除后重建并整体重扫
+                if len(self._watches) < len(self.catalog.categories):
+                    break
+                if time.time() - last_rescan > FULL_RESCAN_INTERVAL * 10:
+                    self.catalog.rescan_all()
+                    last_rescan = time.time()
+        finally:
+            os.close(self.fd)
+        if not self.catalog._stop_event.is_set():
+            PollingWatcher(self.catalog).run()
+
+    def _handle(self, data):
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0').decode(sys.getfilesystemencoding(), 'surrogateescape')
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                self.catalog.rescan_all()
+                continue
+            if mask & (IN_IGNORED | IN_DELETE_SELF):
+                self._watches.pop(wd, None)
+                continue
+            category = self._watches.get(wd)
+            if category and name and not mask & IN_ISDIR:
+                self.catalog.refresh_entry(category, name)
+
+
+class PollingWatcher:
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def run(self):
+        last_rescan = time.time()
+        while not self.catalog._stop_event.wait(POLL_INTERVAL):
+            for category in self.catalog.categories:
+                if not os.path.exists(self.catalog.folder(category)):
+                    os.makedirs(self.catalog.folder(category))
+            if time.time() - last_rescan > FULL_RESCAN_INTERVAL:
+                # 原地修改文件内容不会改变目录 mtime，定期整体重扫兜底
+                self.catalog.rescan_all()
+                last_rescan = time.time()
+            else:
+                self.catalog.poll_changes()
+
+
+def start_watcher(catalog):
+    watcher = None
+    if sys.platform.startswith('linux'):
+        try:
+            watcher = InotifyWatcher(catalog)
+        except (OSError, AttributeError):
+            watcher = None
+    if watcher is None:
+        watcher = PollingWatcher(catalog)
+    thread = threading.Thread(target=watcher.run, name='catalog-watcher', daemon=True)
+    thread.start()
+    return watcher
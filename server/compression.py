@@ -0,0 +1,164 @@
+import os
+import gzip
+import mimetypes
+import zlib
+import threading
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 压缩配置
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+ZSTD_LEVEL = 6
+# 静态文件启动时预压缩，使用更高的压缩级别
+STATIC_GZIP_LEVEL = 9
+STATIC_BROTLI_QUALITY = 11
+STATIC_ZSTD_LEVEL = 19
+
+# 本身已压缩的分类，下载时不再压缩
+INCOMPRESSIBLE_CATEGORIES = ('images', 'videos', 'audios', 'archives')
+
+COMPRESSIBLE_TYPES = (
+    'application/json', 'application/javascript', 'application/xml',
+    'image/svg+xml', 'text/',
+)
+
+
+def available_encodings():
+    """按优先级返回可用的编码"""
+    encodings = []
+    if brotli is not None:
+        encodings.append('br')
+    if zstandard is not None:
+        encodings.append('zstd')
+    encodings.append('gzip')
+    return encodings
+
+
+ENCODINGS = available_encodings()
+
+
+def is_compressible(content_type):
+    if not content_type:
+        return False
+    content_type = content_type.split(';', 1)[0].strip().lower()
+    return any(content_type.startswith(t) if t.endswith('/') else content_type == t for t in COMPRESSIBLE_TYPES)
+
+
+def negotiate(accept_encoding, encodings=None):
+    """根据 Accept-Encoding 选择编码，无可用编码时返回 None"""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+
+    best, best_q = None, 0.0
+    for encoding in encodings or ENCODINGS:
+        q = accepted.get(encoding, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def encoded_etag(etag, encoding):
+    # 不同编码是不同的表示，强 ETag 需要区分
+    return '{}-{}"'.format(etag[:-1], encoding) if etag.endswith('"') else etag
+
+
+def compress(data, encoding, static=False):
+    if encoding == 'br':
+        return brotli.compress(data, quality=STATIC_BROTLI_QUALITY if static else BROTLI_QUALITY)
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=STATIC_ZSTD_LEVEL if static else ZSTD_LEVEL).compress(data)
+    return gzip.compress(data, STATIC_GZIP_LEVEL if static else GZIP_LEVEL, mtime=0)
+
+
+class StreamCompressor:
+    """流式压缩，用于无法整体读入内存的响应体"""
+
+    def __init__(self, encoding):
+        if encoding == 'br':
+            self._obj = brotli.Compressor(quality=BROTLI_QUALITY)
+            self._compress, self._flush = self._obj.process, self._obj.finish
+        elif encoding == 'zstd':
+            self._obj = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+            self._compress, self._flush = self._obj.compress, self._obj.flush
+        else:
+            # wbits=31 输出 gzip 格式
+            self._obj = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+            self._compress, self._flush = self._obj.compress, self._obj.flush
+
+    def wrap(self, chunks):
+        # 响应体关闭时一并关闭数据源（如 FileRangeStream 打开的文件）
+        try:
+            for chunk in chunks:
+                data = self._compress(chunk)
+                if data:
+                    yield data
+            data = self._flush()
+            if data:
+                yield data
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+
+
+# 静态文件压缩缓存：按 (路径, 编码) 保存，文件 mtime 或大小变化时重新压缩
+class StaticCompressionCache:
+    def __init__(self, encodings=None):
+        self.encodings = list(encodings or ENCODINGS)
+        self._lock = threading.Lock()
+        self._cache = {}
+
+    def get(self, path, encoding, stat=None):
+        """返回压缩后的内容；文件太小或压缩无收益时返回 None"""
+        stat = stat or os.stat(path)
+        key = (path, encoding)
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+
+        data = None
+        if stat.st_size >= MIN_COMPRESS_SIZE:
+            with open(path, 'rb') as f:
+                raw = f.read()
+            data = compress(raw, encoding, static=True)
+            if len(data) >= len(raw):
+                data = None
+        with self._lock:
+            self._cache[key] = (stat.st_mtime_ns, stat.st_size, data)
+        return data
+
+    def warm(self, *folders):
+        # 启动时预压缩目录下的全部文本文件
+        for folder in folders:
+            for root, _, names in os.walk(folder):
+                for name in names:
+                    if not is_compressible(mimetypes.guess_type(name)[0]):
+                        continue
+                    path = os.path.join(root, name)
+                    for encoding in self.encodings:
+                        try:
+                            self.get(path, encoding)
+                        except OSError:
+                            pass
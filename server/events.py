@@ -0,0 +1,142 @@
+import json
+import threading
+from collections import deque
+
+# SSE 推送配置
+HISTORY_SIZE = 512
+QUEUE_SIZE = 256
+HEARTBEAT_INTERVAL = 15
+RETRY_MS = 3000
+HEARTBEAT = b': ping\n\n'
+
+
+class Subscriber:
+    def __init__(self, queue_size=QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.evicted = False
+        # 异步服务端注册的唤醒回调，有新事件或被断开时调用
+        self.waker = None
+        self._queue = deque()
+        self._cond = threading.Condition()
+
+    def _wake(self):
+        self._cond.notify_all()
+        if self.waker is not None:
+            self.waker()
+
+    def put(self, event):
+        with self._cond:
+            if len(self._queue) >= self.queue_size:
+                # 消费太慢，队列已满：断开该订阅者，由客户端携带 Last-Event-ID 重连补发
+                self.evicted = True
+                self._queue.clear()
+                self._wake()
+                return False
+            self._queue.append(event)
+            self._wake()
+            return True
+
+    def close(self):
+        with self._cond:
+            self.evicted = True
+            self._queue.clear()
+            self._wake()
+
+    def get(self, timeout):
+        with self._cond:
+            if not self._queue and not self.evicted:
+                self._cond.wait(timeout)
+            if self._queue:
+                return self._queue.popleft()
+            return None
+
+
+def format_event(event_id, event_type, data):
+    return 'id: {}\nevent: {}\ndata: {}\n\n'.format(event_id, event_type, data).encode('utf-8')
+
+
+# 事件广播：一次序列化，分发给所有订阅者的有界队列
+class EventBroadcaster:
+    def __init__(self, history_size=HISTORY_SIZE, queue_size=QUEUE_SIZE, heartbeat=HEARTBEAT_INTERVAL):
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._history = deque(maxlen=history_size)
+        self._subscribers = set()
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    @property
+    def last_event_id(self):
+        with self._lock:
+            return self._next_id
+
+    def publish(self, event_type, data):
+        payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+        with self._lock:
+            self._next_id += 1
+            event = format_event(self._next_id, event_type, payload)
+            self._history.append((self._next_id, event))
+            for subscriber in list(self._subscribers):
+                if not subscriber.put(event):
+                    self._subscribers.discard(subscriber)
+        return event
+
+    def subscribe(self, last_event_id=None):
+        subscriber = Subscriber(self.queue_size)
+        with self._lock:
+            if last_event_id is not None:
+                oldest = self._history[0][0] if self._history else self._next_id + 1
+                missed = [event for event_id, event in self._history if event_id > last_event_id]
+                if (last_event_id > self._next_id or last_event_id < oldest - 1
+                        or len(missed) >= self.queue_size):
+                    # 断线期间的事件已不在历史中（或服务端已重启），通知客户端全量刷新
+                    subscriber.put(format_event(self._next_id, 'reset', '{}'))
+                else:
+                    for event in missed:
+                        subscriber.put(event)
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def close(self):
+        """断开全部订阅者，用于服务停止前结束长连接"""
+        with self._lock:
+            subscribers, self._subscribers = self._subscribers, set()
+        for subscriber in subscribers:
+            subscriber.close()
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def stream(self, subscriber):
+        return EventStream(self, subscriber)
+
+
+# SSE 响应体：同步迭代用于线程服务端，异步服务端直接读取订阅者队列
+class EventStream:
+    def __init__(self, broadcaster, subscriber):
+        self.broadcaster = broadcaster
+        self.subscriber = subscriber
+
+    @property
+    def preamble(self):
+        return 'retry: {}\n\n'.format(RETRY_MS).encode('utf-8')
+
+    def __iter__(self):
+        yield self.preamble
+        subscriber = self.subscriber
+        while not subscriber.evicted:
+            event = subscriber.get(self.broadcaster.heartbeat)
+            if event is not None:
+                yield event
+            elif not subscriber.evicted:
+                # 心跳注释，防止连接被中间设备断开，也用于尽早发现断开的客户端
+                yield HEARTBEAT
+
+    def close(self):
+        self.broadcaster.unsubscribe(self.subscriber)
@@ -0,0 +1,150 @@
+import os
+import json
+import threading
+from datetime import datetime
+
+# 消息存储配置
+MAX_MESSAGES = 100
+# 日志行数超过容量的倍数时压缩重写
+JOURNAL_COMPACT_FACTOR = 10
+
+
+# 聊天消息环形缓冲：固定容量、O(1) 追加，ID 单调递增且不复用
+class MessageStore:
+    def __init__(self, capacity=MAX_MESSAGES, journal_path=None):
+        self.capacity = capacity
+        self.journal_path = None
+        self.cond = threading.Condition()
+        self.last_id = 0
+        self._buffer = [None] * capacity
+        self._start = 0
+        self._count = 0
+        self._journal = None
+        self._journal_lines = 0
+        self._listeners = []
+        if journal_path:
+            self.open_journal(journal_path)
+
+    def add_listener(self, callback):
+        # callback(message)，在持有锁时调用，保证与消息 ID 同序
+        self._listeners.append(callback)
+
+    def _at(self, index):
+        return self._buffer[(self._start + index) % self.capacity]
+
+    def _push(self, message):
+        if self._count < self.capacity:
+            self._buffer[(self._start + self._count) % self.capacity] = message
+            self._count += 1
+        else:
+            # 已满：覆盖最旧的一条
+            self._buffer[self._start] = message
+            self._start = (self._start + 1) % self.capacity
+        self.last_id = message['id']
+
+    def _index_after(self, since):
+        """二分查找第一条 ID 大于 since 的消息在缓冲中的位置"""
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._at(mid)['id'] <= since:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def append(self, sender, content):
+        with self.cond:
+            message = {
+                'id': self.last_id + 1,
+                'sender': sender,
+                'content': content,
+                'timestamp': datetime.now().isoformat()
+            }
+            self._push(message)
+            if self.journal_path:
+                self._write_journal(message)
+            self.cond.notify_all()
+            for callback in self._listeners:
+                try:
+                    callback(message)
+                except Exception:
+                    pass
+        return message
+
+    def recent(self, limit):
+        with self.cond:
+            start = max(0, self._count - limit)
+            return [self._at(i) for i in range(start, self._count)]
+
+    def after(self, since, limit):
+        """返回 ID 大于 since 的消息，最多 limit 条（取最新的）"""
+        with self.cond:
+            start = max(self._index_after(since), self._count - limit)
+            return [self._at(i) for i in range(start, self._count)]
+
+    def wait_for(self, since, timeout):
+        with self.cond:
+            return self.cond.wait_for(lambda: self.last_id > since, timeout=timeout)
+
+    def __len__(self):
+        with self.cond:
+            return self._count
+
+    # 追加日志：每条消息一行 JSON，启动时回放
+    def open_journal(self, path):
+        """启用追加日志并回放其中的历史消息"""
+        with self.cond:
+            self.close()
+            self.journal_path = path
+            self._journal_lines = 0
+            self._replay()
+
+    def _replay(self):
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    self._journal_lines += 1
+                    try:
+                        message = json.loads(line)
+                    except ValueError:
+                        # 写入中断留下的半行
+                        continue
+                    if isinstance(message, dict) and message.get('id', 0) > self.last_id:
+                        self._push(message)
+        except OSError:
+            pass
+
+    def _write_journal(self, message):
+        try:
+            if self._journal_lines >= self.capacity * JOURNAL_COMPACT_FACTOR:
+                self._compact_journal()
+            if self._journal is None:
+                folder = os.path.dirname(self.journal_path)
+                if folder and not os.path.exists(folder):
+                    os.makedirs(folder)
+                self._journal = open(self.journal_path, 'a', encoding='utf-8')
+            self._journal.write(json.dumps(message, ensure_ascii=False) + '\n')
+            self._journal.flush()
+            self._journal_lines += 1
+        except OSError:
+            # 日志只用于重启恢复，写入失败不影响发送
+            pass
+
+    def _compact_journal(self):
+        # 只保留缓冲中的消息，写入临时文件后原子替换
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        tmp_path = self.journal_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for i in range(self._count):
+                f.write(json.dumps(self._at(i), ensure_ascii=False) + '\n')
+        os.replace(tmp_path, self.journal_path)
+        self._journal_lines = self._count
+
+    def close(self):
+        with self.cond:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
@@ -0,0 +1,162 @@
+import time
+import bisect
+import threading
+
+# 指标配置
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Flask 在 before_request 中写入匹配到的路由规则，未匹配的请求（404 等）归入 UNMATCHED_ROUTE
+ROUTE_ENVIRON_KEY = 'lan_transfer.route'
+UNMATCHED_ROUTE = '<unmatched>'
+# asyncio 后端在事件循环中等待的长轮询也计入该指标
+LONG_POLLS_GAUGE = 'lan_transfer_long_polls_in_flight'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(labels, extra=()):
+    items = tuple(labels) + tuple(extra)
+    if not items:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, _escape(value)) for name, value in items) + '}'
+
+
+def _number(value):
+    if isinstance(value, float):
+        if value == float('inf'):
+            return '+Inf'
+        return repr(value) if value != int(value) else str(int(value))
+    return str(value)
+
+
+class _Shard:
+    __slots__ = ('counters', 'histograms')
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+
+# Prometheus 文本格式的指标：每个线程只写自己的分片，记录时不加锁，抓取时合并各分片。
+# 计数器与可增减的计量值（如进行中的长轮询）按分片求和；读取时复制字典只依赖 GIL，不会阻塞记录
+class Metrics:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._meta = {}
+        self._collectors = []
+
+    def describe(self, name, kind, help_text):
+        """登记指标类型（counter / gauge / histogram）与说明"""
+        self._meta[name] = (kind, help_text)
+
+    def add_collector(self, collector):
+        """collector() 在抓取时调用，返回 [(指标名, 标签元组, 值)]，用于目录大小等现成的状态"""
+        self._collectors.append(collector)
+
+    def _new_shard(self):
+        shard = _Shard()
+        self._local.counters = shard.counters
+        self._local.histograms = shard.histograms
+        with self._lock:
+            self._shards.append(shard)
+        return shard
+
+    def inc(self, name, labels=(), value=1):
+        try:
+            counters = self._local.counters
+        except AttributeError:
+            counters = self._new_shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        try:
+            histograms = self._local.histograms
+        except AttributeError:
+            histograms = self._new_shard().histograms
+        key = (name, labels)
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        histogram[0][bisect.bisect_left(self.buckets, value)] += 1
+        histogram[1] += value
+
+    def collect(self):
+        """合并各线程分片，返回 (计数器, 直方图)"""
+        with self._lock:
+            shards = list(self._shards)
+        counters = {}
+        histograms = {}
+        for shard in shards:
+            for key, value in shard.counters.copy().items():
+                counters[key] = counters.get(key, 0) + value
+            for key, (counts, total) in shard.histograms.copy().items():
+                merged = histograms.get(key)
+                if merged is None:
+                    merged = histograms[key] = [[0] * len(counts), 0.0]
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+        return counters, histograms
+
+    def render(self):
+        counters, histograms = self.collect()
+        samples = {}
+        for (name, labels), value in counters.items():
+            samples.setdefault(name, []).append((labels, value))
+        for collector in self._collectors:
+            for name, labels, value in collector():
+                samples.setdefault(name, []).append((labels, value))
+        for (name, labels), histogram in histograms.items():
+            samples.setdefault(name, []).append((labels, histogram))
+
+        lines = []
+        for name in sorted(samples):
+            kind, help_text = self._meta.get(name, ('untyped', ''))
+            if help_text:
+                lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            for labels, value in sorted(samples[name], key=lambda sample: sample[0]):
+                if kind != 'histogram':
+                    lines.append('{}{} {}'.format(name, _labels(labels), _number(value)))
+                    continue
+                counts, total = value
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    lines.append('{}_bucket{} {}'.format(name, _labels(labels, [('le', _number(float(bound)))]),
+                                                         cumulative))
+                lines.append('{}_sum{} {}'.format(name, _labels(labels), _number(total)))
+                lines.append('{}_count{} {}'.format(name, _labels(labels), cumulative))
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """按路由统计请求数与处理耗时（到响应头就绪为止，不含流式响应体的发送时间）"""
+
+    def __init__(self, app, metrics):
+        self.app = app
+        self.metrics = metrics
+
+    def __call__(self, environ, start_response):
+        state = []
+
+        def record_status(status, headers, exc_info=None):
+            state.append(status)
+            return start_response(status, headers, exc_info)
+
+        start = time.perf_counter()
+        try:
+            return self.app(environ, record_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            route = environ.get(ROUTE_ENVIRON_KEY) or UNMATCHED_ROUTE
+            method = environ.get('REQUEST_METHOD', '')
+            status = state[-1].split(' ', 1)[0] if state else '500'
+            self.metrics.inc('lan_transfer_http_requests_total',
+                             (('route', route), ('method', method), ('status', status)))
+            self.metrics.observe('lan_transfer_http_request_duration_seconds', (('route', route),), elapsed)
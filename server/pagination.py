@@ -0,0 +1,46 @@
+import json
+import base64
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+SORT_ORDERS = ('asc', 'desc')
+
+
+def encode_cursor(sort, order, key):
+    payload = json.dumps([sort, order, list(key)], separators=(',', ':'), ensure_ascii=False)
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, sort, order, types=None):
+    """解析游标，排序方式与请求不一致或格式错误时抛出 ValueError；types 为排序键各元素的类型"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, cursor_order, key = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError('Invalid cursor')
+    if cursor_sort != sort or cursor_order != order or not isinstance(key, list) or not key:
+        raise ValueError('Invalid cursor')
+    # 元素类型不对时与目录中的排序键比较会抛出 TypeError
+    if types is not None and (len(key) != len(types) or not all(
+            isinstance(value, kind) and not isinstance(value, bool) for value, kind in zip(key, types))):
+        raise ValueError('Invalid cursor')
+    return tuple(key)
+
+
+def parse_page_args(args, sort_keys, suffix=()):
+    """从查询参数中读取 sort / order / limit / cursor
+
+    sort_keys 为 {排序方式: 排序键元素类型}，suffix 为游标末尾附加元素的类型（如合并分页的分类名）
+    """
+    sort = args.get('sort', 'mtime')
+    order = args.get('order', 'desc')
+    if sort not in sort_keys or order not in SORT_ORDERS:
+        raise ValueError('Invalid sort')
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except (TypeError, ValueError):
+        raise ValueError('Invalid limit')
+    limit = max(1, min(MAX_PAGE_SIZE, limit))
+    cursor = args.get('cursor')
+    after = decode_cursor(cursor, sort, order, tuple(sort_keys[sort]) + tuple(suffix)) if cursor else None
+    return sort, order, limit, after
@@ -0,0 +1,245 @@
+import os
+import io
+import shutil
+import hashlib
+import threading
+import subprocess
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+# 缩略图配置
+PREVIEW_WIDTHS = (64, 128, 256, 512)
+PREVIEW_QUALITY = 80
+PREVIEW_WORKERS = 2
+PREVIEW_TIMEOUT = 30
+# 磁盘缓存上限，超出时按最近最少使用淘汰
+PREVIEW_CACHE_BYTES = 256 * 1024 * 1024
+# 最多记住多少个无法生成的缩略图，超出时同样按最近最少使用淘汰
+PREVIEW_FAILED_ENTRIES = 4096
+# 视频取第几秒的画面作为封面
+VIDEO_POSTER_SECONDS = 1
+
+FFMPEG = shutil.which('ffmpeg')
+
+
+class PreviewUnavailable(Exception):
+    pass
+
+
+def snap_width(width):
+    """请求的宽度向上取到固定档位，限制缓存中的变体数量"""
+    for candidate in PREVIEW_WIDTHS:
+        if width <= candidate:
+            return candidate
+    return PREVIEW_WIDTHS[-1]
+
+
+def can_preview(category):
+    if category == 'images':
+        return Image is not None or FFMPEG is not None
+    if category == 'videos':
+        return FFMPEG is not None
+    return False
+
+
+def _render_pillow(path, width):
+    with Image.open(path) as image:
+        # JPEG 可在解码时直接缩小，避免解码整张大图
+        image.draft('RGB', (width, width))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((width, width))
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[-1])
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        out = io.BytesIO()
+        image.save(out, 'JPEG', quality=PREVIEW_QUALITY, optimize=True)
+        return out.getvalue()
+
+
+def _render_ffmpeg(path, width, seek=None):
+    command = [FFMPEG, '-v', 'error', '-nostdin']
+    if seek:
+        command += ['-ss', str(seek)]
+    command += [
+        '-i', path, '-frames:v', '1',
+        '-vf', "scale='min({0},iw)':'min({0},ih)':force_original_aspect_ratio=decrease".format(width),
+        '-f', 'image2pipe', '-c:v', 'mjpeg', '-q:v', '5', '-',
+    ]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=PREVIEW_TIMEOUT)
+    return result.stdout if result.returncode == 0 else b''
+
+
+def render_preview(path, category, width):
+    """生成 JPEG 缩略图，无法解码时抛出 PreviewUnavailable"""
+    data = b''
+    try:
+        if category == 'images' and Image is not None:
+            data = _render_pillow(path, width)
+        elif FFMPEG is not None:
+            if category == 'videos':
+                data = _render_ffmpeg(path, width, VIDEO_POSTER_SECONDS)
+            # 图片，或时长不足 1 秒的视频
+            data = data or _render_ffmpeg(path, width)
+    except Exception:
+        data = b''
+    if not data:
+        raise PreviewUnavailable(path)
+    return data
+
+
+# 缩略图磁盘缓存：.previews/ab/<key>-<宽度>.jpg，key 为内容哈希（可用时）或文件标识；
+# 生成在后台线程池中进行，同一缩略图的并发请求共享一次生成
+class PreviewCache:
+    def __init__(self, root=None, budget=PREVIEW_CACHE_BYTES, workers=PREVIEW_WORKERS,
+                 failed_capacity=PREVIEW_FAILED_ENTRIES):
+        self.root = root
+        self.budget = budget
+        self.failed_capacity = failed_capacity
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._total = 0
+        self._pending = {}
+        # 无法生成的缩略图：缓存路径 -> 源文件路径，另按源文件索引，文件变化或删除时清除
+        self._failed = OrderedDict()
+        self._failed_sources = {}
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='preview')
+        self._loaded = False
+
+    def ensure_started(self, root):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            self.root = root
+            self._load()
+            self._loaded = True
+
+    def _load(self):
+        # 按修改时间恢复 LRU 顺序，命中时会更新文件的修改时间
+        found = []
+        if os.path.isdir(self.root):
+            for prefix in os.listdir(self.root):
+                folder = os.path.join(self.root, prefix)
+                if not os.path.isdir(folder):
+                    continue
+                for name in os.listdir(folder):
+                    path = os.path.join(folder, name)
+                    try:
+                        if name.endswith('.tmp'):
+                            os.remove(path)
+                            continue
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    found.append((stat.st_mtime, path, stat.st_size))
+        found.sort()
+        for _, path, size in found:
+            self._entries[path] = size
+            self._total += size
+        self._evict()
+
+    @staticmethod
+    def key_for(stat, digest=None):
+        if digest:
+            return digest
+        identity = '{}:{}:{}:{}'.format(stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        return 'i' + hashlib.sha1(identity.encode('ascii')).hexdigest()
+
+    def path(self, key, width):
+        return os.path.join(self.root, key[:2], '{}-{}.jpg'.format(key, width))
+
+    @property
+    def total_bytes(self):
+        with self._lock:
+            return self._total
+
+    def get(self, key, width, source, category, timeout=PREVIEW_TIMEOUT):
+        """返回缓存文件路径，必要时在线程池中生成；无法生成时抛出 PreviewUnavailable"""
+        path = self.path(key, width)
+        with self._lock:
+            if path in self._entries:
+                self._entries.move_to_end(path)
+                hit = True
+            elif path in self._failed:
+                self._failed.move_to_end(path)
+                raise PreviewUnavailable(source)
+            else:
+                hit = False
+                future = self._pending.get(path)
+                if future is None:
+                    future = self._executor.submit(self._generate, path, source, category, width)
+                    self._pending[path] = future
+        if hit:
+            try:
+                os.utime(path)
+                return path
+            except OSError:
+                # 缓存文件在目录外被删除
+                with self._lock:
+                    self._discard(path)
+                return self.get(key, width, source, category, timeout)
+        return future.result(timeout)
+
+    def _generate(self, path, source, category, width):
+        try:
+            data = render_preview(source, category, width)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            with self._lock:
+                self._pending.pop(path, None)
+                if isinstance(e, PreviewUnavailable):
+                    # 记住无法解码的文件，避免重复尝试
+                    self._mark_failed(path, source)
+            raise
+        with self._lock:
+            self._pending.pop(path, None)
+            self._entries[path] = len(data)
+            self._total += len(data)
+            self._evict()
+        return path
+
+    def _mark_failed(self, path, source):
+        self._failed[path] = source
+        self._failed.move_to_end(path)
+        self._failed_sources.setdefault(source, set()).add(path)
+        while len(self._failed) > self.failed_capacity:
+            old, old_source = self._failed.popitem(last=False)
+            paths = self._failed_sources.get(old_source)
+            if paths is not None:
+                paths.discard(old)
+                if not paths:
+                    del self._failed_sources[old_source]
+
+    def forget(self, source):
+        """源文件被修改或删除：清除其失败记录"""
+        with self._lock:
+            for path in self._failed_sources.pop(source, ()):
+                self._failed.pop(path, None)
+
+    def _discard(self, path):
+        size = self._entries.pop(path, None)
+        if size is not None:
+            self._total -= size
+
+    def _evict(self):
+        while self._total > self.budget and len(self._entries) > 1:
+            path, size = self._entries.popitem(last=False)
+            self._total -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
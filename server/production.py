@@ -0,0 +1,350 @@
+import os
+import sys
+import time
+import queue
+import signal
+import argparse
+import itertools
+import threading
+import configparser
+from .storage import EVICTION_POLICIES
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+# 生产模式默认配置，优先级：默认值 < 配置文件 < 环境变量 < 命令行参数
+BACKENDS = ('threaded', 'asyncio')
+DEFAULT_CONFIG = {
+    'backend': 'threaded',
+    'host': '0.0.0.0',
+    'port': None,
+    'upload_folder': os.path.join(os.getcwd(), 'uploads'),
+    'max_upload_mb': 500,
+    'workers': 64,
+    'backlog': 128,
+    'keepalive': 5.0,
+    'timeout': 60.0,
+    'drain_timeout': 30.0,
+    'quota_mb': 0,
+    'category_quotas': '',
+    'retention_days': 0.0,
+    'eviction': 'none',
+    'min_free_mb': 256,
+    'download_limit_kb': 0,
+    'upload_limit_kb': 0,
+    'client_download_limit_kb': 0,
+    'client_upload_limit_kb': 0,
+    'admin_token': '',
+    'slow_request_ms': 0,
+}
+CONFIG_TYPES = {
+    'port': int,
+    'max_upload_mb': int,
+    'workers': int,
+    'backlog': int,
+    'keepalive': float,
+    'timeout': float,
+    'drain_timeout': float,
+    'quota_mb': int,
+    'retention_days': float,
+    'min_free_mb': int,
+    'download_limit_kb': int,
+    'upload_limit_kb': int,
+    'client_download_limit_kb': int,
+    'client_upload_limit_kb': int,
+    'slow_request_ms': float,
+}
+ENV_PREFIX = 'LAN_TRANSFER_'
+CONFIG_SECTION = 'server'
+DEFAULT_CONFIG_NAME = 'lan_transfer.ini'
+
+
+def default_config_path():
+    # PyInstaller 打包后配置文件放在可执行文件旁边
+    if getattr(sys, 'frozen', False):
+        base = os.path.dirname(sys.executable)
+    else:
+        base = os.getcwd()
+    return os.path.join(base, DEFAULT_CONFIG_NAME)
+
+
+def _convert(key, value):
+    if value is None or value == '':
+        return None
+    return CONFIG_TYPES.get(key, str)(value)
+
+
+def load_config(argv=None, environ=None):
+    """合并配置文件、环境变量与命令行参数，返回配置字典"""
+    environ = os.environ if environ is None else environ
+    parser = argparse.ArgumentParser(description='LAN Transfer server')
+    parser.add_argument('--config', help='INI 配置文件路径（[server] 段），默认 ./' + DEFAULT_CONFIG_NAME)
+    parser.add_argument('--backend', choices=BACKENDS, help='服务端实现：threaded（线程池）或 asyncio')
+    parser.add_argument('--host', help='监听地址')
+    parser.add_argument('--port', type=int, help='端口；未指定且在终端中运行时交互输入')
+    parser.add_argument('--upload-folder', help='上传文件目录')
+    parser.add_argument('--max-upload-mb', type=int, help='单次请求最大大小 (MB)')
+    parser.add_argument('--workers', type=int, help='工作线程数')
+    parser.add_argument('--backlog', type=int, help='监听队列长度')
+    parser.add_argument('--keepalive', type=float, help='keep-alive 空闲超时（秒）')
+    parser.add_argument('--timeout', type=float, help='单次读写超时（秒）')
+    parser.add_argument('--drain-timeout', type=float, help='停止时等待进行中请求的最长时间（秒）')
+    parser.add_argument('--quota-mb', type=int, help='上传目录总配额 (MB)，0 表示不限')
+    parser.add_argument('--category-quotas', help='分类配额 (MB)，如 videos=4096,images=1024')
+    parser.add_argument('--retention-days', type=float, help='超过该天数未下载的文件自动删除，0 表示永久保留')
+    parser.add_argument('--eviction', choices=EVICTION_POLICIES,
+                        help='空间不足时的淘汰策略：none、lru（最久未下载）、age（最早上传）、size（最大优先）')
+    parser.add_argument('--min-free-mb', type=int, help='磁盘至少保留的剩余空间 (MB)')
+    parser.add_argument('--download-limit-kb', type=int, help='全部下载的总速率上限 (KB/s)，0 表示不限')
+    parser.add_argument('--upload-limit-kb', type=int, help='全部上传的总速率上限 (KB/s)，0 表示不限')
+    parser.add_argument('--client-download-limit-kb', type=int, help='每个客户端 IP 的下载速率上限 (KB/s)')
+    parser.add_argument('--client-upload-limit-kb', type=int, help='每个客户端 IP 的上传速率上限 (KB/s)')
+    parser.add_argument('--admin-token', help='非本机访问管理接口时需要在 X-Admin-Token 头中提供的令牌')
+    parser.add_argument('--slow-request-ms', type=float, help='处理时间超过该毫秒数的请求记入慢请求日志，0 表示关闭')
+    args = parser.parse_args(argv)
+
+    config = dict(DEFAULT_CONFIG)
+
+    config_path = args.config or environ.get(ENV_PREFIX + 'CONFIG') or default_config_path()
+    if os.path.isfile(config_path):
+        ini = configparser.ConfigParser(inline_comment_prefixes=(';', '#'))
+        ini.read(config_path, encoding='utf-8')
+        if ini.has_section(CONFIG_SECTION):
+            for key, value in ini.items(CONFIG_SECTION):
+                key = key.replace('-', '_')
+                if key in config:
+                    config[key] = _convert(key, value)
+    elif args.config:
+        parser.error('config file not found: ' + args.config)
+
+    for key in config:
+        value = environ.get(ENV_PREFIX + key.upper())
+        if value is not None:
+            config[key] = _convert(key, value)
+
+    for key in config:
+        value = getattr(args, key, None)
+        if value is not None:
+            config[key] = value
+
+    if config['backend'] not in BACKENDS:
+        parser.error('invalid backend: ' + str(config['backend']))
+    if config['eviction'] not in EVICTION_POLICIES:
+        parser.error('invalid eviction policy: ' + str(config['eviction']))
+    config['upload_folder'] = os.path.abspath(config['upload_folder'])
+    return config
+
+
+# 请求体剩余不超过该大小时读掉后继续复用连接，否则响应后关闭
+KEEPALIVE_DRAIN_LIMIT = 64 * 1024
+# 应用通过该键取得 detach 回调：SSE、长轮询等长时间挂起的请求调用后改由独立线程处理，不占用线程池
+DETACH_ENVIRON_KEY = 'lan_transfer.detach'
+# 同时挂起的长连接上限，超出时 detach 返回 False
+MAX_STREAMS = 1024
+
+
+class _BodyReader:
+    """把请求体读取限制在 Content-Length 之内，避免读到同一连接上的下一个请求"""
+
+    def __init__(self, raw, length):
+        self._raw = raw
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self._raw.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def readline(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self._raw.readline(size)
+        self.remaining -= len(data)
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class PooledRequestHandler(WSGIRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.connection.settimeout(self.server.request_timeout)
+        self.requests_handled = 0
+
+    def handle_one_request(self):
+        # 等待下一个请求时使用 keep-alive 超时，读到请求行后切换为读写超时
+        if self.requests_handled:
+            self.connection.settimeout(self.server.keepalive_timeout)
+        super().handle_one_request()
+        self.requests_handled += 1
+        if self.server.draining:
+            self.close_connection = True
+
+    def parse_request(self):
+        self.connection.settimeout(self.server.request_timeout)
+        return super().parse_request()
+
+    def make_environ(self):
+        environ = super().make_environ()
+        environ[DETACH_ENVIRON_KEY] = self.server.detach
+        return environ
+
+    def run_wsgi(self):
+        raw = self.rfile
+        body = None
+        if 'chunked' not in self.headers.get('Transfer-Encoding', '').lower():
+            try:
+                body = _BodyReader(raw, int(self.headers.get('Content-Length') or 0))
+            except ValueError:
+                body = None
+        if body is None:
+            self.close_connection = True
+        else:
+            self.rfile = body
+        try:
+            super().run_wsgi()
+        finally:
+            self.rfile = raw
+        if body is not None and 0 < body.remaining <= KEEPALIVE_DRAIN_LIMIT:
+            # 应用没有读取的请求体（如 404、413），读掉后才能处理下一个请求
+            try:
+                while body.read(body.remaining):
+                    pass
+            except OSError:
+                pass
+        if body is not None and body.remaining > 0:
+            self.close_connection = True
+
+    def send_header(self, keyword, value):
+        # werkzeug 总是发送 Connection: close；请求体可以安全读完时保持连接
+        if keyword.lower() == 'connection' and value.lower() == 'close' and self._can_keep_alive():
+            return
+        super().send_header(keyword, value)
+
+    def _can_keep_alive(self):
+        return (isinstance(self.rfile, _BodyReader) and self.rfile.remaining <= KEEPALIVE_DRAIN_LIMIT
+                and self.request_version == 'HTTP/1.1' and not self.close_connection
+                and not self.server.draining)
+
+
+# 固定大小线程池的 WSGI 服务器：连接数超出时在队列中等待，不会无限创建线程。
+# SSE 与长轮询在等待期间调用 detach：当前线程只继续服务这一个连接，另起一个线程补足线程池，
+# 因此打开的页面再多也不会占满工作线程（长连接总数受 max_streams 限制）
+class PooledWSGIServer(BaseWSGIServer):
+    multithread = True
+
+    def __init__(self, host, port, app, workers=64, backlog=128, keepalive_timeout=5.0, request_timeout=60.0,
+                 max_streams=MAX_STREAMS):
+        self.backlog = backlog
+        self.keepalive_timeout = keepalive_timeout
+        self.request_timeout = request_timeout
+        self.max_streams = max_streams
+        self.draining = False
+        self.streams = 0
+        self._requests = queue.Queue(maxsize=workers)
+        self._active = 0
+        self._active_lock = threading.Lock()
+        self._local = threading.local()
+        self._ids = itertools.count()
+        super().__init__(host, port, app, handler=PooledRequestHandler)
+        for _ in range(workers):
+            self._start_worker()
+
+    def _start_worker(self):
+        thread = threading.Thread(target=self._worker, name='http-worker-{}'.format(next(self._ids)), daemon=True)
+        thread.start()
+
+    def server_activate(self):
+        self.socket.listen(self.backlog)
+
+    def process_request(self, request, client_address):
+        # 队列已满时阻塞 accept，多出的连接留在内核监听队列中
+        with self._active_lock:
+            self._active += 1
+        self._requests.put((request, client_address))
+
+    def _worker(self):
+        local = self._local
+        local.worker = True
+        local.detached = False
+        while not local.detached:
+            request, client_address = self._requests.get()
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+                with self._active_lock:
+                    self._active -= 1
+                    if local.detached:
+                        self.streams -= 1
+
+    def detach(self):
+        """当前请求将长时间挂起：让出线程池中的位置。已达到长连接上限时返回 False"""
+        local = self._local
+        if not getattr(local, 'worker', False) or local.detached:
+            return True
+        with self._active_lock:
+            if self.streams >= self.max_streams:
+                return False
+            self.streams += 1
+        local.detached = True
+        threading.current_thread().name += '-stream'
+        self._start_worker()
+        return True
+
+    @property
+    def busy(self):
+        # 已接受但尚未处理完的连接数
+        with self._active_lock:
+            return self._active
+
+    def drain(self, timeout):
+        """等待进行中的请求完成，超时返回 False"""
+        deadline = time.time() + timeout
+        while self.busy:
+            if time.time() >= deadline:
+                return False
+            time.sleep(0.1)
+        return True
+
+
+def serve(app, config, on_drain=()):
+    """以生产模式运行，收到 SIGTERM / SIGINT 后停止接受新连接并等待进行中的传输完成"""
+    server = PooledWSGIServer(
+        config['host'], config['port'], app,
+        workers=config['workers'],
+        backlog=config['backlog'],
+        keepalive_timeout=config['keepalive'],
+        request_timeout=config['timeout'],
+    )
+
+    def handle_signal(signum, frame):
+        if server.draining:
+            # 再次收到信号时立即退出
+            raise SystemExit(1)
+        server.draining = True
+        # shutdown 会等待 serve_forever 返回，不能在运行它的主线程中直接调用
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    if hasattr(signal, 'SIGTERM'):
+        signal.signal(signal.SIGTERM, handle_signal)
+
+    server.serve_forever()
+
+    for callback in on_drain:
+        callback()
+    if not server.drain(config['drain_timeout']):
+        print('Drain timeout, {} request(s) still running'.format(server.busy), file=sys.stderr)
+    return server
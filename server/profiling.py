@@ -0,0 +1,332 @@
+import os
+import sys
+import time
+import itertools
+import threading
+import tracemalloc
+from collections import deque
+from .metrics import ROUTE_ENVIRON_KEY, UNMATCHED_ROUTE
+
+# 性能分析配置：默认全部关闭，关闭时不安装任何钩子
+PHASES = ('stat', 'read', 'write', 'serialize')
+# 不属于以上阶段的时间：路由、业务逻辑、限速等待等
+OTHER_PHASE = 'app'
+SLOW_LOG_SIZE = 200
+# 采样间隔与最长采样时间（忘记停止时自动结束）
+SAMPLE_INTERVAL = 0.005
+MAX_SAMPLE_SECONDS = 600
+MAX_STACK_DEPTH = 64
+# 栈顶为这些函数的线程在等待任务或连接，默认不计入折叠栈
+IDLE_FRAMES = {
+    ('threading.py', 'wait'), ('selectors.py', 'select'), ('queue.py', 'get'),
+    ('socket.py', 'accept'), ('base_events.py', '_run_once'),
+}
+MEMORY_FRAMES = 16
+MAX_SNAPSHOTS = 8
+MEMORY_TOP = 30
+
+
+class _Local(threading.local):
+    # 类属性作默认值：未计时的线程读取时不会抛出再捕获 AttributeError
+    timing = None
+
+
+_local = _Local()
+
+
+class RequestTiming:
+    """把一次请求的耗时划分到各阶段：切换阶段时，上一阶段累计到切换为止的时间"""
+    __slots__ = ('phases', 'current', 'mark')
+
+    def __init__(self):
+        self.phases = {}
+        self.current = OTHER_PHASE
+        self.mark = time.perf_counter()
+
+    def switch(self, name):
+        now = time.perf_counter()
+        self.phases[self.current] = self.phases.get(self.current, 0.0) + now - self.mark
+        previous = self.current
+        self.current = name
+        self.mark = now
+        return previous
+
+
+class _Phase:
+    __slots__ = ('timing', 'name', 'previous')
+
+    def __init__(self, timing, name):
+        self.timing = timing
+        self.name = name
+
+    def __enter__(self):
+        self.previous = self.timing.switch(self.name)
+        return self
+
+    def __exit__(self, *exc):
+        self.timing.switch(self.previous)
+        return False
+
+
+class _NullPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_PHASE = _NullPhase()
+
+
+def phase(name):
+    """标记一段代码所属的阶段（可嵌套，内层时间不计入外层）；当前线程没有计时中的请求时为空操作"""
+    timing = _local.timing
+    if timing is None:
+        return NULL_PHASE
+    return _Phase(timing, name)
+
+
+class TimedInput:
+    """读取请求体的时间计入 read 阶段"""
+
+    def __init__(self, raw, timing):
+        self._raw = raw
+        self._timing = timing
+
+    def _call(self, method, *args):
+        previous = self._timing.switch('read')
+        try:
+            return method(*args)
+        finally:
+            self._timing.switch(previous)
+
+    def read(self, *args):
+        return self._call(self._raw.read, *args)
+
+    def readline(self, *args):
+        return self._call(self._raw.readline, *args)
+
+    def readinto(self, buffer):
+        return self._call(self._raw.readinto, buffer)
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+
+class TimingMiddleware:
+    """按阶段统计每个请求的耗时（到响应头就绪为止，响应体的发送见传输列表），
+    超过阈值的请求记入慢请求日志并输出到 stderr；阈值为 0 时直接调用应用"""
+
+    def __init__(self, app, slow_seconds=0.0, size=SLOW_LOG_SIZE):
+        self.app = app
+        self.slow_seconds = slow_seconds
+        self.slow = deque(maxlen=size)
+        self.slow_total = 0
+
+    def configure(self, slow_seconds):
+        self.slow_seconds = max(float(slow_seconds or 0), 0.0)
+
+    def __call__(self, environ, start_response):
+        if not self.slow_seconds:
+            return self.app(environ, start_response)
+        return self._timed(environ, start_response)
+
+    def _timed(self, environ, start_response):
+        state = []
+
+        def record_status(status, headers, exc_info=None):
+            state.append(status)
+            return start_response(status, headers, exc_info)
+
+        timing = RequestTiming()
+        start = timing.mark
+        if environ.get('wsgi.input') is not None:
+            environ['wsgi.input'] = TimedInput(environ['wsgi.input'], timing)
+        _local.timing = timing
+        try:
+            return self.app(environ, record_status)
+        finally:
+            _local.timing = None
+            timing.switch(OTHER_PHASE)
+            elapsed = time.perf_counter() - start
+            if elapsed >= self.slow_seconds:
+                self._record(environ, state[-1] if state else '500', elapsed, timing.phases)
+
+    def _record(self, environ, status, elapsed, phases):
+        entry = {
+            'time': time.time(),
+            'client': environ.get('REMOTE_ADDR', ''),
+            'method': environ.get('REQUEST_METHOD', ''),
+            'path': environ.get('PATH_INFO', ''),
+            'query': environ.get('QUERY_STRING', ''),
+            'route': environ.get(ROUTE_ENVIRON_KEY) or UNMATCHED_ROUTE,
+            'status': int(status.split(' ', 1)[0]),
+            'duration_ms': round(elapsed * 1000, 2),
+            'phases_ms': {name: round(phases.get(name, 0.0) * 1000, 2) for name in PHASES + (OTHER_PHASE,)},
+        }
+        self.slow.append(entry)
+        self.slow_total += 1
+        target = entry['path'] + ('?' + entry['query'] if entry['query'] else '')
+        breakdown = ' '.join('{}={}'.format(name, value) for name, value in entry['phases_ms'].items())
+        print('Slow request {}ms {} {} [{}] {} {}'.format(entry['duration_ms'], entry['method'], target,
+                                                         entry['route'], entry['status'], breakdown), file=sys.stderr)
+
+    def recent(self):
+        return list(self.slow)
+
+
+def _frame_name(code):
+    return '{}:{}'.format(os.path.basename(code.co_filename), code.co_name)
+
+
+class SamplingProfiler:
+    """定时采集其他线程的调用栈，汇总为折叠栈格式（每行“根;...;栈顶 次数”，flamegraph.pl 与 speedscope 可直接读取）。
+    只在采样期间存在采样线程，停止后没有任何开销"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.stacks = {}
+        self.samples = 0
+        self.interval = SAMPLE_INTERVAL
+        self.started = None
+        self.stopped = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, interval=SAMPLE_INTERVAL, seconds=MAX_SAMPLE_SECONDS):
+        """开始新一轮采样并清空上一轮的结果；已在采样时返回 False"""
+        with self._lock:
+            if self._thread is not None:
+                return False
+            self.stacks = {}
+            self.samples = 0
+            self.interval = interval
+            self.started = time.time()
+            self.stopped = None
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(interval, seconds),
+                                            name='lan-transfer-profiler', daemon=True)
+            self._thread.start()
+        return True
+
+    def stop(self):
+        with self._lock:
+            thread = self._thread
+            if thread is None:
+                return False
+            self._stop.set()
+        thread.join()
+        return True
+
+    def _run(self, interval, seconds):
+        me = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        stacks = self.stacks
+        try:
+            while not self._stop.wait(interval) and time.monotonic() < deadline:
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    names = []
+                    while frame is not None and len(names) < MAX_STACK_DEPTH:
+                        names.append(_frame_name(frame.f_code))
+                        frame = frame.f_back
+                    key = ';'.join(reversed(names))
+                    stacks[key] = stacks.get(key, 0) + 1
+                self.samples += 1
+        finally:
+            with self._lock:
+                self._thread = None
+                self.stopped = time.time()
+
+    def collapsed(self, include_idle=False):
+        lines = []
+        for stack, count in sorted(self.stacks.copy().items(), key=lambda item: -item[1]):
+            leaf = stack.rpartition(';')[2]
+            if not include_idle and tuple(leaf.split(':', 1)) in IDLE_FRAMES:
+                continue
+            lines.append('{} {}'.format(stack, count))
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def status(self):
+        return {
+            'running': self.running,
+            'interval_ms': round(self.interval * 1000, 3),
+            'samples': self.samples,
+            'stacks': len(self.stacks),
+            'started': self.started,
+            'stopped': self.stopped,
+        }
+
+
+class MemoryTracer:
+    """tracemalloc 快照：第一次拍快照时开始跟踪，之后可按代码行比较任意两次快照之间的内存变化"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.snapshots = []
+        self.started_here = False
+
+    def snapshot(self, frames=MEMORY_FRAMES):
+        """拍一次快照，返回快照信息；跟踪开始后的分配才会被记录"""
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+                self.started_here = True
+            snapshot = tracemalloc.take_snapshot().filter_traces(
+                (tracemalloc.Filter(False, tracemalloc.__file__),))
+            current, peak = tracemalloc.get_traced_memory()
+            info = {'id': next(self._ids), 'time': time.time(), 'traced_bytes': current, 'peak_bytes': peak}
+            self.snapshots.append((info, snapshot))
+            del self.snapshots[:-MAX_SNAPSHOTS]
+            return dict(info)
+
+    def diff(self, first=None, second=None, limit=MEMORY_TOP, key_type='lineno'):
+        """比较两次快照（默认最近两次），按增长量从大到小返回；快照不存在时抛出 KeyError"""
+        with self._lock:
+            by_id = {info['id']: (info, snapshot) for info, snapshot in self.snapshots}
+            if first is None or second is None:
+                if len(self.snapshots) < 2:
+                    raise KeyError('need two snapshots')
+                ids = [info['id'] for info, _ in self.snapshots]
+                first = ids[-2] if first is None else first
+                second = ids[-1] if second is None else second
+            old_info, old = by_id[first]
+            new_info, new = by_id[second]
+        stats = new.compare_to(old, key_type)
+        return {
+            'from': old_info,
+            'to': new_info,
+            'size_diff': sum(stat.size_diff for stat in stats),
+            'top': [{
+                'location': '{}:{}'.format(stat.traceback[0].filename, stat.traceback[0].lineno),
+                'size_diff': stat.size_diff,
+                'size': stat.size,
+                'count_diff': stat.count_diff,
+                'count': stat.count,
+            } for stat in stats[:limit]],
+        }
+
+    def stop(self):
+        with self._lock:
+            self.snapshots = []
+            if self.started_here and tracemalloc.is_tracing():
+                tracemalloc.stop()
+            self.started_here = False
+
+    def status(self):
+        return {
+            'tracing': tracemalloc.is_tracing(),
+            'snapshots': [dict(info) for info, _ in self.snapshots],
+        }
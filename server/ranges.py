@@ -0,0 +1,232 @@
+import os
+import sys
+import uuid
+import select
+import socket
+from email.utils import formatdate
+
+# 文件发送配置
+READ_BLOCK_SIZE = 256 * 1024
+SENDFILE_BLOCK_SIZE = 16 * 1024 * 1024
+MAX_RANGES = 16
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def file_etag(stat):
+    return '"{:x}-{:x}"'.format(stat.st_mtime_ns, stat.st_size)
+
+
+def http_date(timestamp):
+    return formatdate(timestamp, usegmt=True)
+
+
+def parse_range_header(header, size):
+    """解析 Range 头，返回合并后的 (start, end) 列表（闭区间）；格式无法识别时返回 None"""
+    if not header:
+        return None
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not spec:
+        return None
+
+    ranges = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        first, sep, last = item.partition('-')
+        if not sep:
+            return None
+        try:
+            if first == '':
+                # 后缀区间：bytes=-500 表示最后 500 字节
+                length = int(last)
+                if length <= 0:
+                    continue
+                start, end = max(0, size - length), size - 1
+            else:
+                start = int(first)
+                end = int(last) if last else size - 1
+                if last and start > end:
+                    return None
+                end = min(end, size - 1)
+        except ValueError:
+            return None
+        if start < size and start <= end:
+            ranges.append((start, end))
+
+    if not ranges:
+        raise RangeNotSatisfiable()
+
+    # 合并重叠或相邻的区间，避免重复发送
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    if len(merged) > MAX_RANGES:
+        return None
+    return merged
+
+
+def if_range_matches(if_range, etag):
+    if not if_range:
+        return True
+    # If-Range 只接受强校验：Last-Modified 精确到秒，同一秒内再次修改时日期不变，
+    # 无法确认是强校验，因此日期一律按不匹配处理，返回完整内容
+    return if_range.strip() == etag
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    tags = [t.strip() for t in if_none_match.split(',')]
+    return etag in tags or 'W/' + etag in tags
+
+
+class FileResponsePlan:
+    """描述一次文件响应：状态码、响应头以及需要发送的片段"""
+
+    def __init__(self, status, headers, segments):
+        self.status = status
+        self.headers = headers
+        # 片段为 bytes 或 (offset, length)
+        self.segments = segments
+
+    @property
+    def content_length(self):
+        return sum(len(s) if isinstance(s, bytes) else s[1] for s in self.segments)
+
+
+def plan_file_response(stat, content_type, range_header=None, if_range=None, if_none_match=None):
+    size = stat.st_size
+    etag = file_etag(stat)
+    headers = [
+        ('Accept-Ranges', 'bytes'),
+        ('ETag', etag),
+        ('Last-Modified', http_date(stat.st_mtime)),
+    ]
+
+    if etag_matches(if_none_match, etag):
+        return FileResponsePlan(304, headers, [])
+
+    ranges = None
+    if range_header and if_range_matches(if_range, etag):
+        try:
+            ranges = parse_range_header(range_header, size)
+        except RangeNotSatisfiable:
+            headers.append(('Content-Range', 'bytes */{}'.format(size)))
+            return FileResponsePlan(416, headers, [])
+
+    if not ranges:
+        headers.append(('Content-Type', content_type))
+        plan = FileResponsePlan(200, headers, [(0, size)] if size else [])
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        headers.append(('Content-Type', content_type))
+        headers.append(('Content-Range', 'bytes {}-{}/{}'.format(start, end, size)))
+        plan = FileResponsePlan(206, headers, [(start, end - start + 1)])
+    else:
+        boundary = uuid.uuid4().hex
+        segments = []
+        for start, end in ranges:
+            part_head = '--{}\r\nContent-Type: {}\r\nContent-Range: bytes {}-{}/{}\r\n\r\n'.format(
+                boundary, content_type, start, end, size)
+            segments.append(part_head.encode('latin-1'))
+            segments.append((start, end - start + 1))
+            segments.append(b'\r\n')
+        segments.append('--{}--\r\n'.format(boundary).encode('latin-1'))
+        headers.append(('Content-Type', 'multipart/byteranges; boundary=' + boundary))
+        plan = FileResponsePlan(206, headers, segments)
+
+    plan.headers.append(('Content-Length', str(plan.content_length)))
+    return plan
+
+
+def sendfile_socket(environ):
+    """返回可用于 os.sendfile 的 socket；不支持时返回 None"""
+    if not hasattr(os, 'sendfile') or not sys.platform.startswith('linux'):
+        return None
+    if environ.get('wsgi.url_scheme') != 'http':
+        return None
+    sock = environ.get('werkzeug.socket')
+    if sock is None or not hasattr(sock, 'fileno'):
+        return None
+    return sock
+
+
+class FileRangeStream:
+    """按片段发送文件内容的 WSGI 响应体；可用时走 os.sendfile 零拷贝。
+    transfer 为 shaping.Transfer 时按其限速发送文件内容，关闭时一并结束"""
+
+    def __init__(self, path, segments, sock=None, block_size=READ_BLOCK_SIZE, transfer=None):
+        self.path = path
+        self.segments = segments
+        self.sock = sock
+        self.block_size = block_size
+        self.transfer = transfer
+        self._file = None
+
+    def __iter__(self):
+        self._file = open(self.path, 'rb')
+        if self.sock is not None:
+            # 先让服务器写出响应头，再直接从页缓存发送到 socket
+            yield b''
+            for segment in self.segments:
+                if isinstance(segment, bytes):
+                    self.sock.sendall(segment)
+                else:
+                    self._sendfile(*segment)
+            return
+
+        for segment in self.segments:
+            if isinstance(segment, bytes):
+                yield segment
+                continue
+            offset, remaining = segment
+            self._file.seek(offset)
+            while remaining > 0:
+                size = min(self.block_size, remaining)
+                if self.transfer is not None:
+                    size = self.transfer.throttle(size)
+                block = self._file.read(size)
+                if not block:
+                    return
+                remaining -= len(block)
+                yield block
+
+    def _sendfile(self, offset, remaining):
+        out_fd = self.sock.fileno()
+        in_fd = self._file.fileno()
+        count = 0
+        while remaining > 0:
+            if count <= 0:
+                count = min(SENDFILE_BLOCK_SIZE, remaining)
+                if self.transfer is not None:
+                    count = self.transfer.throttle(count)
+            try:
+                sent = os.sendfile(out_fd, in_fd, offset, count)
+            except BlockingIOError:
+                # socket 设置了超时即为非阻塞模式，按同样的超时等待可写，对端停止读取时放弃发送
+                if not select.select([], [out_fd], [], self.sock.gettimeout())[1]:
+                    raise socket.timeout('timed out')
+                continue
+            if sent == 0:
+                return
+            offset += sent
+            remaining -= sent
+            count -= sent
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.transfer is not None:
+            self.transfer.close()
@@ -0,0 +1,308 @@
+import time
+import itertools
+import threading
+from collections import deque
+
+# 带宽整形配置
+DIRECTIONS = ('up', 'down')
+# 每次向令牌桶预约的字节数；越小各传输交替越细，单次 sendfile 也越小
+SHAPING_QUANTUM = 64 * 1024
+# 空闲时允许的突发量（秒数 × 速率），小文件可以立即发出
+BURST_SECONDS = 0.1
+MAX_WEIGHT = 16
+# asyncio 后端在事件循环中限速接收请求体时写入 environ，应用不再重复限速
+SHAPED_ENVIRON_KEY = 'lan_transfer.shaped'
+# 上传对应的 Transfer，请求结束时关闭
+UPLOAD_ENVIRON_KEY = 'lan_transfer.upload'
+# 不限速时单次放行的上限，使传输列表中的进度与实际发送同步（asyncio 后端否则一次放行整个文件）
+PROGRESS_BLOCK = 4 * 1024 * 1024
+# 传输列表在查询时采样进度，瞬时速率按最近 RATE_SAMPLES 个间隔不小于 RATE_INTERVAL 秒的采样计算
+RATE_INTERVAL = 1.0
+RATE_SAMPLES = 5
+
+
+class TokenBucket:
+    """预约式令牌桶：令牌可以透支，调用方按返回的秒数等待后再发送。
+    各传输每次只预约一个 quantum，透支额不超过活跃传输数 × quantum，
+    因此并发传输按预约顺序轮流获得带宽；rate 为 0 表示不限速"""
+
+    def __init__(self, rate=0):
+        self._lock = threading.Lock()
+        self.rate = 0
+        self.burst = 0
+        self._tokens = 0.0
+        self._last = time.monotonic()
+        self.configure(rate)
+
+    def configure(self, rate):
+        with self._lock:
+            self.rate = max(int(rate or 0), 0)
+            self.burst = max(self.rate * BURST_SECONDS, SHAPING_QUANTUM)
+            self._tokens = min(self._tokens, self.burst)
+            self._last = time.monotonic()
+
+    def reserve(self, size):
+        """预约 size 字节，返回需要等待的秒数"""
+        with self._lock:
+            if not self.rate:
+                return 0.0
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= size
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+
+class Transfer:
+    """一次上传或下载；grant 不阻塞，供 asyncio 使用，throttle 在线程中直接等待。
+    name / size / offset 只用于传输列表展示：offset 为续传或分块上传之前已完成的字节数"""
+
+    def __init__(self, shaper, client, direction, weight, category=None, name=''):
+        self.id = next(shaper.ids)
+        self.shaper = shaper
+        self.client = client
+        self.direction = direction
+        self.weight = weight
+        # 上传在解析出文件名后才能确定分类，可以在传输过程中设置
+        self.category = category
+        self.name = name
+        self.size = None
+        self.offset = 0
+        self.bytes = 0
+        self.waited = 0.0
+        self.started = time.time()
+        self._clock = time.monotonic()
+        self._samples = deque(maxlen=RATE_SAMPLES)
+        self.closed = False
+
+    def grant(self, size):
+        """返回 (本次可发送的字节数, 发送前需等待的秒数)"""
+        buckets = self.shaper.buckets(self.client, self.direction)
+        if buckets:
+            size = min(size, SHAPING_QUANTUM * self.weight)
+            delay = max(bucket.reserve(size) for bucket in buckets)
+        else:
+            size = min(size, PROGRESS_BLOCK)
+            delay = 0.0
+        self.bytes += size
+        self.waited += delay
+        return size, delay
+
+    def throttle(self, size):
+        size, delay = self.grant(size)
+        if delay:
+            time.sleep(delay)
+        return size
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.shaper.finish(self)
+
+    def progress(self, now):
+        """在 shaper 锁内调用：记录一次进度采样，返回传输列表中的一项"""
+        transferred = self.bytes
+        elapsed = now - self._clock
+        if not self._samples or now - self._samples[-1][0] >= RATE_INTERVAL:
+            self._samples.append((now, transferred))
+        average = transferred / elapsed if elapsed > 0 else 0.0
+        since, base = self._samples[0]
+        # 采样不足一个间隔时（刚开始或刚开始查询）用平均速率代替；传输停滞时瞬时速率逐渐降为 0
+        rate = (transferred - base) / (now - since) if now - since >= RATE_INTERVAL else average
+        done = self.offset + transferred
+        eta = None
+        if self.size is not None and rate > 0:
+            eta = round(max(self.size - done, 0) / rate, 1)
+        return {
+            'id': self.id,
+            'client': self.client,
+            'direction': self.direction,
+            'category': self.category,
+            'name': self.name,
+            'bytes': done,
+            'size': self.size,
+            'started': self.started,
+            'elapsed': round(elapsed, 1),
+            'rate': round(rate),
+            'average_rate': round(average),
+            'eta': eta,
+            'throttled_seconds': round(self.waited, 3),
+        }
+
+
+# 按客户端 IP 与全局两级令牌桶限速，上传与下载分别计算；
+# 同一桶内的活跃传输轮流预约，权重为 w 的传输每轮预约 w 个 quantum
+class BandwidthShaper:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.limits = {direction: 0 for direction in DIRECTIONS}
+        self.client_limits = {direction: 0 for direction in DIRECTIONS}
+        self.weights = {}
+        self._global = {direction: TokenBucket() for direction in DIRECTIONS}
+        self._clients = {}
+        self._active = {}
+        self.total_bytes = {direction: 0 for direction in DIRECTIONS}
+        self.total_waited = {direction: 0.0 for direction in DIRECTIONS}
+        self.completed = {direction: 0 for direction in DIRECTIONS}
+        self._category_bytes = {}
+        self.ids = itertools.count(1)
+
+    def configure(self, limits=None, client_limits=None, weights=None):
+        """更新限速（字节/秒，0 为不限）与客户端权重，对进行中的传输立即生效；参数无效时抛出 ValueError"""
+        limits = self._validate_limits(limits)
+        client_limits = self._validate_limits(client_limits)
+        if weights is not None:
+            if not isinstance(weights, dict):
+                raise ValueError('weights must be an object')
+            weights = {str(client): int(weight) for client, weight in weights.items()}
+            if any(not 1 <= weight <= MAX_WEIGHT for weight in weights.values()):
+                raise ValueError('weight must be between 1 and {}'.format(MAX_WEIGHT))
+        with self._lock:
+            for direction, rate in limits.items():
+                self.limits[direction] = rate
+                self._global[direction].configure(rate)
+            for direction, rate in client_limits.items():
+                self.client_limits[direction] = rate
+                for (client, bucket_direction), bucket in self._clients.items():
+                    if bucket_direction == direction:
+                        bucket.configure(rate)
+            if weights is not None:
+                self.weights = weights
+                for transfer in self._active:
+                    transfer.weight = weights.get(transfer.client, 1)
+
+    @staticmethod
+    def _validate_limits(limits):
+        if limits is None:
+            return {}
+        if not isinstance(limits, dict) or any(direction not in DIRECTIONS for direction in limits):
+            raise ValueError('limits must map "up"/"down" to bytes per second')
+        result = {direction: int(rate or 0) for direction, rate in limits.items()}
+        if any(rate < 0 for rate in result.values()):
+            raise ValueError('limit must not be negative')
+        return result
+
+    def open(self, client, direction, category=None, name=''):
+        transfer = Transfer(self, client or '', direction, self.weights.get(client, 1), category, name)
+        with self._lock:
+            self._active[transfer] = None
+            key = (transfer.client, direction)
+            if key not in self._clients:
+                self._clients[key] = TokenBucket(self.client_limits[direction])
+        return transfer
+
+    def finish(self, transfer):
+        with self._lock:
+            self._active.pop(transfer, None)
+            self.total_bytes[transfer.direction] += transfer.bytes
+            self.total_waited[transfer.direction] += transfer.waited
+            self.completed[transfer.direction] += 1
+            key = (transfer.direction, transfer.category)
+            self._category_bytes[key] = self._category_bytes.get(key, 0) + transfer.bytes
+            # 客户端没有其他进行中的传输时丢弃其令牌桶
+            key = (transfer.client, transfer.direction)
+            if not any((t.client, t.direction) == key for t in self._active):
+                self._clients.pop(key, None)
+
+    def buckets(self, client, direction):
+        """返回需要预约的令牌桶，不限速时为空"""
+        buckets = []
+        if self.limits[direction]:
+            buckets.append(self._global[direction])
+        if self.client_limits[direction]:
+            bucket = self._clients.get((client, direction))
+            if bucket is not None:
+                buckets.append(bucket)
+        return buckets
+
+    def category_bytes(self):
+        """按 (方向, 分类) 汇总已传输的字节数，包括进行中的传输"""
+        with self._lock:
+            totals = dict(self._category_bytes)
+            for transfer in self._active:
+                key = (transfer.direction, transfer.category)
+                totals[key] = totals.get(key, 0) + transfer.bytes
+        return totals
+
+    def transfers(self):
+        """进行中的传输，按开始时间排序"""
+        now = time.monotonic()
+        with self._lock:
+            return sorted((transfer.progress(now) for transfer in self._active), key=lambda t: t['started'])
+
+    def settings(self):
+        return {
+            'limits': dict(self.limits),
+            'client_limits': dict(self.client_limits),
+            'weights': dict(self.weights),
+        }
+
+    def stats(self):
+        with self._lock:
+            active = list(self._active)
+            stats = self.settings()
+            stats['active'] = {direction: sum(1 for t in active if t.direction == direction)
+                               for direction in DIRECTIONS}
+            stats['completed'] = dict(self.completed)
+            stats['bytes'] = {direction: self.total_bytes[direction] + sum(
+                t.bytes for t in active if t.direction == direction) for direction in DIRECTIONS}
+            stats['throttled_seconds'] = {direction: round(self.total_waited[direction], 3)
+                                          for direction in DIRECTIONS}
+        return stats
+
+
+class ShapedStream:
+    """按 Transfer 限速的响应体；asyncio 后端识别该类型，在事件循环中等待而不占用工作线程"""
+
+    def __init__(self, iterable, transfer):
+        self.iterable = iterable
+        self.transfer = transfer
+
+    def __iter__(self):
+        for data in self.iterable:
+            view = memoryview(data)
+            while view:
+                size = self.transfer.throttle(len(view))
+                yield view[:size].tobytes()
+                view = view[size:]
+
+    def close(self):
+        close = getattr(self.iterable, 'close', None)
+        if close is not None:
+            close()
+        self.transfer.close()
+
+
+class ShapedReader:
+    """按 Transfer 限速读取请求体"""
+
+    def __init__(self, raw, transfer):
+        self._raw = raw
+        self.transfer = transfer
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            blocks = []
+            while True:
+                block = self._read(self._raw.read, SHAPING_QUANTUM * MAX_WEIGHT)
+                if not block:
+                    return b''.join(blocks)
+                blocks.append(block)
+        return self._read(self._raw.read, size)
+
+    def readline(self, size=-1):
+        if size is None or size < 0:
+            size = SHAPING_QUANTUM * MAX_WEIGHT
+        return self._read(self._raw.readline, size)
+
+    def _read(self, read, size):
+        size = self.transfer.throttle(size)
+        data = read(size)
+        # 读到请求体末尾或一行结束时实际字节数少于预约数
+        self.transfer.bytes -= size - len(data)
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
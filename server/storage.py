@@ -0,0 +1,243 @@
+import os
+import json
+import time
+import shutil
+import threading
+from collections import deque
+
+# 存储管理配置
+EVICTION_POLICIES = ('none', 'lru', 'age', 'size')
+EVICT_INTERVAL = 60
+DEFAULT_MIN_FREE = 256 * 1024 * 1024
+RECENT_EVICTIONS = 20
+ACCESS_FILE_NAME = '.access.json'
+
+
+def parse_category_quotas(value):
+    """解析 'videos=4096,images=1024'（单位 MB），返回 {分类: 字节数}"""
+    quotas = {}
+    for item in (value or '').split(','):
+        name, sep, size = item.strip().partition('=')
+        if not sep:
+            continue
+        quotas[name.strip()] = int(float(size) * 1024 * 1024)
+    return quotas
+
+
+class StorageError(Exception):
+    def __init__(self, message, status=507):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+# 存储管理：按分类统计占用、上传前检查配额与磁盘剩余空间，后台按策略淘汰文件。
+# 用量来自目录缓存，去重得到的硬链接只计一次；淘汰顺序 lru 按最后下载时间（未下载过的按上传时间），age 按上传时间，size 从大到小
+class StorageManager:
+    def __init__(self, catalog, remove_file):
+        self.catalog = catalog
+        # remove_file(category, name)，由应用负责删除文件并更新目录缓存
+        self.remove_file = remove_file
+        self.root = None
+        self.quota = 0
+        self.category_quotas = {}
+        self.retention = 0
+        self.policy = 'none'
+        self.min_free = DEFAULT_MIN_FREE
+        self.evicted_files = 0
+        self.reclaimed_bytes = 0
+        self.recent = deque(maxlen=RECENT_EVICTIONS)
+        # _lock 串行化检查与淘汰；最后下载时间使用单独的锁，
+        # 因为 forget 会在目录缓存持有自身锁时被回调，不能与淘汰时的加锁顺序相反
+        self._lock = threading.Lock()
+        self._access_lock = threading.Lock()
+        self._access = {}
+        self._access_dirty = False
+        self._started = False
+        self._stop_event = threading.Event()
+
+    def configure(self, quota=0, category_quotas=None, retention_days=0, policy='none', min_free=DEFAULT_MIN_FREE):
+        if policy not in EVICTION_POLICIES:
+            raise ValueError('invalid eviction policy: ' + str(policy))
+        self.quota = quota or 0
+        self.category_quotas = dict(category_quotas or {})
+        self.retention = (retention_days or 0) * 86400
+        self.policy = policy
+        self.min_free = min_free
+
+    def ensure_started(self, root):
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self.root = root
+            self._load_access()
+            self._started = True
+            if self.policy != 'none' or self.retention:
+                threading.Thread(target=self._run, name='storage-evictor', daemon=True).start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._save_access()
+
+    # 最后下载时间，持久化到上传目录下的 .access.json
+    def _access_path(self):
+        return os.path.join(self.root, ACCESS_FILE_NAME)
+
+    def _load_access(self):
+        try:
+            with open(self._access_path(), 'r', encoding='utf-8') as f:
+                self._access = json.load(f)
+        except (OSError, ValueError):
+            self._access = {}
+
+    def _save_access(self):
+        with self._access_lock:
+            if not self._access_dirty or self.root is None:
+                return
+            data = dict(self._access)
+            self._access_dirty = False
+        tmp_path = self._access_path() + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self._access_path())
+        except OSError:
+            pass
+
+    def touch(self, category, name):
+        with self._access_lock:
+            self._access[category + '/' + name] = time.time()
+            self._access_dirty = True
+
+    def forget(self, category, name):
+        with self._access_lock:
+            if self._access.pop(category + '/' + name, None) is not None:
+                self._access_dirty = True
+
+    def last_access(self, entry):
+        return max(self._access.get(entry.category + '/' + entry.name, 0), entry.mtime)
+
+    # 配额检查
+    def usage(self):
+        """返回 (合计, {分类: 字节数})，指向同一 inode 的文件只计一次"""
+        return self.catalog.disk_usage()
+
+    def check(self, category, size, pending=None, unwritten=0):
+        """上传前检查能否放下 size 字节，必要时按策略淘汰；放不下时抛出 StorageError。
+        category 为 None 时只检查总配额与磁盘空间；pending 为未完成上传会话按分类预留的字节数，
+        unwritten 为这些会话尚未写入磁盘的字节数"""
+        pending = pending or {}
+        with self._lock:
+            free = shutil.disk_usage(self.root).free - unwritten - self.min_free
+            if size > free and not self._evict(size - free, None, 'disk'):
+                raise StorageError('Insufficient storage: disk full')
+
+            if self.quota:
+                used = self.usage()[0] + sum(pending.values())
+                if used + size > self.quota and not self._evict(used + size - self.quota, None, 'quota'):
+                    raise StorageError('Insufficient storage: quota exceeded')
+
+            quota = self.category_quotas.get(category) if category else None
+            if quota:
+                used = self.usage()[1].get(category, 0) + pending.get(category, 0)
+                if used + size > quota and not self._evict(used + size - quota, category, 'quota'):
+                    raise StorageError('Insufficient storage: {} quota exceeded'.format(category))
+
+    # 淘汰
+    def _victims(self, category):
+        categories = [category] if category else list(self.catalog.categories)
+        entries = [e for c in categories for e in self.catalog.list(c)]
+        if self.policy == 'size':
+            entries.sort(key=lambda e: e.size, reverse=True)
+        elif self.policy == 'age':
+            entries.sort(key=lambda e: e.mtime)
+        else:
+            entries.sort(key=self.last_access)
+        return entries
+
+    def _evict(self, needed, category, reason):
+        """按策略删除文件直到释放 needed 字节；策略为 none 或无法释放足够空间时返回 False。
+        硬链接只有全部链接（限定分类时为该分类内的全部链接）都被删除才释放空间，
+        链接没有全部选中的文件删除后不释放任何空间，不会被删除"""
+        if self.policy == 'none':
+            return False
+        victims = []
+        remaining = {}
+        total = 0
+        for entry in self._victims(category):
+            if total >= needed:
+                break
+            key = entry.inode_key
+            if key not in remaining:
+                remaining[key] = self.catalog.links(entry, category)
+            remaining[key] -= 1
+            victims.append(entry)
+            if not remaining[key]:
+                total += entry.size
+        if total < needed:
+            return False
+        for entry in victims:
+            if not remaining[entry.inode_key]:
+                self._remove(entry, reason)
+        return True
+
+    def _remove(self, entry, reason):
+        # 还有其他硬链接（只剩 blob 存储中的一个除外）时删除不释放磁盘空间
+        reclaimed = entry.size if self.catalog.links(entry) <= 1 else 0
+        try:
+            self.remove_file(entry.category, entry.name)
+        except OSError:
+            return
+        self.forget(entry.category, entry.name)
+        self.evicted_files += 1
+        self.reclaimed_bytes += reclaimed
+        self.recent.append({
+            'category': entry.category,
+            'name': entry.name,
+            'size': entry.size,
+            'reclaimed': reclaimed,
+            'reason': reason,
+            'time': time.time(),
+        })
+
+    def run_once(self):
+        """清理超过保留期的文件，并在配额调小后淘汰超出的部分"""
+        with self._lock:
+            if self.retention:
+                deadline = time.time() - self.retention
+                for entry in self._victims(None):
+                    if self.last_access(entry) < deadline:
+                        self._remove(entry, 'retention')
+            if self.policy != 'none':
+                total, sizes = self.usage()
+                if self.quota and total > self.quota:
+                    self._evict(total - self.quota, None, 'quota')
+                for category, quota in self.category_quotas.items():
+                    if quota and sizes.get(category, 0) > quota:
+                        self._evict(sizes[category] - quota, category, 'quota')
+
+    def _run(self):
+        while not self._stop_event.wait(EVICT_INTERVAL):
+            try:
+                self.run_once()
+            except Exception:
+                pass
+            self._save_access()
+
+    def stats(self):
+        total, sizes = self.usage()
+        return {
+            'policy': self.policy,
+            'quota': self.quota,
+            'used': total,
+            'categories': {
+                category: {'used': sizes.get(category, 0), 'quota': self.category_quotas.get(category, 0)}
+                for category in self.catalog.categories
+            },
+            'retention_days': self.retention / 86400,
+            'evicted_files': self.evicted_files,
+            'reclaimed_bytes': self.reclaimed_bytes,
+            'recent_evictions': list(self.recent),
+        }
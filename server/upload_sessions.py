@@ -0,0 +1,243 @@
+import os
+import re
+import json
+import time
+import uuid
+import threading
+
+# 分块上传配置
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+SESSION_TTL = 24 * 3600
+COPY_BLOCK_SIZE = 64 * 1024
+
+_SESSION_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+class UploadSessionError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+# 单个上传会话：记录文件信息与已接收的分块
+class UploadSession:
+    def __init__(self, session_id, filename, size, chunk_size, fingerprint='', created=None, received=None):
+        self.id = session_id
+        self.filename = filename
+        self.size = size
+        self.chunk_size = chunk_size
+        self.fingerprint = fingerprint
+        self.created = created or time.time()
+        self.updated = self.created
+        self.received = set(received or [])
+        self.lock = threading.Lock()
+
+    @property
+    def total_chunks(self):
+        if self.size == 0:
+            return 0
+        return (self.size + self.chunk_size - 1) // self.chunk_size
+
+    def chunk_length(self, index):
+        if index == self.total_chunks - 1:
+            return self.size - index * self.chunk_size
+        return self.chunk_size
+
+    def received_bytes(self, received=None):
+        if received is None:
+            with self.lock:
+                received = list(self.received)
+        return sum(self.chunk_length(i) for i in received)
+
+    def is_complete(self):
+        return len(self.received) == self.total_chunks
+
+    def to_dict(self):
+        with self.lock:
+            received = sorted(self.received)
+        return {
+            'session_id': self.id,
+            'filename': self.filename,
+            'size': self.size,
+            'chunk_size': self.chunk_size,
+            'total_chunks': self.total_chunks,
+            'received': received,
+            'received_bytes': self.received_bytes(received),
+        }
+
+    def to_meta(self):
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'size': self.size,
+            'chunk_size': self.chunk_size,
+            'fingerprint': self.fingerprint,
+            'created': self.created,
+            'received': sorted(self.received),
+        }
+
+    @classmethod
+    def from_meta(cls, meta):
+        return cls(
+            meta['id'], meta['filename'], meta['size'], meta['chunk_size'],
+            fingerprint=meta.get('fingerprint', ''),
+            created=meta.get('created'),
+            received=meta.get('received', []),
+        )
+
+
+# 会话存储：分块直接写入预分配的临时文件，提交时原子重命名
+class UploadSessionStore:
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._loaded = False
+
+    def _meta_path(self, session_id):
+        return os.path.join(self.root, session_id + '.json')
+
+    def _part_path(self, session_id):
+        return os.path.join(self.root, session_id + '.part')
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        if not os.path.exists(self.root):
+            os.makedirs(self.root)
+        # 服务重启后恢复未完成的会话
+        for name in os.listdir(self.root):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.root, name), 'r', encoding='utf-8') as f:
+                    session = UploadSession.from_meta(json.load(f))
+            except (OSError, ValueError, KeyError):
+                continue
+            if os.path.exists(self._part_path(session.id)):
+                session.updated = os.path.getmtime(self._part_path(session.id))
+                self._sessions[session.id] = session
+        self._loaded = True
+
+    def _save_meta(self, session):
+        tmp_path = self._meta_path(session.id) + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(session.to_meta(), f)
+        os.replace(tmp_path, self._meta_path(session.id))
+
+    def _remove_files(self, session_id):
+        for path in (self._meta_path(session_id), self._part_path(session_id)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def cleanup_expired(self, ttl=SESSION_TTL):
+        now = time.time()
+        with self._lock:
+            self._ensure_loaded()
+            expired = [s for s in self._sessions.values() if now - s.updated > ttl]
+            for session in expired:
+                del self._sessions[session.id]
+        for session in expired:
+            self._remove_files(session.id)
+
+    def create(self, filename, size, chunk_size=None, fingerprint=''):
+        if size < 0:
+            raise UploadSessionError('Invalid size')
+        chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+        chunk_size = max(MIN_CHUNK_SIZE, min(MAX_CHUNK_SIZE, chunk_size))
+
+        self.cleanup_expired()
+        with self._lock:
+            self._ensure_loaded()
+            # 相同指纹的未完成会话直接复用，客户端只需补传缺失的分块
+            if fingerprint:
+                for session in self._sessions.values():
+                    if (session.fingerprint == fingerprint and session.filename == filename
+                            and session.size == size):
+                        session.updated = time.time()
+                        return session
+
+            session = UploadSession(uuid.uuid4().hex, filename, size, chunk_size, fingerprint)
+            with open(self._part_path(session.id), 'wb') as f:
+                f.truncate(size)
+            self._save_meta(session)
+            self._sessions[session.id] = session
+            return session
+
+    def _is_open(self, session):
+        with self._lock:
+            return self._sessions.get(session.id) is session
+
+    def pending(self):
+        """返回全部未完成的会话"""
+        with self._lock:
+            self._ensure_loaded()
+            return list(self._sessions.values())
+
+    def get(self, session_id):
+        if not _SESSION_ID_RE.match(session_id or ''):
+            raise UploadSessionError('Invalid session', 404)
+        with self._lock:
+            self._ensure_loaded()
+            session = self._sessions.get(session_id)
+        if session is None:
+            raise UploadSessionError('Session not found', 404)
+        return session
+
+    def write_chunk(self, session_id, index, stream, length):
+        session = self.get(session_id)
+        if index < 0 or index >= session.total_chunks:
+            raise UploadSessionError('Invalid chunk index')
+        expected = session.chunk_length(index)
+        if length != expected:
+            raise UploadSessionError('Chunk length mismatch: expected {}'.format(expected))
+
+        written = 0
+        try:
+            f = open(self._part_path(session.id), 'r+b')
+        except FileNotFoundError:
+            # 会话已在其他请求中提交或取消
+            raise UploadSessionError('Session not found', 404)
+        with f:
+            f.seek(index * session.chunk_size)
+            while written < expected:
+                block = stream.read(min(COPY_BLOCK_SIZE, expected - written))
+                if not block:
+                    break
+                f.write(block)
+                written += len(block)
+        if written != expected:
+            raise UploadSessionError('Incomplete chunk')
+
+        with session.lock:
+            if not self._is_open(session):
+                raise UploadSessionError('Session not found', 404)
+            session.received.add(index)
+            session.updated = time.time()
+            self._save_meta(session)
+        return session
+
+    def commit(self, session_id, dest_path):
+        session = self.get(session_id)
+        with session.lock:
+            # 同一会话的并发提交：先拿到锁的完成提交，其余返回冲突
+            if not self._is_open(session):
+                raise UploadSessionError('Session already committed', 409)
+            if not session.is_complete():
+                raise UploadSessionError('Missing chunks', 409)
+            os.replace(self._part_path(session.id), dest_path)
+            with self._lock:
+                self._sessions.pop(session.id, None)
+            self._remove_files(session.id)
+        return session
+
+    def abort(self, session_id):
+        session = self.get(session_id)
+        with self._lock:
+            self._sessions.pop(session.id, None)
+        self._remove_files(session.id)
@@ -2,6 +2,11 @@
 const elements = {
     uploadZone: document.getElementById('upload-zone'),
     fileInput: document.getElementById('file-input'),
+    uploadQueue: document.getElementById('upload-queue'),
+    uploadItems: document.getElementById('upload-items'),
+    uploadSummary: document.getElementById('upload-summary'),
+    uploadTotalBar: document.getElementById('upload-total-bar'),
+    uploadClear: document.getElementById('upload-clear'),
     filesList: document.getElementById('files-list'),
     categoryTabs: document.querySelectorAll('.tab-btn'),
     chatMessages: document.getElementById('chat-messages'),
@@ -11,24 +16,69 @@ const elements = {
     toast: document.getElementById('toast'),
     serverAddress: document.getElementById('server-address'),
     totalFiles: document.getElementById('total-files'),
-    totalSize: document.getElementById('total-size')
+    totalSize: document.getElementById('total-size'),
+    transfersToggle: document.getElementById('transfers-toggle'),
+    transfersPanel: document.getElementById('transfers-panel'),
+    transfersSummary: document.getElementById('transfers-summary'),
+    transfersItems: document.getElementById('transfers-items')
 };
 
+// 消息长轮询等待秒数
+const MESSAGE_WAIT = 25;
+
+// 分块上传配置
+const UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024;
+const UPLOAD_RETRIES = 5;
+// 上传前在 Web Worker 中计算内容哈希，服务端已有相同内容时跳过传输
+const HASH_WORKER_URL = '/static/js/hash-worker.js';
+// 上传队列：同时上传的文件数；不小于 UPLOAD_LARGE_FILE 的文件最多同时占用 UPLOAD_LARGE_LANES 个通道
+const UPLOAD_CONCURRENCY = 4;
+const UPLOAD_LARGE_FILE = 32 * 1024 * 1024;
+const UPLOAD_LARGE_LANES = 2;
+
+// 文件列表分页
+const FILE_PAGE_SIZE = 50;
+
+// JSON 接口带 ETag：每次都向服务端校验，未变化时浏览器自动携带 If-None-Match 并复用缓存（304）
+const REVALIDATE = { cache: 'no-cache' };
+
+// 缩略图：按图标尺寸与屏幕像素比请求，行滚动到可视区域附近时才加载
+const PREVIEW_WIDTH = Math.ceil(40 * (window.devicePixelRatio || 1));
+const PREVIEW_ROOT_MARGIN = '200px';
+const previewObserver = window.IntersectionObserver
+    ? new IntersectionObserver(loadVisiblePreviews, { root: elements.filesList, rootMargin: PREVIEW_ROOT_MARGIN })
+    : null;
+
+// 文件变化合并刷新的间隔（毫秒），用于不支持 SSE 时上传完成后的刷新
+const FILE_REFRESH_DELAY = 300;
+// 刷新已加载的列表时一次最多请求的条数（与服务端分页上限一致）
+const FILE_PAGE_SIZE_MAX = 500;
+
+// 传输列表：面板展开且页面可见时轮询（毫秒）
+const TRANSFERS_POLL_INTERVAL = 2000;
+
 // 状态
 let currentCategory = 'all';
-let messageInterval = null;
+let filesCursor = null;
+let filesLoading = false;
+let filesRequestId = 0;
 let lastMessageId = 0;
 let lastMessagesHtml = '';
+// 历史消息加载完成前收到的 SSE 聊天消息先缓存，加载后按 id 合并
+let messagesReady = false;
+let pendingMessages = [];
+let fileRefreshTimer = null;
+let transfersTimer = null;
 
 // 初始化
 document.addEventListener('DOMContentLoaded', () => {
     initUpload();
     initTabs();
     initChat();
+    initTransfers();
     loadStats();
-    loadMessages();
     updateServerAddress();
-    startMessagePolling();
+    startEventStream();
 });
 
 // 显示 Toast
@@ -76,55 +126,377 @@ function initUpload() {
         elements.uploadZone.classList.remove('drag-over');
         handleFiles(e.dataTransfer.files);
     });
+
+    elements.uploadClear.addEventListener('click', clearFinishedUploads);
 }
 
-async function handleFiles(files) {
-    const totalFiles = files.length;
-    let completedFiles = 0;
-    let successCount = 0;
-    let failCount = 0;
+// 上传队列：多个文件并发上传，小文件优先，大文件占用独立通道，避免一个大文件阻塞整批小文件
+const uploadQueue = {
+    items: [],
+    nextId: 1,
+    active: 0,
+    renderPending: false,
+    startTime: 0
+};
 
+function handleFiles(files) {
+    if (!uploadQueue.items.some(isUploadActive)) {
+        uploadQueue.startTime = performance.now();
+    }
     for (const file of files) {
-        const formData = new FormData();
-        formData.append('file', file);
+        const item = {
+            id: uploadQueue.nextId++,
+            file: file,
+            status: 'pending',
+            loaded: 0,
+            hashed: 0,
+            error: '',
+            controller: null,
+            sessionId: null,
+            deduplicated: false,
+            row: null
+        };
+        item.row = createUploadRow(item);
+        uploadQueue.items.push(item);
+        elements.uploadItems.appendChild(item.row);
+    }
+    elements.uploadQueue.hidden = uploadQueue.items.length === 0;
+    pumpUploads();
+}
 
-        const fileSize = formatFileSize(file.size);
-        showToast(`正在上传: ${file.name} (${fileSize})`, 'default', 10000);
+function isUploadActive(item) {
+    return item.status === 'pending' || item.status === 'hashing' || item.status === 'uploading';
+}
 
-        try {
-            const response = await fetch('/api/upload', {
-                method: 'POST',
-                body: formData
-            });
+function isLargeUpload(item) {
+    return item.file.size >= UPLOAD_LARGE_FILE;
+}
 
-            const result = await response.json();
+// 选择下一个要开始的文件：大文件最多同时占用 UPLOAD_LARGE_LANES 个通道，其余通道按大小从小到大处理
+function nextUpload() {
+    const pending = uploadQueue.items.filter(item => item.status === 'pending')
+        .sort((a, b) => a.file.size - b.file.size);
+    const small = pending.filter(item => !isLargeUpload(item));
+    const large = pending.filter(isLargeUpload);
+    const activeLarge = uploadQueue.items.filter(item => item.controller && isLargeUpload(item)).length;
+    const activeSmall = uploadQueue.active - activeLarge;
+
+    if (large.length && (activeLarge < UPLOAD_LARGE_LANES || !small.length)) return large[0];
+    const reserved = Math.min(UPLOAD_LARGE_LANES, activeLarge + large.length);
+    if (small.length && activeSmall < UPLOAD_CONCURRENCY - reserved) return small[0];
+    return null;
+}
+
+function pumpUploads() {
+    while (uploadQueue.active < UPLOAD_CONCURRENCY) {
+        const item = nextUpload();
+        if (!item) break;
+        runUpload(item);
+    }
+    scheduleUploadRender();
+}
 
-            completedFiles++;
+async function runUpload(item) {
+    uploadQueue.active++;
+    item.controller = new AbortController();
+    const signal = item.controller.signal;
+    item.status = 'hashing';
+    item.error = '';
+    scheduleUploadRender(item);
 
-            if (result.success) {
-                successCount++;
-                showToast(`✓ ${file.name}`, 'success', 2000);
+    try {
+        const sha256 = await hashFile(item.file, (hashed) => {
+            item.hashed = hashed;
+            scheduleUploadRender(item);
+        }, signal);
+        if (signal.aborted) throw new DOMException('Aborted', 'AbortError');
+
+        item.status = 'uploading';
+        const result = await uploadFileResumable(item.file, sha256, (uploaded) => {
+            item.loaded = uploaded;
+            scheduleUploadRender(item);
+        }, signal, (session) => {
+            item.sessionId = session.session_id;
+        });
+
+        if (result.success) {
+            item.status = 'done';
+            item.loaded = item.file.size;
+            item.deduplicated = !!result.deduplicated;
+            item.sessionId = null;
+        } else {
+            item.status = 'error';
+            item.error = result.error || '上传失败';
+        }
+    } catch (error) {
+        if (signal.aborted) {
+            item.status = 'cancelled';
+            abortUploadSession(item);
+        } else {
+            item.status = 'error';
+            item.error = '网络错误';
+        }
+    } finally {
+        uploadQueue.active--;
+        item.controller = null;
+        scheduleUploadRender(item);
+        onUploadFinished(item);
+        pumpUploads();
+    }
+}
+
+function onUploadFinished(item) {
+    // 不支持 SSE 时没有文件变化推送，每个文件完成后自行刷新（合并为一次）
+    if (item.status === 'done' && !window.EventSource) {
+        scheduleFilesRefresh();
+        loadStats();
+    }
+    if (uploadQueue.items.some(isUploadActive)) return;
+
+    const finished = uploadQueue.items.filter(i => i.status === 'done' || i.status === 'error');
+    const failCount = finished.filter(i => i.status === 'error').length;
+    const successCount = finished.length - failCount;
+    if (finished.length > 1) {
+        showToast(`完成: ${successCount}个成功, ${failCount}个失败`, successCount > failCount ? 'success' : 'error');
+    } else if (item.status === 'done') {
+        showToast(item.deduplicated ? `✓ ${item.file.name}（内容已存在，跳过传输）` : `✓ ${item.file.name}`, 'success', 2000);
+    } else if (item.status === 'error') {
+        showToast(`✗ ${item.file.name}: ${item.error}`, 'error', 3000);
+    }
+}
+
+function cancelUpload(item) {
+    if (item.controller) {
+        item.controller.abort();
+    } else if (item.status === 'pending') {
+        item.status = 'cancelled';
+        scheduleUploadRender(item);
+        onUploadFinished(item);
+    }
+}
+
+function retryUpload(item) {
+    // 出错时保留了服务端会话，重试只补传缺失的分块
+    item.status = 'pending';
+    item.error = '';
+    item.loaded = 0;
+    item.hashed = 0;
+    if (!uploadQueue.items.some(i => i !== item && isUploadActive(i))) {
+        uploadQueue.startTime = performance.now();
+    }
+    pumpUploads();
+}
+
+function abortUploadSession(item) {
+    if (!item.sessionId) return;
+    fetch(`/api/uploads/${item.sessionId}`, { method: 'DELETE' }).catch(() => {});
+    item.sessionId = null;
+}
+
+function clearFinishedUploads() {
+    uploadQueue.items = uploadQueue.items.filter(item => {
+        if (isUploadActive(item) || item.status === 'error') return true;
+        item.row.remove();
+        return false;
+    });
+    elements.uploadQueue.hidden = uploadQueue.items.length === 0;
+    scheduleUploadRender();
+}
+
+function createUploadRow(item) {
+    const row = document.createElement('div');
+    row.className = 'upload-item';
+    row.innerHTML = `
+        <div class="upload-item-info">
+            <span class="upload-item-name"></span>
+            <span class="upload-item-status"></span>
+        </div>
+        <button class="upload-item-action"></button>
+        <div class="upload-progress"><div class="upload-progress-bar"></div></div>
+    `;
+    row.querySelector('.upload-item-name').textContent = item.file.name;
+    row.querySelector('.upload-item-action').addEventListener('click', () => {
+        if (isUploadActive(item)) {
+            cancelUpload(item);
+        } else {
+            retryUpload(item);
+        }
+    });
+    item.dirty = true;
+    return row;
+}
+
+// 进度事件很频繁，合并到下一帧统一更新
+function scheduleUploadRender(item) {
+    if (item) item.dirty = true;
+    if (uploadQueue.renderPending) return;
+    uploadQueue.renderPending = true;
+    requestAnimationFrame(renderUploadQueue);
+}
+
+const UPLOAD_STATUS_TEXT = {
+    pending: '等待中',
+    hashing: '校验中',
+    uploading: '上传中',
+    done: '完成',
+    error: '失败',
+    cancelled: '已取消'
+};
+
+function renderUploadQueue() {
+    uploadQueue.renderPending = false;
+    let totalBytes = 0;
+    let loadedBytes = 0;
+    let doneCount = 0;
+    let counted = 0;
+
+    for (const item of uploadQueue.items) {
+        if (item.status !== 'cancelled') {
+            counted++;
+            totalBytes += item.file.size;
+            loadedBytes += item.status === 'done' ? item.file.size : item.loaded;
+            if (item.status === 'done') doneCount++;
+        }
+        if (!item.dirty) continue;
+        item.dirty = false;
+
+        const size = item.file.size;
+        let text = UPLOAD_STATUS_TEXT[item.status];
+        let percent = size > 0 ? Math.floor(item.loaded * 100 / size) : 0;
+        if (item.status === 'hashing') {
+            percent = size > 0 ? Math.floor(item.hashed * 100 / size) : 0;
+            text += ` ${percent}%`;
+        } else if (item.status === 'uploading') {
+            text = `${formatFileSize(item.loaded)} / ${formatFileSize(size)}`;
+        } else if (item.status === 'done') {
+            percent = 100;
+            text = item.deduplicated ? '已存在，跳过传输' : formatFileSize(size);
+        } else if (item.status === 'error') {
+            text += `: ${item.error}`;
+        }
+
+        item.row.className = `upload-item ${item.status}`;
+        item.row.querySelector('.upload-item-status').textContent = text;
+        item.row.querySelector('.upload-progress-bar').style.width = `${percent}%`;
+        const action = item.row.querySelector('.upload-item-action');
+        action.hidden = item.status === 'done';
+        action.textContent = isUploadActive(item) ? '取消' : '重试';
+    }
+
+    const elapsed = (performance.now() - uploadQueue.startTime) / 1000;
+    const active = uploadQueue.items.some(isUploadActive);
+    const speed = active && elapsed > 0 ? ` · ${formatFileSize(loadedBytes / elapsed)}/s` : '';
+    elements.uploadSummary.textContent =
+        `${doneCount} / ${counted} 个文件 · ${formatFileSize(loadedBytes)} / ${formatFileSize(totalBytes)}${speed}`;
+    elements.uploadTotalBar.style.width = totalBytes > 0 ? `${Math.floor(loadedBytes * 100 / totalBytes)}%` : '0%';
+}
+
+// 分块上传：断线后重新选择同一文件，只补传服务端缺失的分块
+async function uploadFileResumable(file, sha256, onProgress, signal, onSession) {
+    const initResponse = await fetch('/api/uploads', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+            filename: file.name,
+            size: file.size,
+            chunk_size: UPLOAD_CHUNK_SIZE,
+            fingerprint: `${file.name}:${file.size}:${file.lastModified}`,
+            sha256: sha256
+        }),
+        signal: signal
+    });
+    const init = await initResponse.json();
+    if (!init.success || init.deduplicated) return init;
+
+    const session = init.session;
+    onSession(session);
+    const received = new Set(session.received);
+    let uploaded = session.received_bytes;
+    onProgress(uploaded, file.size);
+
+    for (let index = 0; index < session.total_chunks; index++) {
+        if (received.has(index)) continue;
+        const start = index * session.chunk_size;
+        const chunk = file.slice(start, Math.min(start + session.chunk_size, file.size));
+        const base = uploaded;
+        const result = await uploadChunk(session.session_id, index, chunk, (sent) => {
+            onProgress(base + sent, file.size);
+        }, signal);
+        if (!result.success) return result;
+        uploaded += chunk.size;
+        onProgress(uploaded, file.size);
+    }
+
+    const commitResponse = await fetch(`/api/uploads/${session.session_id}/commit`, { method: 'POST', signal: signal });
+    return await commitResponse.json();
+}
+
+// 计算失败或浏览器不支持 Worker 时返回 null，按普通上传处理
+function hashFile(file, onProgress, signal) {
+    if (!window.Worker) return Promise.resolve(null);
+    return new Promise(resolve => {
+        const worker = new Worker(HASH_WORKER_URL);
+        const finish = (sha256) => {
+            worker.terminate();
+            signal.removeEventListener('abort', onAbort);
+            resolve(sha256);
+        };
+        const onAbort = () => finish(null);
+        signal.addEventListener('abort', onAbort);
+        worker.onmessage = (event) => {
+            const data = event.data;
+            if (data.type === 'progress') {
+                onProgress(data.hashed, data.total);
             } else {
-                failCount++;
-                showToast(`✗ ${file.name}: ${result.error || '上传失败'}`, 'error', 3000);
+                finish(data.type === 'done' ? data.sha256 : null);
             }
+        };
+        worker.onerror = () => finish(null);
+        worker.postMessage(file);
+    });
+}
 
-            // 全部完成时显示总结
-            if (completedFiles === totalFiles) {
-                loadStats();
-                loadFiles();
-                if (totalFiles > 1) {
-                    showToast(`完成: ${successCount}个成功, ${failCount}个失败`, successCount > failCount ? 'success' : 'error');
-                }
-            }
+async function uploadChunk(sessionId, index, chunk, onProgress, signal) {
+    for (let attempt = 0; ; attempt++) {
+        try {
+            return await sendChunk(`/api/uploads/${sessionId}/chunks/${index}`, chunk, onProgress, signal);
         } catch (error) {
-            completedFiles++;
-            failCount++;
-            showToast(`✗ ${file.name}: 网络错误`, 'error', 3000);
+            if (signal.aborted || attempt + 1 >= UPLOAD_RETRIES) throw error;
+            await new Promise(resolve => setTimeout(resolve, Math.min(1000 * 2 ** attempt, 10000)));
         }
     }
 }
 
+// fetch 无法获得上传进度，分块使用 XHR 发送
+function sendChunk(url, chunk, onProgress, signal) {
+    return new Promise((resolve, reject) => {
+        const xhr = new XMLHttpRequest();
+        const onAbort = () => xhr.abort();
+        const cleanup = () => signal.removeEventListener('abort', onAbort);
+        xhr.open('PUT', url);
+        xhr.setRequestHeader('Content-Type', 'application/octet-stream');
+        xhr.upload.onprogress = (e) => onProgress(e.loaded);
+        xhr.onload = () => {
+            cleanup();
+            try {
+                resolve(JSON.parse(xhr.responseText));
+            } catch (error) {
+                resolve({ success: false, error: `HTTP ${xhr.status}` });
+            }
+        };
+        xhr.onerror = () => {
+            cleanup();
+            reject(new Error('Network error'));
+        };
+        xhr.onabort = () => {
+            cleanup();
+            reject(new DOMException('Aborted', 'AbortError'));
+        };
+        signal.addEventListener('abort', onAbort);
+        xhr.send(chunk);
+    });
+}
+
 function formatFileSize(bytes) {
     if (bytes < 1024) return bytes + ' B';
     if (bytes < 1024 * 1024) return (bytes / 1024).toFixed(1) + ' KB';
@@ -142,44 +514,85 @@ function initTabs() {
             loadFiles();
         });
     });
+
+    // 滚动接近底部时加载下一页
+    elements.filesList.addEventListener('scroll', () => {
+        const list = elements.filesList;
+        if (list.scrollTop + list.clientHeight >= list.scrollHeight - 200) {
+            loadMoreFiles();
+        }
+    });
 }
 
 // 加载文件列表
+async function fetchFilesPage(cursor, limit = FILE_PAGE_SIZE) {
+    const params = new URLSearchParams({ limit });
+    if (cursor) params.set('cursor', cursor);
+    const response = await fetch(`/api/files/${currentCategory}?${params}`, REVALIDATE);
+    return await response.json();
+}
+
 async function loadFiles() {
+    const requestId = ++filesRequestId;
+    filesCursor = null;
     try {
-        const url = currentCategory === 'all'
-            ? '/api/files/images'
-            : `/api/files/${currentCategory}`;
+        const data = await fetchFilesPage(null);
 
-        const response = await fetch(url);
-        const data = await response.json();
+        if (requestId === filesRequestId && data.files) {
+            filesCursor = data.next_cursor;
+            renderFiles(data.files, data.category);
+            fillFilesViewport();
+        }
+    } catch (error) {
+        console.error('加载文件失败:', error);
+    }
+}
 
-        if (data.files) {
+// 重新加载已显示的部分（至少一页），保留滚动位置
+async function refreshLoadedFiles() {
+    const requestId = ++filesRequestId;
+    const loaded = elements.filesList.querySelectorAll('.file-item').length;
+    const limit = Math.min(FILE_PAGE_SIZE_MAX, Math.max(FILE_PAGE_SIZE, loaded));
+    try {
+        const data = await fetchFilesPage(null, limit);
+
+        if (requestId === filesRequestId && data.files) {
+            const scrollTop = elements.filesList.scrollTop;
+            filesCursor = data.next_cursor;
             renderFiles(data.files, data.category);
+            elements.filesList.scrollTop = scrollTop;
+            fillFilesViewport();
         }
     } catch (error) {
         console.error('加载文件失败:', error);
     }
 }
 
-async function loadAllFiles() {
-    const categories = ['images', 'documents', 'videos', 'audios', 'archives', 'others'];
-    let allFiles = [];
+async function loadMoreFiles() {
+    if (!filesCursor || filesLoading) return;
+    const requestId = filesRequestId;
+    filesLoading = true;
+    try {
+        const data = await fetchFilesPage(filesCursor);
 
-    for (const category of categories) {
-        try {
-            const response = await fetch(`/api/files/${category}`);
-            const data = await response.json();
-            if (data.files) {
-                allFiles = allFiles.concat(data.files.map(f => ({...f, category})));
-            }
-        } catch (error) {
-            console.error(`加载${category}失败:`, error);
+        if (requestId === filesRequestId && data.files) {
+            filesCursor = data.next_cursor;
+            appendFiles(data.files);
+            fillFilesViewport();
         }
+    } catch (error) {
+        console.error('加载文件失败:', error);
+    } finally {
+        filesLoading = false;
     }
+}
 
-    allFiles.sort((a, b) => new Date(b.timestamp) - new Date(a.timestamp));
-    renderFiles(allFiles, 'all');
+// 首页不足以填满列表区域时继续加载，保证可以滚动
+function fillFilesViewport() {
+    const list = elements.filesList;
+    if (filesCursor && list.scrollHeight <= list.clientHeight) {
+        loadMoreFiles();
+    }
 }
 
 function renderFiles(files, category) {
@@ -188,7 +601,16 @@ function renderFiles(files, category) {
     }
 
     if (files.length === 0) {
-        elements.filesList.innerHTML = `
+        renderFilesEmpty();
+        return;
+    }
+
+    elements.filesList.innerHTML = files.map(renderFileItem).join('');
+    observePreviews();
+}
+
+function renderFilesEmpty() {
+    elements.filesList.innerHTML = `
             <div class="empty-state">
                 <svg viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="1.5">
                     <path d="M22 19a2 2 0 0 1-2 2H4a2 2 0 0 1-2-2V5a2 2 0 0 1 2-2h5l2 3h9a2 2 0 0 1 2 2z"/>
@@ -196,13 +618,95 @@ function renderFiles(files, category) {
                 <p>暂无文件</p>
             </div>
         `;
-        return;
+}
+
+function findFileRow(category, name) {
+    for (const row of elements.filesList.querySelectorAll('.file-item')) {
+        if (row.dataset.category === category && row.dataset.filename === name) return row;
+    }
+    return null;
+}
+
+function removeFileRow(category, name) {
+    const row = findFileRow(category, name);
+    if (!row) return;
+    row.remove();
+    if (!elements.filesList.querySelector('.file-item') && !filesCursor) {
+        renderFilesEmpty();
+    }
+}
+
+// 按列表的排序（时间倒序，同一时间按文件名倒序）把新增或更新的文件插入已加载的部分；
+// 排在已加载部分之后且还有下一页时不插入，翻页时自然会加载到
+function upsertFileRow(file) {
+    const existing = findFileRow(file.category, file.name);
+    if (existing) existing.remove();
+
+    const rows = elements.filesList.querySelectorAll('.file-item');
+    const before = Array.prototype.find.call(rows, (row) => {
+        const timestamp = row.dataset.timestamp;
+        return timestamp < file.timestamp || (timestamp === file.timestamp && row.dataset.filename < file.name);
+    });
+    if (!before && filesCursor) return;
+
+    if (rows.length === 0) elements.filesList.innerHTML = '';
+    if (before) {
+        before.insertAdjacentHTML('beforebegin', renderFileItem(file));
+    } else {
+        elements.filesList.insertAdjacentHTML('beforeend', renderFileItem(file));
     }
+    observePreviews();
+}
 
-    elements.filesList.innerHTML = files.map(file => `
-        <div class="file-item" data-category="${file.category}" data-filename="${file.name}">
+function applyFileEvent(data) {
+    if (data.action === 'delete') {
+        removeFileRow(data.category, data.name);
+    } else {
+        upsertFileRow(data.file);
+    }
+}
+
+function appendFiles(files) {
+    if (files.length === 0) return;
+    elements.filesList.insertAdjacentHTML('beforeend', files.map(renderFileItem).join(''));
+    observePreviews();
+}
+
+function renderPreview(file) {
+    if (!file.preview) return '';
+    const src = `/api/preview/${file.category}/${encodeURIComponent(file.name)}` +
+        `?w=${PREVIEW_WIDTH}&v=${encodeURIComponent(file.timestamp)}`;
+    return `<img class="file-thumb" data-src="${src}" alt="" onload="this.classList.add('loaded')" onerror="this.remove()">`;
+}
+
+function observePreviews() {
+    const images = elements.filesList.querySelectorAll('img.file-thumb[data-src]');
+    for (const img of images) {
+        if (previewObserver) {
+            previewObserver.observe(img);
+        } else {
+            img.src = img.dataset.src;
+            delete img.dataset.src;
+        }
+    }
+}
+
+function loadVisiblePreviews(entries) {
+    for (const entry of entries) {
+        if (!entry.isIntersecting) continue;
+        const img = entry.target;
+        previewObserver.unobserve(img);
+        img.src = img.dataset.src;
+        delete img.dataset.src;
+    }
+}
+
+function renderFileItem(file) {
+    return `
+        <div class="file-item" data-category="${file.category}" data-filename="${file.name}" data-timestamp="${file.timestamp}">
             <div class="file-icon">
                 ${getFileIcon(file.name)}
+                ${renderPreview(file)}
             </div>
             <div class="file-info">
                 <div class="file-name">${escapeHtml(file.name)}</div>
@@ -224,7 +728,7 @@ function renderFiles(files, category) {
                 </button>
             </div>
         </div>
-    `).join('');
+    `;
 }
 
 function getFileIcon(filename) {
@@ -271,7 +775,7 @@ async function deleteFile(category, filename) {
         if (result.success) {
             showToast('删除成功', 'success');
             loadStats();
-            loadFiles();
+            removeFileRow(category, filename);
         } else {
             showToast(result.error || '删除失败', 'error');
         }
@@ -294,16 +798,79 @@ function formatTime(timestamp) {
 // 加载统计信息
 async function loadStats() {
     try {
-        const response = await fetch('/api/stats');
-        const data = await response.json();
-
-        elements.totalFiles.textContent = data.total_files;
-        elements.totalSize.textContent = data.total_size;
+        const response = await fetch('/api/stats', REVALIDATE);
+        renderStats(await response.json());
     } catch (error) {
         console.error('加载统计失败:', error);
     }
 }
 
+function renderStats(data) {
+    elements.totalFiles.textContent = data.total_files;
+    elements.totalSize.textContent = data.total_size;
+}
+
+// 传输列表：服务端所有进行中的上传与下载
+function initTransfers() {
+    elements.transfersToggle.addEventListener('click', () => {
+        elements.transfersPanel.hidden = !elements.transfersPanel.hidden;
+        scheduleTransfers(0);
+    });
+    document.addEventListener('visibilitychange', () => scheduleTransfers(0));
+}
+
+function scheduleTransfers(delay) {
+    clearTimeout(transfersTimer);
+    transfersTimer = null;
+    if (elements.transfersPanel.hidden || document.hidden) return;
+    transfersTimer = setTimeout(loadTransfers, delay);
+}
+
+async function loadTransfers() {
+    try {
+        const response = await fetch('/api/transfers', { cache: 'no-store' });
+        renderTransfers(await response.json());
+    } catch (error) {
+        console.error('加载传输列表失败:', error);
+    }
+    scheduleTransfers(TRANSFERS_POLL_INTERVAL);
+}
+
+function formatDuration(seconds) {
+    seconds = Math.round(seconds);
+    if (seconds < 60) return `${seconds}秒`;
+    if (seconds < 3600) return `${Math.floor(seconds / 60)}分${seconds % 60}秒`;
+    return `${Math.floor(seconds / 3600)}小时${Math.floor(seconds % 3600 / 60)}分`;
+}
+
+function renderTransfers(data) {
+    const transfers = data.transfers || [];
+    elements.transfersSummary.textContent = transfers.length === 0 ? '当前没有进行中的传输' :
+        `上传 ${data.active.up} 个 · ${formatFileSize(data.rate.up)}/s　下载 ${data.active.down} 个 · ${formatFileSize(data.rate.down)}/s`;
+
+    const fragment = document.createDocumentFragment();
+    for (const t of transfers) {
+        const row = document.createElement('div');
+        // 已传输超过一个采样周期但瞬时速率为 0，标记为停滞
+        row.className = t.rate === 0 && t.elapsed > 5 ? 'transfer-item stalled' : 'transfer-item';
+        row.innerHTML = `
+            <span class="transfer-item-name"></span>
+            <span class="transfer-item-status"></span>
+            <div class="upload-progress"><div class="upload-progress-bar"></div></div>
+        `;
+        const arrow = t.direction === 'up' ? '↑' : '↓';
+        row.querySelector('.transfer-item-name').textContent = `${arrow} ${t.name || '(解析中)'} · ${t.client}`;
+        const progress = t.size ? `${formatFileSize(t.bytes)} / ${formatFileSize(t.size)}` : formatFileSize(t.bytes);
+        const eta = t.eta !== null ? ` · 剩余 ${formatDuration(t.eta)}` : '';
+        row.querySelector('.transfer-item-status').textContent =
+            `${progress} · ${formatFileSize(t.rate)}/s (平均 ${formatFileSize(t.average_rate)}/s)${eta}`;
+        row.querySelector('.upload-progress-bar').style.width =
+            t.size ? `${Math.min(100, Math.floor(t.bytes * 100 / t.size))}%` : '0%';
+        fragment.appendChild(row);
+    }
+    elements.transfersItems.replaceChildren(fragment);
+}
+
 // 消息功能
 function initChat() {
     // 发送消息
@@ -323,8 +890,8 @@ function initChat() {
             const result = await response.json();
 
             if (result.success) {
+                // 新消息由服务端推送回来
                 elements.messageInput.value = '';
-                loadMessages();
             } else {
                 showToast(result.error || '发送失败', 'error');
             }
@@ -337,22 +904,29 @@ function initChat() {
     elements.messageInput.addEventListener('keypress', (e) => {
         if (e.key === 'Enter') sendMessage();
     });
-
-    // 加载历史消息
-    loadMessages();
 }
 
 async function loadMessages() {
+    let messages = null;
     try {
-        const response = await fetch('/api/messages');
+        const response = await fetch('/api/messages', REVALIDATE);
         const data = await response.json();
-
-        if (data.messages) {
-            renderMessagesDiff(data.messages);
-        }
+        messages = data.messages || null;
     } catch (error) {
         console.error('加载消息失败:', error);
     }
+
+    // 合并加载期间通过 SSE 收到的消息，按 id 去重排序
+    if (pendingMessages.length > 0) {
+        const byId = new Map((messages || []).map(msg => [msg.id, msg]));
+        pendingMessages.forEach(msg => byId.set(msg.id, msg));
+        messages = Array.from(byId.values()).sort((a, b) => a.id - b.id);
+        pendingMessages = [];
+    }
+    messagesReady = true;
+    if (messages) {
+        renderMessagesDiff(messages);
+    }
 }
 
 function renderMessagesDiff(messages) {
@@ -417,9 +991,80 @@ function formatMessageTime(timestamp) {
     return date.toLocaleTimeString('zh-CN', { hour: '2-digit', minute: '2-digit' });
 }
 
-function startMessagePolling() {
-    // 每3秒检查新消息
-    messageInterval = setInterval(loadMessages, 3000);
+async function startMessagePolling() {
+    // 先加载历史消息，再长轮询：服务端在有新消息或超时后才返回，随即发起下一次请求
+    await loadMessages();
+    while (true) {
+        try {
+            const response = await fetch(`/api/messages?since=${lastMessageId}&wait=${MESSAGE_WAIT}`, REVALIDATE);
+            const data = await response.json();
+
+            if (data.reset) {
+                lastMessageId = 0;
+            }
+            if (data.messages && data.messages.length > 0) {
+                renderMessagesDiff(data.messages);
+            }
+        } catch (error) {
+            console.error('加载消息失败:', error);
+            await new Promise(resolve => setTimeout(resolve, 3000));
+        }
+    }
+}
+
+// 服务端推送：聊天、文件变化与统计通过 SSE 实时到达，不支持时退回长轮询
+function startEventStream() {
+    if (!window.EventSource) {
+        startMessagePolling();
+        return;
+    }
+
+    const source = new EventSource('/api/events');
+
+    // 连接建立（含断线重连）时同步一次，浏览器会自动携带 Last-Event-ID 补发期间的事件
+    source.addEventListener('open', () => {
+        loadMessages();
+        loadStats();
+    });
+
+    source.addEventListener('chat', (e) => {
+        const message = JSON.parse(e.data);
+        if (!messagesReady) {
+            pendingMessages.push(message);
+            return;
+        }
+        renderMessagesDiff([message]);
+    });
+
+    source.addEventListener('stats', (e) => {
+        renderStats(JSON.parse(e.data));
+    });
+
+    source.addEventListener('file', (e) => {
+        const data = JSON.parse(e.data);
+        const category = data.file ? data.file.category : data.category;
+        if (currentCategory === 'all' || currentCategory === category) {
+            applyFileEvent(data);
+        }
+    });
+
+    // 断线期间的事件已无法补发，全量刷新
+    source.addEventListener('reset', () => {
+        lastMessageId = 0;
+        messagesReady = false;
+        loadMessages();
+        loadStats();
+        loadFiles();
+    });
+}
+
+function scheduleFilesRefresh() {
+    // 批量上传时会连续收到多个事件，合并为一次刷新
+    if (fileRefreshTimer) return;
+    fileRefreshTimer = setTimeout(() => {
+        fileRefreshTimer = null;
+        refreshLoadedFiles();
+    }, FILE_REFRESH_DELAY);
 }
 
 // 工具函数
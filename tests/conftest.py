@@ -0,0 +1,178 @@
+# 同一组接口测试分别运行在 Flask 测试客户端、线程池后端与 asyncio 后端上
+import os
+import sys
+import json
+import uuid
+import shutil
+import asyncio
+import tempfile
+import threading
+import http.client
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 追加到末尾：仓库中的 cmd 包不能遮蔽标准库的 cmd 模块
+sys.path.append(ROOT_DIR)
+
+BACKENDS = ('flask', 'threaded', 'asyncio')
+# 工作线程较少，便于测试长连接不会占满线程池
+TEST_WORKERS = 4
+TIMEOUT = 10
+
+
+class Reply:
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = {name.lower(): value for name, value in headers}
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class FlaskClient:
+    backend = 'flask'
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None, headers=None):
+        response = self.client.open(path, method=method, data=body, headers=headers or {})
+        try:
+            return Reply(response.status_code, response.headers.items(), response.get_data())
+        finally:
+            response.close()
+
+    def stream(self, path, headers=None):
+        response = self.client.get(path, headers=headers or {}, buffered=False)
+        return Stream(iter(response.response), response.close)
+
+
+class HTTPClient:
+    def __init__(self, backend, port):
+        self.backend = backend
+        self.port = port
+
+    def connect(self):
+        return http.client.HTTPConnection('127.0.0.1', self.port, timeout=TIMEOUT)
+
+    def request(self, method, path, body=None, headers=None, conn=None):
+        own = conn is None
+        conn = conn or self.connect()
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            response = conn.getresponse()
+            return Reply(response.status, response.getheaders(), response.read())
+        finally:
+            if own:
+                conn.close()
+
+    def stream(self, path, headers=None):
+        conn = self.connect()
+        conn.request('GET', path, headers=headers or {})
+        response = conn.getresponse()
+
+        def chunks():
+            while True:
+                data = response.read1(65536)
+                if not data:
+                    return
+                yield data
+        return Stream(chunks(), conn.close)
+
+
+class Stream:
+    """逐块读取流式响应，read_until 读到包含指定内容为止"""
+
+    def __init__(self, chunks, close):
+        self.chunks = chunks
+        self.close = close
+        self.buffer = b''
+
+    def read_until(self, marker):
+        while marker not in self.buffer:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                raise AssertionError('stream ended before {!r}'.format(marker))
+            self.buffer += chunk
+        return self.buffer
+
+
+@pytest.fixture(scope='session')
+def server_app():
+    import app as server_app
+
+    tmp_dir = tempfile.mkdtemp(prefix='lan_transfer_tests_')
+    server_app.init_storage(tmp_dir)
+    server_app.storage.configure(min_free=0)
+    server_app.get_storage()
+    yield server_app
+    server_app.events.close()
+    server_app.catalog.stop()
+    server_app.storage.stop()
+    server_app.messages.close()
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def start_threaded(server_app):
+    from server.production import PooledWSGIServer
+
+    server = PooledWSGIServer('127.0.0.1', 0, server_app.app, workers=TEST_WORKERS)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    def stop():
+        server.shutdown()
+        server.server_close()
+    return server.server_port, stop
+
+
+def start_asyncio(server_app):
+    from server.aio import AsyncWSGIServer
+
+    loop = asyncio.new_event_loop()
+    server = AsyncWSGIServer(server_app.app, '127.0.0.1', 0, workers=TEST_WORKERS,
+                             max_body=server_app.app.config.get('MAX_CONTENT_LENGTH'),
+                             message_store=server_app.messages, max_message_wait=server_app.MAX_MESSAGE_WAIT,
+                             shaper=server_app.shaper, metrics=server_app.metrics)
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(server.start(), loop).result(TIMEOUT)
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(server.shutdown(1), loop).result(TIMEOUT)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(TIMEOUT)
+    return server.port, stop
+
+
+@pytest.fixture(scope='session', params=BACKENDS)
+def client(request, server_app):
+    if request.param == 'flask':
+        yield FlaskClient(server_app.app)
+        return
+    start = start_threaded if request.param == 'threaded' else start_asyncio
+    port, stop = start(server_app)
+    yield HTTPClient(request.param, port)
+    stop()
+
+
+@pytest.fixture
+def unique():
+    """每个测试使用不同的文件名前缀，各后端共用同一个上传目录"""
+    return uuid.uuid4().hex[:8]
+
+
+def multipart(filename, content, boundary='testboundary'):
+    body = ('--{}\r\nContent-Disposition: form-data; name="file"; filename="{}"\r\n'
+            'Content-Type: application/octet-stream\r\n\r\n').format(boundary, filename).encode() + content + \
+           '\r\n--{}--\r\n'.format(boundary).encode()
+    return body, {'Content-Type': 'multipart/form-data; boundary=' + boundary}
+
+
+def upload(client, filename, content):
+    body, headers = multipart(filename, content)
+    reply = client.request('POST', '/api/upload', body, headers)
+    assert reply.status == 200, reply.body
+    return reply.json()['file']
@@ -0,0 +1,392 @@
+import os
+import json
+import io
+import base64
+import hashlib
+import zipfile
+import time
+import threading
+
+import pytest
+
+from conftest import TEST_WORKERS, multipart, upload
+
+
+def test_upload_and_download(client, unique):
+    content = os.urandom(100 * 1024)
+    info = upload(client, unique + '.zip', content)
+    assert info['name'] == unique + '.zip'
+    assert info['category'] == 'archives'
+
+    reply = client.request('GET', '/api/download/archives/' + unique + '.zip')
+    assert reply.status == 200
+    assert reply.body == content
+    assert reply.headers['accept-ranges'] == 'bytes'
+
+
+def test_upload_rejects_disallowed_extension(client, unique):
+    reply = client.request('POST', '/api/upload', *multipart(unique + '.exe', b'x'))
+    assert reply.status == 400
+
+
+def test_listing_cursor_pagination(client, unique):
+    for i in range(7):
+        upload(client, '{}_{}.csv'.format(unique, i), b'row %d\n' % i)
+
+    for sort, order in (('name', 'asc'), ('mtime', 'desc'), ('size', 'desc')):
+        full = client.request('GET', '/api/files/documents?sort={}&order={}&limit=500'.format(sort, order)).json()
+        names, cursor = [], None
+        while True:
+            path = '/api/files/documents?sort={}&order={}&limit=3'.format(sort, order)
+            reply = client.request('GET', path + ('&cursor=' + cursor if cursor else ''))
+            assert reply.status == 200
+            page = reply.json()
+            names.extend(f['name'] for f in page['files'])
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        assert names == [f['name'] for f in full['files']]
+        assert len(names) == full['total']
+
+
+def test_listing_all_merges_categories(client, unique):
+    upload(client, unique + '_a.md', b'a')
+    upload(client, unique + '_b.zip', b'b')
+    full = client.request('GET', '/api/files/all?sort=name&order=asc&limit=500').json()
+    names, cursor = [], None
+    while True:
+        page = client.request('GET', '/api/files/all?sort=name&order=asc&limit=2'
+                              + ('&cursor=' + cursor if cursor else '')).json()
+        names.extend((f['category'], f['name']) for f in page['files'])
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+    assert names == [(f['category'], f['name']) for f in full['files']]
+    assert ('documents', unique + '_a.md') in names and ('archives', unique + '_b.zip') in names
+
+
+def test_listing_rejects_mismatched_cursor(client):
+    page = client.request('GET', '/api/files/all?sort=name&order=asc&limit=1').json()
+    if page['next_cursor']:
+        reply = client.request('GET', '/api/files/all?sort=size&order=asc&cursor=' + page['next_cursor'])
+        assert reply.status == 400
+
+
+def crafted_cursor(*payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+@pytest.mark.parametrize('category, payload', [
+    ('documents', ['mtime', 'desc', ['a']]),
+    ('documents', ['mtime', 'desc', ['a', 'b']]),
+    ('documents', ['mtime', 'desc', [1.5, 'x', 'extra']]),
+    ('documents', ['size', 'desc', [True, 'x']]),
+    ('documents', ['name', 'asc', [1, 2]]),
+    ('all', ['mtime', 'desc', [1.5, 'x']]),
+    ('all', ['name', 'asc', ['x', 'x', 3]]),
+])
+def test_listing_rejects_malformed_cursor(client, category, payload):
+    path = '/api/files/{}?sort={}&order={}&cursor={}'.format(category, payload[0], payload[1], crafted_cursor(*payload))
+    reply = client.request('GET', path)
+    assert reply.status == 400
+    assert reply.json()['error'] == 'Invalid cursor'
+
+
+def test_range_requests(client, unique):
+    content = os.urandom(64 * 1024)
+    upload(client, unique + '.zip', content)
+    path = '/api/download/archives/' + unique + '.zip'
+
+    reply = client.request('GET', path, headers={'Range': 'bytes=100-199'})
+    assert reply.status == 206
+    assert reply.body == content[100:200]
+    assert reply.headers['content-range'] == 'bytes 100-199/{}'.format(len(content))
+    etag = reply.headers['etag']
+
+    reply = client.request('GET', path, headers={'Range': 'bytes=-10'})
+    assert reply.status == 206 and reply.body == content[-10:]
+
+    # If-Range 与当前 ETag 一致时返回区间，否则返回完整文件
+    reply = client.request('GET', path, headers={'Range': 'bytes=0-9', 'If-Range': etag})
+    assert reply.status == 206 and reply.body == content[:10]
+    reply = client.request('GET', path, headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+    assert reply.status == 200 and reply.body == content
+    # Last-Modified 只精确到秒，不能作为强校验，日期形式的 If-Range 返回完整文件
+    reply = client.request('GET', path, headers={'Range': 'bytes=0-9', 'If-Range': reply.headers['last-modified']})
+    assert reply.status == 200 and reply.body == content
+
+    reply = client.request('GET', path, headers={'Range': 'bytes={}-'.format(len(content))})
+    assert reply.status == 416
+    assert reply.headers['content-range'] == 'bytes */{}'.format(len(content))
+
+
+def test_archive_ranges_resume_from_checkpoints(client, unique, monkeypatch):
+    from server import archive
+
+    monkeypatch.setattr(archive, 'DEFLATE_CHECKPOINT', 64 * 1024)
+    offsets = []
+    read_entry = archive.ZipArchive._read_entry
+
+    def spy(self, entry, offset=0, produced=0):
+        offsets.append(offset)
+        return read_entry(self, entry, offset, produced)
+    monkeypatch.setattr(archive.ZipArchive, '_read_entry', spy)
+
+    content = os.urandom(200 * 1024).hex().encode()
+    upload(client, unique + '.txt', content)
+    path = '/api/archive?file=documents/{}.txt'.format(unique)
+    full = client.request('GET', path).body
+    assert zipfile.ZipFile(io.BytesIO(full)).read(unique + '.txt') == content
+
+    # 分段下载拼接后与完整下载一致，后面的分段从同步点开始压缩而不是从头开始
+    del offsets[:]
+    parts, segment = [], 40000
+    for start in range(0, len(full), segment):
+        end = min(start + segment, len(full)) - 1
+        reply = client.request('GET', path, headers={'Range': 'bytes={}-{}'.format(start, end)})
+        assert reply.status == 206
+        assert reply.headers['content-range'] == 'bytes {}-{}/{}'.format(start, end, len(full))
+        parts.append(reply.body)
+    assert b''.join(parts) == full
+    assert max(offsets) > 0
+
+
+def test_multipart_byteranges(client, unique):
+    content = os.urandom(8 * 1024)
+    upload(client, unique + '.zip', content)
+    reply = client.request('GET', '/api/download/archives/' + unique + '.zip',
+                           headers={'Range': 'bytes=0-9,1000-1019'})
+    assert reply.status == 206
+    content_type = reply.headers['content-type']
+    assert content_type.startswith('multipart/byteranges; boundary=')
+    boundary = content_type.split('boundary=', 1)[1].encode()
+    parts = [p for p in reply.body.split(b'--' + boundary) if p.strip() and p.strip() != b'--']
+    assert len(parts) == 2
+    bodies = [p.split(b'\r\n\r\n', 1)[1][:-2] for p in parts]
+    assert bodies == [content[0:10], content[1000:1020]]
+    assert b'Content-Range: bytes 1000-1019/8192' in parts[1]
+    assert int(reply.headers['content-length']) == len(reply.body)
+
+
+def test_chunked_session_resume_and_commit(client, unique):
+    chunk_size = 64 * 1024
+    content = os.urandom(chunk_size * 2 + 1000)
+    filename = unique + '.pdf'
+    request = json.dumps({'filename': filename, 'size': len(content), 'chunk_size': chunk_size,
+                          'fingerprint': unique}).encode()
+    headers = {'Content-Type': 'application/json'}
+
+    session = client.request('POST', '/api/uploads', request, headers).json()['session']
+    assert session['total_chunks'] == 3
+    session_id = session['session_id']
+
+    def put(index):
+        data = content[index * chunk_size:(index + 1) * chunk_size]
+        reply = client.request('PUT', '/api/uploads/{}/chunks/{}'.format(session_id, index), data,
+                               {'Content-Type': 'application/octet-stream'})
+        assert reply.status == 200, reply.body
+
+    put(0)
+    put(2)
+    reply = client.request('POST', '/api/uploads/{}/commit'.format(session_id))
+    assert reply.status == 409
+
+    # 相同指纹再次创建会话时继续之前的会话，只需补传缺失的分块
+    resumed = client.request('POST', '/api/uploads', request, headers).json()['session']
+    assert resumed['session_id'] == session_id
+    assert resumed['received'] == [0, 2]
+    put(1)
+
+    reply = client.request('POST', '/api/uploads/{}/commit'.format(session_id))
+    assert reply.status == 200, reply.body
+    assert reply.json()['file']['name'] == filename
+    assert client.request('GET', '/api/download/documents/' + filename,
+                          headers={'Accept-Encoding': 'identity'}).body == content
+    assert client.request('GET', '/api/uploads/' + session_id).status == 404
+
+
+@pytest.mark.parametrize('body', [b'[1, 2]', b'"name.pdf"', b'3'])
+def test_create_session_rejects_non_object(client, body):
+    reply = client.request('POST', '/api/uploads', body, {'Content-Type': 'application/json'})
+    assert reply.status == 400
+
+
+def test_concurrent_commit(client, unique):
+    content = b'c' * 1000
+    request = json.dumps({'filename': unique + '.pdf', 'size': len(content), 'chunk_size': 65536}).encode()
+    session = client.request('POST', '/api/uploads', request, {'Content-Type': 'application/json'}).json()['session']
+    session_id = session['session_id']
+    reply = client.request('PUT', '/api/uploads/{}/chunks/0'.format(session_id), content,
+                           {'Content-Type': 'application/octet-stream'})
+    assert reply.status == 200
+
+    statuses = []
+    barrier = threading.Barrier(4)
+
+    def commit():
+        barrier.wait()
+        statuses.append(client.request('POST', '/api/uploads/{}/commit'.format(session_id)).status)
+
+    threads = [threading.Thread(target=commit) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    # 只有一个提交成功，其余返回 409（会话已移除后到达的返回 404），不会出现 500
+    assert statuses.count(200) == 1
+    assert set(statuses) <= {200, 404, 409}
+    files = client.request('GET', '/api/files/documents?sort=name&order=asc&limit=500').json()['files']
+    assert [f['name'] for f in files if f['name'].startswith(unique)] == [unique + '.pdf']
+
+
+def wait_for_blob(client, digest):
+    # 上传完成后哈希在后台计算
+    deadline = time.monotonic() + 5
+    while client.request('GET', '/api/blobs/' + digest).status != 200:
+        assert time.monotonic() < deadline, 'blob was not adopted'
+        time.sleep(0.05)
+
+
+def test_deduplicated_upload_keeps_original_mtime(client, unique):
+    content = os.urandom(4096)
+    digest = hashlib.sha256(content).hexdigest()
+    original = upload(client, unique + '_a.zip', content)
+    wait_for_blob(client, digest)
+    path = '/api/download/archives/' + unique + '_a.zip'
+    before = client.request('GET', path).headers['last-modified']
+
+    time.sleep(1.1)
+    request = json.dumps({'filename': unique + '_b.zip', 'size': len(content), 'sha256': digest}).encode()
+    reply = client.request('POST', '/api/uploads', request, {'Content-Type': 'application/json'}).json()
+    assert reply['deduplicated']
+    assert reply['file']['timestamp'] > original['timestamp']
+
+    # 已有文件的 mtime 不变，新文件按去重时间排在前面
+    assert client.request('GET', path).headers['last-modified'] == before
+    files = client.request('GET', '/api/files/archives?sort=mtime&order=desc&limit=500').json()['files']
+    names = [f['name'] for f in files if f['name'].startswith(unique)]
+    assert names == [unique + '_b.zip', unique + '_a.zip']
+    assert client.request('GET', '/api/download/archives/' + unique + '_b.zip').body == content
+
+
+def test_chunk_length_mismatch(client, unique):
+    request = json.dumps({'filename': unique + '.pdf', 'size': 70000, 'chunk_size': 65536}).encode()
+    session = client.request('POST', '/api/uploads', request, {'Content-Type': 'application/json'}).json()['session']
+    reply = client.request('PUT', '/api/uploads/{}/chunks/0'.format(session['session_id']), b'short',
+                           {'Content-Type': 'application/octet-stream'})
+    assert reply.status == 400
+
+
+def test_etag_not_modified(client, unique):
+    reply = client.request('GET', '/api/stats')
+    assert reply.status == 200
+    reply = client.request('GET', '/api/stats', headers={'If-None-Match': reply.headers['etag']})
+    assert reply.status == 304
+    assert reply.body == b''
+
+    upload(client, unique + '.zip', b'etag')
+    path = '/api/download/archives/' + unique + '.zip'
+    etag = client.request('GET', path).headers['etag']
+    reply = client.request('GET', path, headers={'If-None-Match': etag})
+    assert reply.status == 304
+
+    # 文件变化后列表的 ETag 随之变化
+    listing = client.request('GET', '/api/files/archives')
+    upload(client, unique + '_2.zip', b'etag 2')
+    reply = client.request('GET', '/api/files/archives', headers={'If-None-Match': listing.headers['etag']})
+    assert reply.status == 200
+
+
+def send_message(client, content):
+    reply = client.request('POST', '/api/messages', json.dumps({'content': content, 'sender': 'test'}).encode(),
+                           {'Content-Type': 'application/json'})
+    assert reply.status == 200
+    return reply.json()['message']
+
+
+def test_long_poll_wakes_on_message(client, unique):
+    last_id = client.request('GET', '/api/messages').json()['last_id']
+    result = {}
+
+    def poll():
+        start = time.monotonic()
+        result['reply'] = client.request('GET', '/api/messages?since={}&wait=20'.format(last_id))
+        result['elapsed'] = time.monotonic() - start
+
+    thread = threading.Thread(target=poll)
+    thread.start()
+    time.sleep(0.5)
+    send_message(client, 'wake ' + unique)
+    thread.join(10)
+    assert not thread.is_alive()
+    assert result['elapsed'] < 5
+    data = result['reply'].json()
+    assert [m['content'] for m in data['messages']] == ['wake ' + unique]
+
+
+def test_long_poll_times_out_with_not_modified(client):
+    first = client.request('GET', '/api/messages?since=0&wait=0')
+    last_id = first.json()['last_id']
+    reply = client.request('GET', '/api/messages?since={}&wait=0.5'.format(last_id))
+    etag = reply.headers['etag']
+    reply = client.request('GET', '/api/messages?since={}&wait=0.5'.format(last_id), headers={'If-None-Match': etag})
+    assert reply.status == 304
+
+
+def test_event_stream_delivers_chat(client, unique):
+    stream = client.stream('/api/events')
+    try:
+        stream.read_until(b'retry:')
+        send_message(client, 'event ' + unique)
+        data = stream.read_until(('event ' + unique).encode())
+        assert b'event: chat' in data
+    finally:
+        stream.close()
+
+
+def test_long_lived_requests_do_not_exhaust_workers(client, unique):
+    # SSE 与长轮询连接数超过工作线程数时，普通请求仍能得到响应
+    last_id = client.request('GET', '/api/messages').json()['last_id']
+    streams = [client.stream('/api/events') for _ in range(TEST_WORKERS + 2)]
+    replies = []
+    polls = [threading.Thread(target=lambda: replies.append(
+        client.request('GET', '/api/messages?since={}&wait=20'.format(last_id)))) for _ in range(TEST_WORKERS + 2)]
+    try:
+        for stream in streams:
+            stream.read_until(b'retry:')
+        for thread in polls:
+            thread.start()
+        time.sleep(0.5)
+        start = time.monotonic()
+        reply = client.request('GET', '/api/stats')
+        assert reply.status == 200
+        assert time.monotonic() - start < 5
+    finally:
+        for stream in streams:
+            stream.close()
+        send_message(client, 'release ' + unique)
+        for thread in polls:
+            thread.join(10)
+    assert [r.status for r in replies] == [200] * len(polls)
+
+
+def test_keep_alive_reuses_connection(client, unique):
+    if client.backend == 'flask':
+        pytest.skip('keep-alive is handled by the HTTP servers')
+    upload(client, unique + '.zip', b'keep alive')
+    conn = client.connect()
+    try:
+        conn.request('GET', '/api/stats')
+        first = conn.getresponse()
+        first.read()
+        sock = conn.sock
+        assert not first.will_close
+        # 应用没有读取的小请求体被丢弃，不影响同一连接上的下一个请求
+        conn.request('POST', '/api/messages', body=b'not json', headers={'Content-Type': 'text/plain'})
+        conn.getresponse().read()
+        conn.request('GET', '/api/download/archives/' + unique + '.zip')
+        reply = conn.getresponse()
+        assert reply.read() == b'keep alive'
+        assert conn.sock is sock
+    finally:
+        conn.close()
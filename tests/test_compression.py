@@ -0,0 +1,14 @@
+from server.compression import StreamCompressor
+from server.ranges import FileRangeStream
+
+
+def test_wrap_closes_source(tmp_path):
+    path = tmp_path / 'a.txt'
+    path.write_bytes(b'hello ' * 100000)
+    stream = FileRangeStream(str(path), [(0, 600000)], block_size=1024)
+    body = StreamCompressor('gzip').wrap(stream)
+    next(body)
+    assert stream._file is not None
+    # 客户端中途断开时服务器关闭响应体，文件应随之关闭
+    body.close()
+    assert stream._file is None
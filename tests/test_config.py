@@ -0,0 +1,24 @@
+import os
+import re
+
+from server.production import load_config
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def readme_config():
+    with open(os.path.join(ROOT_DIR, 'README.md'), encoding='utf-8') as f:
+        return re.search(r'```ini\n(.*?)```', f.read(), re.S).group(1)
+
+
+def test_readme_sample_config(tmp_path):
+    path = tmp_path / 'lan_transfer.ini'
+    path.write_text(readme_config(), encoding='utf-8')
+    config = load_config(['--config', str(path)], environ={})
+    assert config['workers'] == 64
+    assert config['backend'] == 'threaded'
+    assert config['keepalive'] == 5
+    assert config['timeout'] == 60
+    assert config['category_quotas'] == 'videos=4096,images=1024'
+    # 行尾注释不能被当作配置值
+    assert not config['admin_token']
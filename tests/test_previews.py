@@ -0,0 +1,36 @@
+import pytest
+
+from server.previews import PreviewCache, PreviewUnavailable
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = PreviewCache(failed_capacity=2)
+    cache.ensure_started(str(tmp_path / '.previews'))
+    return cache
+
+
+def broken_image(tmp_path, name):
+    path = tmp_path / name
+    path.write_bytes(b'not an image')
+    return str(path)
+
+
+def test_failed_previews_are_bounded(cache, tmp_path):
+    sources = [broken_image(tmp_path, '{}.jpg'.format(i)) for i in range(4)]
+    for i, source in enumerate(sources):
+        with pytest.raises(PreviewUnavailable):
+            cache.get('k{}'.format(i), 128, source, 'images')
+    # 只保留最近的两条失败记录
+    assert list(cache._failed.values()) == sources[2:]
+    assert sorted(cache._failed_sources) == sorted(sources[2:])
+
+
+def test_forget_clears_failed_preview(cache, tmp_path):
+    source = broken_image(tmp_path, 'a.jpg')
+    for width in (64, 128):
+        with pytest.raises(PreviewUnavailable):
+            cache.get('k', width, source, 'images')
+    assert len(cache._failed) == 2
+    cache.forget(source)
+    assert not cache._failed and not cache._failed_sources
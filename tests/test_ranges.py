@@ -0,0 +1,22 @@
+import socket
+
+import pytest
+
+from server.ranges import FileRangeStream
+
+
+def test_sendfile_times_out_when_client_stops_reading(tmp_path):
+    path = tmp_path / 'big.bin'
+    path.write_bytes(b'x' * (8 * 1024 * 1024))
+    server, client = socket.socketpair()
+    server.settimeout(0.2)
+    stream = FileRangeStream(str(path), [(0, 8 * 1024 * 1024)], server)
+    try:
+        # 对端不读取，发送缓冲区写满后应在超时后中止而不是一直等待
+        with pytest.raises(socket.timeout):
+            for _ in stream:
+                pass
+    finally:
+        stream.close()
+        server.close()
+        client.close()
@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+from server.catalog import FileCatalog
+from server.storage import StorageManager
+
+
+@pytest.fixture
+def linked_tree(tmp_path):
+    """documents/a.txt、documents/b.txt 与 archives/c.zip 是同一文件的硬链接，documents/d.txt 独立"""
+    catalog = FileCatalog(['documents', 'archives'])
+    catalog.ensure_started(str(tmp_path))
+    (tmp_path / 'documents' / 'a.txt').write_bytes(b'a' * 1000)
+    os.link(tmp_path / 'documents' / 'a.txt', tmp_path / 'documents' / 'b.txt')
+    os.link(tmp_path / 'documents' / 'a.txt', tmp_path / 'archives' / 'c.zip')
+    (tmp_path / 'documents' / 'd.txt').write_bytes(b'd' * 300)
+    catalog.rescan_all()
+
+    def remove_file(category, name):
+        os.remove(tmp_path / category / name)
+        catalog.remove(category, name)
+
+    storage = StorageManager(catalog, remove_file)
+    storage.configure(policy='size', min_free=0)
+    storage.ensure_started(str(tmp_path))
+    yield catalog, storage
+    storage.stop()
+    catalog.stop()
+
+
+def names(catalog, category):
+    return sorted(entry.name for entry in catalog.list(category))
+
+
+def test_usage_counts_each_inode_once(linked_tree):
+    catalog, storage = linked_tree
+    assert storage.usage() == (1300, {'documents': 1300, 'archives': 1000})
+    # 文件列表中的大小仍按文件计算
+    assert catalog.stats()[1] == {'documents': 2300, 'archives': 1000}
+
+
+def test_category_eviction_removes_whole_link_group(linked_tree):
+    catalog, storage = linked_tree
+    assert storage._evict(500, 'documents', 'quota')
+    assert names(catalog, 'documents') == ['d.txt']
+    # 其他分类中仍有链接，磁盘空间没有释放
+    assert storage.evicted_files == 2
+    assert storage.reclaimed_bytes == 0
+    assert storage.usage() == (1300, {'documents': 300, 'archives': 1000})
+
+
+def test_eviction_skips_partial_link_groups(linked_tree):
+    catalog, storage = linked_tree
+    # 只删除 a、b 或 c 中的一部分不释放空间，需要整组删除
+    assert storage._evict(1000, None, 'disk')
+    assert names(catalog, 'documents') == ['d.txt']
+    assert names(catalog, 'archives') == []
+    assert storage.reclaimed_bytes == 1000
+    assert storage.usage() == (300, {'documents': 300, 'archives': 0})
+
+    # 剩余空间不够时不删除任何文件
+    assert not storage._evict(1000, None, 'disk')
+    assert names(catalog, 'documents') == ['d.txt']